@@ -1,4 +1,8 @@
+import copy
+from typing import Iterator
+
 from agent_marketplace.schemas.agents import Context, Message
+from agent_marketplace.services.events import EventBus
 
 class AI_Agent:
     def __init__(self, name: str, owner: str, description: str, model_config: dict = {}):
@@ -8,9 +12,37 @@ class AI_Agent:
         self.model_config = model_config
         self.context = Context(history=[])
         self.task_complete = False
+        self.last_message: Message = None
+        # Where the agent reports progress (retrieval, tool calls, ...); no sinks means no rendering
+        self.events = EventBus()
+
+    def new_session(self) -> "AI_Agent":
+        """
+        Return a copy of this agent for one conversation. The copy shares the agent's definition
+        (name, config, LLM router, tools) but has its own per-conversation state, so concurrent
+        conversations don't interfere and the original is left untouched.
+        """
+        session_agent = copy.copy(self)
+        session_agent.reset_session()
+        return session_agent
+
+    def reset_session(self) -> None:
+        """Reset the per-conversation state; subclasses with their own state extend this"""
+        self.context = Context(history=[])
+        self.task_complete = False
+        self.last_message = None
 
     def init_chat(self, guest_agent: "AI_Agent" = None):
         pass
     
     def on_message(self, message: Message, sender: "AI_Agent") -> str:
         raise NotImplementedError("Subclasses must implement this method")
+
+    def stream_message(self, message: Message, sender: "AI_Agent") -> Iterator[str]:
+        """
+        Reply to a message as a stream of text deltas, e.g. for st.write_stream.
+        The complete reply is stored in self.last_message once the stream is exhausted.
+        Agents that can't stream their reply yield it in one piece.
+        """
+        self.last_message = self.on_message(message, sender)
+        yield self.last_message.content
@@ -3,10 +3,12 @@ import json
 from datetime import datetime
 
 from agent_marketplace.agents.ai_agent import AI_Agent
-from agent_marketplace.services.llm import OpenAILLMProvider
+from agent_marketplace.services.model_router import ModelRouter
+from agent_marketplace.services.chat_state import create_chat_state_classifier
 from agent_marketplace.agents.personal_ai import CHECK_CHAT_STATE_PROMPT
 from agent_marketplace.schemas.agents import Message
 from agent_marketplace.services.geocoding import get_coordinates_from_address
+from agent_marketplace.services.tracing import traced
 from agent_marketplace.config import get_settings
 
 SERVER_URL = "http://54.70.105.247:8000"
@@ -17,8 +19,14 @@ class FoodDeliveryAgent(AI_Agent):
         super().__init__(name, owner, description, model_config)
         self.chat_id = None
         self.user_intent: str = user_intent
-
-        self.user_info = {
+        self.llm = ModelRouter(model_config)
+        self.chat_state_classifier = create_chat_state_classifier(model_config)
+        self.user_info = self.new_user_info()
+
+    @staticmethod
+    def new_user_info() -> dict:
+        """User info before the user has given any; only the wallet and flow are preset."""
+        return {
             "user_address": "",
             "user_name": "",
             "user_phone_number": "",
@@ -26,6 +34,12 @@ class FoodDeliveryAgent(AI_Agent):
             "flow": "regular",
         }
 
+    def reset_session(self) -> None:
+        super().reset_session()
+        self.chat_id = None
+        # A new chat must ask for the user's details again, never reuse the last user's
+        self.user_info = self.new_user_info()
+
     def generate_chat_id(self):
         response = requests.post(
             f"{SERVER_URL}/init_chat",
@@ -47,6 +61,7 @@ class FoodDeliveryAgent(AI_Agent):
     
         self.chat_id = response.json().get("chat_id")
 
+    @traced
     def on_message(self, message: Message, sender: AI_Agent) -> Message:
         # Update context
         if message:
@@ -66,6 +81,7 @@ class FoodDeliveryAgent(AI_Agent):
 
         return return_message
     
+    @traced
     def generate_response(self, message: Message, sender: AI_Agent) -> str:
         """
         Generate response for the incoming message.
@@ -94,6 +110,7 @@ class FoodDeliveryAgent(AI_Agent):
 
         return bot_reply
 
+    @traced
     def request_user_info(self, message: Message) -> dict:
         if not all([
             self.user_info["user_address"],
@@ -124,23 +141,24 @@ class FoodDeliveryAgent(AI_Agent):
                 }
         return {}
             
+    @traced
     def llm_call_to_check_chat_state(self) -> dict:
         """
         Check if the agent should complete the chat at this turn. If to complete chat, return "[CONVERSATION_ENDS]", otherwise return "[CONTINUE]".
         """
         conversation_history = "\n".join([f"{msg.sender}: {msg.content}" for msg in self.context.history][-10:])
 
-        if "[PAYMENT_SUCCEEDED]" in conversation_history or "[CONVERSATION_ENDS]" in conversation_history:
-            return {"content": "[CONVERSATION_ENDS]"}
+        def llm_call_to_classify() -> dict:
+            prompt = CHECK_CHAT_STATE_PROMPT.format(
+                agent_name=self.name,
+                owner=self.owner,
+                user_intent=self.user_intent,
+                service_agent_description=self.description,
+                conversation_history=conversation_history,
+            )
 
-        prompt = CHECK_CHAT_STATE_PROMPT.format(
-            agent_name=self.name,
-            owner=self.owner,
-            user_intent=self.user_intent,
-            service_agent_description=self.description,
-            conversation_history=conversation_history,
-        )
+            return self.llm.generate(prompt=prompt, route="state_check")
 
-        llm_call = OpenAILLMProvider()
-        response = llm_call.generate(prompt=prompt)
-        return response
+        # Only call the LLM if the rules can't tell
+        chat_state = self.chat_state_classifier.classify(self.context.history, llm_call_to_classify)
+        return {"content": chat_state}
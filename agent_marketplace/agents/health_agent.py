@@ -1,9 +1,14 @@
 import json
 from datetime import datetime
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterator, List, Optional
 
 from agent_marketplace.agents.ai_agent import AI_Agent
-from agent_marketplace.services.llm import OpenAILLMProvider
+from agent_marketplace.services.model_router import ModelRouter
+from agent_marketplace.services.chat_state import CONVERSATION_ENDS, create_chat_state_classifier
+from agent_marketplace.services.health_analytics import format_findings_table
+from agent_marketplace.services.personal_data import HEALTH_DATA_FILE, PURCHASE_HISTORY_FILE, get_personal_data_store
+from agent_marketplace.services.vector_index import format_personal_context, get_personal_index
+from agent_marketplace.services.tracing import traced
 from agent_marketplace.agents.personal_ai import CHECK_CHAT_STATE_PROMPT
 from agent_marketplace.schemas.agents import Message
 from agent_marketplace.config import get_settings
@@ -12,8 +17,18 @@ class HealthAgent(AI_Agent):
     def __init__(self, name: str, owner: str, description: str, user_intent: str, model_config: dict = {}):
         super().__init__(name, owner, description, model_config)
         self.user_intent: str = user_intent
-        self.llm = OpenAILLMProvider()
-        self.health_profile = {
+        self.llm = ModelRouter(model_config)
+        self.chat_state_classifier = create_chat_state_classifier(model_config)
+        settings = get_settings()
+        # Look up the records of the user relevant to each message in the local vector index
+        self.personal_context: bool = model_config.get("personal_context", settings.personal_context) == "index"
+        # Give the LLM precomputed findings from the user's health data rather than the raw numbers
+        self.health_findings: bool = model_config.get("health_findings", settings.health_findings)
+        self.health_profile = self.new_health_profile()
+
+    @staticmethod
+    def new_health_profile() -> dict:
+        return {
             "goals": [],
             "dietary_restrictions": [],
             "current_metrics": {},
@@ -21,6 +36,11 @@ class HealthAgent(AI_Agent):
             "meal_plan": {}
         }
 
+    def reset_session(self) -> None:
+        super().reset_session()
+        self.health_profile = self.new_health_profile()
+
+    @traced
     def on_message(self, message: Message, sender: AI_Agent) -> Message:
         # Update context
         if message:
@@ -28,11 +48,31 @@ class HealthAgent(AI_Agent):
 
         # Generate response
         response = self.generate_response(message, sender)
+        return self.reply(response["content"], sender)
+
+    def stream_message(self, message: Message, sender: AI_Agent) -> Iterator[str]:
+        # Update context
+        if message:
+            self.context.history.append(message)
 
+        if self.check_turn(message):
+            content = "[CONVERSATION_ENDS]"
+            yield content
+        else:
+            # Stream the health-focused response as it is generated
+            content = ""
+            for delta in self.llm.stream_text(prompt=self.health_response_prompt(message, sender)):
+                content += delta
+                yield delta
+
+        self.last_message = self.reply(content, sender)
+
+    def reply(self, content: str, sender: AI_Agent) -> Message:
+        """Record a reply in the conversation and return it as a message."""
         # Create return message
         return_message = Message(
             role="assistant", 
-            content=response["content"], 
+            content=content, 
             sender=self.name, 
             receiver=sender.name, 
             timestamp=datetime.now(),
@@ -43,81 +83,120 @@ class HealthAgent(AI_Agent):
         self.context.history.append(return_message)
 
         # Check if the task is complete
-        if response["content"] == "[CONVERSATION_ENDS]":
+        if content == "[CONVERSATION_ENDS]":
             self.task_complete = True
 
         return return_message
     
     def generate_response(self, message: Message, sender: AI_Agent) -> Dict[str, Any]:
         """Generate response for the incoming message."""
-        # Check if we should update health profile
-        self.update_health_profile(message.content)
-        
-        # Check if the chat should end at this turn
-        chat_state = self.llm_call_to_check_chat_state()
-        if chat_state["content"] == "[CONVERSATION_ENDS]":
-            self.task_complete = True
+        if self.check_turn(message):
             return {"content": "[CONVERSATION_ENDS]"}
 
         # Generate a health-focused response
         response = self.llm_call_to_generate_health_response(message, sender)
         return response
 
+    @traced
+    def check_turn(self, message: Message) -> bool:
+        """Update the health profile from the message and check whether the chat ends at this turn."""
+        # Check if the chat should end at this turn, without an LLM call when the rules can tell
+        chat_state = self.chat_state_classifier.classify_without_llm(self.context.history)
+        if chat_state == CONVERSATION_ENDS:
+            self.task_complete = True
+            return True
+
+        requests = [self.health_profile_request(message.content)]
+        if chat_state is None:
+            # Update the health profile and check the chat state with the LLM concurrently
+            requests.append({"prompt": self.check_chat_state_prompt(), "route": "state_check"})
+        responses = self.llm.generate_batch(requests, return_exceptions=True)
+        self.apply_health_profile_response(responses[0])
+        if chat_state is None:
+            if isinstance(responses[1], Exception):
+                raise responses[1]
+            self.chat_state_classifier.record_llm_decision()
+            chat_state = responses[1]["content"]
+        if chat_state == CONVERSATION_ENDS:
+            self.task_complete = True
+            return True
+        return False
+
+    @traced
     def update_health_profile(self, message_content: str) -> None:
         """Update health profile based on user message content."""
-        # Extract health goals
-        goals_prompt = f"""
-        Based on the user's message below, extract any health or fitness goals they mention.
-        If no goals are mentioned, return an empty list.
-        
-        User message: {message_content}
-        
-        Return ONLY a valid JSON array of strings, each representing a goal. Example: ["lose weight", "build muscle"]
-        """
-        
         try:
-            goals_response = self.llm.generate(prompt=goals_prompt)
-            if goals_response["content"]:
-                # Try to parse the response as JSON
-                try:
-                    extracted_goals = json.loads(goals_response["content"])
-                    if isinstance(extracted_goals, list) and extracted_goals:
-                        for goal in extracted_goals:
-                            if goal not in self.health_profile["goals"]:
-                                self.health_profile["goals"].append(goal)
-                except:
-                    pass  # Ignore parsing errors
-        except:
-            pass  # Ignore any errors in LLM call
-        
-        # Extract dietary restrictions
-        dietary_prompt = f"""
-        Based on the user's message below, extract any dietary restrictions or preferences they mention.
-        If none are mentioned, return an empty list.
+            response = self.llm.generate(**self.health_profile_request(message_content))
+        except ValueError as e:
+            response = e
+        self.apply_health_profile_response(response)
+
+    def health_profile_request(self, message_content: str) -> Dict[str, Any]:
+        """Build one structured-output LLM request that extracts every health profile field from a message."""
+        prompt = f"""
+        Based on the user's message below, extract any health or fitness goals, dietary restrictions or
+        preferences, and workouts they mention. Use an empty list for anything that is not mentioned.
         
         User message: {message_content}
         
-        Return ONLY a valid JSON array of strings. Example: ["vegetarian", "no nuts", "low carb"]
+        Example: {{"goals": ["lose weight", "build muscle"], "dietary_restrictions": ["vegetarian", "no nuts"], "workout_history": ["30 minute run"]}}
         """
-        
+        return {"prompt": prompt, "response_format": HEALTH_PROFILE_RESPONSE_FORMAT, "route": "extraction"}
+
+    def apply_health_profile_response(self, response: Any) -> None:
+        """Merge extracted profile fields into the health profile."""
+        # A failed extraction only means the profile isn't updated at this turn
+        if isinstance(response, Exception):
+            print(f"Error extracting health profile: {response}")
+            return
+        if not response["content"]:
+            return
         try:
-            dietary_response = self.llm.generate(prompt=dietary_prompt)
-            if dietary_response["content"]:
-                try:
-                    extracted_restrictions = json.loads(dietary_response["content"])
-                    if isinstance(extracted_restrictions, list) and extracted_restrictions:
-                        for restriction in extracted_restrictions:
-                            if restriction not in self.health_profile["dietary_restrictions"]:
-                                self.health_profile["dietary_restrictions"].append(restriction)
-                except:
-                    pass
-        except:
-            pass
+            extracted = json.loads(response["content"])
+        except json.JSONDecodeError as e:
+            print(f"Error parsing health profile: {e}")
+            return
 
-    def llm_call_to_generate_health_response(self, message: Message, sender: AI_Agent) -> Dict[str, str]:
-        """Generate a health-focused response based on the user's message."""
-        # Format health profile as string
-        health_profile_str = json.dumps(self.health_profile, indent=2)
+        for key in HEALTH_PROFILE_LIST_FIELDS:
+            values = extracted.get(key) if isinstance(extracted, dict) else None
+            if not isinstance(values, list):
+                continue
+            for value in values:
+                if value not in self.health_profile[key]:
+                    self.health_profile[key].append(value)
+
+    def retrieve_personal_context(self, message: Message, sender: AI_Agent) -> str:
+        """Health and purchase records of the sender's owner relevant to the message, or "" if they have none."""
+        owner = getattr(sender, "owner", None)
+        if not self.personal_context or not message or owner not in get_personal_data_store().users():
+            return ""
+        settings = get_settings()
+        results = get_personal_index(owner).search(message.content, top_k=settings.personal_context_top_k,
+                                                   n_probe=settings.personal_index_n_probe,
+                                                   sources=HEALTH_CONTEXT_SOURCES)
+        return format_personal_context(results)
+
+    def retrieve_health_findings(self, sender: AI_Agent) -> str:
+        """Table of findings from the health data of the sender's owner, or "" if they have none."""
+        owner = getattr(sender, "owner", None)
+        if not self.health_findings or owner not in get_personal_data_store().users():
+            return ""
+        findings = get_personal_data_store().health_findings(owner, get_settings().health_rolling_days)
+        return format_findings_table(findings)
+
+    def health_response_prompt(self, message: Message, sender: AI_Agent) -> str:
+        """Build the prompt for a health-focused response to the user's message."""
+        health_findings = self.retrieve_health_findings(sender)
+        health_findings_str = f"""# Health Findings
+        Computed from the health data of {sender.owner}; flagged findings come first. Rely on these
+        numbers rather than recalculating them.
+        {health_findings}""" if health_findings else ""
+        # Format health profile as string; the findings already hold the current metrics
+        health_profile = {key: value for key, value in self.health_profile.items()
+                          if value and not (health_findings and key == "current_metrics")}
+        health_profile_str = json.dumps(health_profile, ensure_ascii=False, separators=(",", ":"))
+        personal_context = self.retrieve_personal_context(message, sender)
+        personal_context_str = f"# Relevant Records of {sender.owner}\n{personal_context}" if personal_context else ""
         
         # Create the prompt for health response
         prompt = f"""
@@ -130,6 +209,10 @@ class HealthAgent(AI_Agent):
         # Health Profile
         {health_profile_str}
 
+        {health_findings_str}
+
+        {personal_context_str}
+
         # Conversation History
         {self.format_conversation_history()}
 
@@ -145,8 +228,12 @@ class HealthAgent(AI_Agent):
         If the user is asking for a workout plan, meal plan, or tracking feature, you can offer 
         to create one based on their goals and preferences.
         """
+        return prompt
 
-        response = self.llm.generate(prompt=prompt)
+    @traced
+    def llm_call_to_generate_health_response(self, message: Message, sender: AI_Agent) -> Dict[str, str]:
+        """Generate a health-focused response based on the user's message."""
+        response = self.llm.generate(prompt=self.health_response_prompt(message, sender))
         return response
 
     def format_conversation_history(self) -> str:
@@ -155,20 +242,45 @@ class HealthAgent(AI_Agent):
         recent_messages = self.context.history[-10:] if len(self.context.history) > 10 else self.context.history
         return "\n".join([f"{msg.sender}: {msg.content}" for msg in recent_messages])
 
-    def llm_call_to_check_chat_state(self) -> Dict[str, str]:
-        """Check if the chat should end."""
-        conversation_history = self.format_conversation_history()
-
-        if "[PAYMENT_SUCCEEDED]" in conversation_history or "[CONVERSATION_ENDS]" in conversation_history:
-            return {"content": "[CONVERSATION_ENDS]"}
-
-        prompt = CHECK_CHAT_STATE_PROMPT.format(
+    def check_chat_state_prompt(self) -> str:
+        return CHECK_CHAT_STATE_PROMPT.format(
             agent_name=self.name,
             owner=self.owner,
             user_intent=self.user_intent,
             service_agent_description=self.description,
-            conversation_history=conversation_history,
+            conversation_history=self.format_conversation_history(),
         )
 
-        response = self.llm.generate(prompt=prompt)
-        return response 
\ No newline at end of file
+    @traced
+    def llm_call_to_check_chat_state(self) -> Dict[str, str]:
+        """Check if the chat should end."""
+        chat_state = self.chat_state_classifier.classify(
+            self.context.history,
+            lambda: self.llm.generate(prompt=self.check_chat_state_prompt(), route="state_check")
+        )
+        return {"content": chat_state}
+
+
+# Personal data files the Health AI may see records of. Chat histories are private and only reach it
+# through the Personal AI's validated replies
+HEALTH_CONTEXT_SOURCES = [HEALTH_DATA_FILE, PURCHASE_HISTORY_FILE]
+
+# Health profile fields extracted from every inbound message
+HEALTH_PROFILE_LIST_FIELDS = ["goals", "dietary_restrictions", "workout_history"]
+
+HEALTH_PROFILE_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "health_profile_update",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {
+                field: {"type": "array", "items": {"type": "string"}}
+                for field in HEALTH_PROFILE_LIST_FIELDS
+            },
+            "required": HEALTH_PROFILE_LIST_FIELDS,
+            "additionalProperties": False,
+        },
+    },
+}
@@ -1,15 +1,26 @@
 import os
 import json
+import asyncio
 from datetime import datetime
 from textwrap import dedent
-import streamlit as st
 
 from agent_marketplace.agents.ai_agent import AI_Agent
 from agent_marketplace.config import get_settings
 from agent_marketplace.schemas.agents import Message
-from agent_marketplace.services.llm import OpenAILLMProvider
+from agent_marketplace.schemas.events import StatusUpdate, ToolCalled
+from agent_marketplace.services.llm import count_text_tokens, run_coroutine
+from agent_marketplace.services.model_router import ModelRouter
+from agent_marketplace.services.cache import get_disk_cache, hash_key
+from agent_marketplace.services.chat_state import CONVERSATION_ENDS, create_chat_state_classifier
+from agent_marketplace.services.ingestion import (
+    CHAT_HISTORY_FILES, DEFAULT_RECORD_PREFIX, RECORD_PREFIXES, chunk_texts, iter_json_records, map_reduce, render_record,
+    session_time
+)
+from agent_marketplace.services.personal_data import BASIC_INFO_FILE, get_personal_data_store
+from agent_marketplace.services.summarizer import HierarchicalSummarizer, content_groups
+from agent_marketplace.services.vector_index import format_personal_context, get_personal_index
+from agent_marketplace.services.tracing import traced
 from agent_marketplace.tools import registered_tools
-from agent_marketplace.config import response_generator
 
 class PersonalAI(AI_Agent):
     def __init__(self, name: str, owner: str, description: str, user_intent: str, model_config: dict = {}):
@@ -18,10 +29,33 @@ class PersonalAI(AI_Agent):
         self.personal_basic_info: str = ""
         self.personal_preferences: dict[str, str] = {}
         self.user_intent: str = user_intent
+        # Dispatch the per-file personal data retrievals concurrently instead of one after another
+        self.parallel_retrieval: bool = model_config.get("parallel_retrieval", self.settings.parallel_retrieval)
+        # "index" retrieves relevant chunks of the personal data per turn, "summary" summarizes it once per chat
+        self.personal_context: str = model_config.get("personal_context", self.settings.personal_context)
 
-        self.llm = OpenAILLMProvider()
-        self.tools = registered_tools
+        # Response candidates generated and validated in parallel per turn, and the LLM call budget of a turn
+        self.response_candidates: int = model_config.get("response_candidates", self.settings.personal_ai_response_candidates)
+        self.max_llm_calls_per_turn: int = model_config.get("max_llm_calls_per_turn", self.settings.personal_ai_max_llm_calls_per_turn)
 
+        self.llm = ModelRouter(model_config)
+        self.tools = registered_tools
+        # On-disk cache of personal preference summaries shared across sessions
+        use_cache = model_config.get("preference_cache", self.settings.preference_cache)
+        self.preference_cache = get_disk_cache("personal_preferences") if use_cache else None
+        # Summaries of the nodes of the chat history digests, see history_summarizer
+        use_summary_cache = model_config.get("summary_cache", self.settings.summary_cache)
+        self.summary_cache = get_disk_cache("history_summaries") if use_summary_cache else None
+        # Personal data files, read and parsed once per process
+        self.data_store = get_personal_data_store()
+        self.chat_state_classifier = create_chat_state_classifier(model_config)
+
+    def reset_session(self) -> None:
+        super().reset_session()
+        self.personal_basic_info = ""
+        self.personal_preferences = {}
+
+    @traced
     def init_chat(self, guest_agent: AI_Agent = None):
         # Retrieve personal information based on the guest agent
         self.retrieve_personal_preferences(guest_agent)
@@ -44,171 +78,303 @@ class PersonalAI(AI_Agent):
 
         return Message(role="user", content=response["content"], sender=self.name, receiver=sender.name, timestamp=datetime.now())
 
+    @traced
     def retrieve_personal_preferences(self, sender: AI_Agent) -> str:
-        print(f"Retrieving personal preferences for \033[1;33m{self.owner}\033[0m")
-        with st.chat_message("user"):
-            st.write_stream(
-                response_generator(f"🔍 **Retrieving personal preferences for :blue[{self.owner}]**")
-            )
+        self.publish_status("retrieval", f"🔍 **Retrieving personal preferences for :blue[{self.owner}]**")
+
+        if self.personal_context == "index":
+            # The raw basic info and the most relevant records, without LLM calls
+            self.personal_basic_info = self.data_store.basic_info(self.owner) or ""
+            self.personal_preferences[sender.name] = format_personal_context(
+                self.search_personal_data(f"{self.user_intent}\n{sender.description}"))
+            self.publish_status("retrieval", f"✅ **Retrieved the personal data of :blue[{self.owner}] relevant to the task**",
+                                detail=self.personal_preferences[sender.name])
+            return
+
+        personal_data_dir = self.data_store.user_dir(self.owner)
+
+        # Reuse the summaries from a previous consultation if neither the data nor the prompts changed
+        cache_key = self.personal_preferences_cache_key(sender, personal_data_dir)
+        cached = self.preference_cache.get(cache_key) if self.preference_cache else None
+        if cached:
+            self.personal_basic_info = cached["personal_basic_info"]
+            self.personal_preferences[sender.name] = cached["personal_preferences"]
+            self.publish_status("retrieval", f"✅ **Loaded cached personal preferences for :blue[{self.owner}]**",
+                                detail=self.personal_preferences[sender.name])
+            return
+
+        # Read basic info and every personal data file first, sorted so the preference order is deterministic
+        basic_info = self.data_store.basic_info(self.owner)
+
+        personal_data_files = []
+        for file in self.data_store.files(self.owner):
+            if file != BASIC_INFO_FILE:
+                personal_data_files.append((file, *self.load_personal_data_file(os.path.join(personal_data_dir, file), sender)))
+
+        # Then dispatch all retrieval calls, concurrently in parallel mode
+        requests = []
+        if basic_info is not None:
+            requests.append({"prompt": self.summarize_personal_preferences_prompt(basic_info), "route": "summarization"})
+        for file, personal_data, status in personal_data_files:
+            if personal_data is not None:
+                requests.append({"prompt": self.retrieve_personal_info_prompt(sender, personal_data), "route": "extraction"})
+        if self.parallel_retrieval:
+            responses = self.llm.generate_batch(requests)
+        else:
+            responses = [self.llm.generate(**request) for request in requests]
+        responses = iter(responses)
+
+        # Get basic info
+        self.personal_basic_info = next(responses)["content"] if basic_info is not None else ""
+
+        # Get personal preferences
+        personal_preferences = []
+        for file, personal_data, status in personal_data_files:
+            if personal_data is None:
+                p_info = f"Error processing {file}: {status}"
+                self.publish_status("retrieval", f"Error processing **{os.path.splitext(file)[0]}**", detail=p_info, level="error")
+            else:
+                p_info = next(responses)["content"]
+                self.publish_status("retrieval", f"Searching in **{os.path.splitext(file)[0]}**{status}...", detail=p_info)
+            personal_preferences.append(p_info)
+
+        # Summarize personal preferences, merging them hierarchically first if they don't fit in one prompt
+        personal_preferences_text = "\n\n".join(personal_preferences)
+        if self.count_tokens(personal_preferences_text) > self.settings.personal_preferences_max_tokens:
+            personal_preferences_text = self.history_summarizer().merge(personal_preferences)
+
+        personal_preferences = self.llm_call_to_summarize_personal_preferences(sender, personal_preferences_text)
+        self.personal_preferences[sender.name] = personal_preferences["content"]
+        self.publish_status("summary", f"✅ **Summarizing :blue[{self.owner}]'s personal preferences**",
+                            detail=self.personal_preferences[sender.name])
+
+        if self.preference_cache:
+            self.preference_cache.set(cache_key, {
+                "personal_basic_info": self.personal_basic_info,
+                "personal_preferences": self.personal_preferences[sender.name],
+            })
+
+    def search_personal_data(self, query: str) -> list:
+        """The chunks of the owner's personal data most relevant to a query, from the local vector index"""
+        return get_personal_index(self.owner).search(
+            query, top_k=self.settings.personal_context_top_k, n_probe=self.settings.personal_index_n_probe)
+
+    def personal_info(self, sender: AI_Agent) -> str:
+        """The owner's personal information for a reply prompt, in index mode with records relevant to the latest message"""
+        personal_info = f"{self.personal_basic_info}\n\n{self.personal_preferences[sender.name]}"
+        if self.personal_context == "index" and self.context.history:
+            results = [result for result in self.search_personal_data(self.context.history[-1].content)
+                       if result[1] not in self.personal_preferences[sender.name]]
+            if results:
+                personal_info += f"\n\n{format_personal_context(results)}"
+        return personal_info
+
+    def publish_status(self, section: str, text: str, detail: str = None, level: str = "info") -> None:
+        self.events.publish(StatusUpdate(agent=self.name, section=section, text=text, detail=detail, level=level))
+
+    def personal_preferences_cache_key(self, sender: AI_Agent, personal_data_dir: str) -> str:
+        """Hash everything the personal preference summaries depend on: data files, prompts, guest agent and model."""
+        personal_data = {
+            file: self.data_store.content_hash(os.path.join(personal_data_dir, file))
+            for file in self.data_store.files(self.owner)
+        }
+        return hash_key(
+            self.owner,
+            personal_data,
+            RETRIEVE_PERSONAL_INFO_PROMPT,
+            MERGE_PERSONAL_INFO_PROMPT,
+            SUMMARIZE_HISTORY_PROMPT,
+            MERGE_HISTORY_SUMMARIES_PROMPT,
+            SUMMARIZE_PERSONAL_PREFERENCES_PROMPT,
+            self.settings.ingestion_stream_threshold,
+            self.settings.ingestion_chunk_tokens,
+            self.settings.ingestion_reduce_fan_in,
+            self.settings.summary_leaf_tokens,
+            self.settings.summary_fan_in,
+            self.settings.personal_preferences_max_tokens,
+            sender.name,
+            sender.description,
+            self.user_intent,
+            self.llm.provider("extraction").model,
+            self.llm.provider("summarization").model,
+        )
 
-            personal_data_dir = os.path.join(os.path.dirname(__file__), "..", "..", "data", "personal_data", self.owner)
-            if not os.path.exists(personal_data_dir):
-                raise ValueError(f"Personal data directory {personal_data_dir} does not exist. Is the client name correct?")
+    def load_personal_data_file(self, file_path: str, sender: AI_Agent = None) -> tuple:
+        """
+        Load a personal data file, reduced to a size that fits in a retrieval prompt.
 
-            # Get basic info
-            basic_info_path = os.path.join(personal_data_dir, "basic_info.json")
-            if os.path.exists(basic_info_path):
-                with open(basic_info_path) as f:
-                    self.personal_basic_info = self.llm_call_to_summarize_personal_preferences(sender, f.read())
-            else:
-                self.personal_basic_info = ""
-
-            # Get personal preferences
-            personal_preferences = []
-            for file in os.listdir(personal_data_dir):
-                if file.endswith(".json") and file != "basic_info.json":
-                    file_path = os.path.join(personal_data_dir, file)
-                    
-                    # For large data files like user_ai_interaction_data.json, severely limit the data
-                    if file == "user_ai_interaction_data.json":
-                        try:
-                            with open(file_path) as f:
-                                personal_data = json.load(f)
-                                
-                                # Create a highly reduced version
-                                if "Data" in personal_data and isinstance(personal_data["Data"], list):
-                                    # Only keep 2 most recent sessions
-                                    if len(personal_data["Data"]) > 2:
-                                        reduced_data = {
-                                            "Name": personal_data.get("Name", ""),
-                                            "Data": personal_data["Data"][-2:]  # Take only the 2 most recent sessions
-                                        }
-                                        
-                                        # Further reduce each session by keeping only first and last interactions
-                                        for i, session in enumerate(reduced_data["Data"]):
-                                            if "user_ai_interaction" in session and len(session["user_ai_interaction"]) > 4:
-                                                session["user_ai_interaction"] = [
-                                                    session["user_ai_interaction"][0],  # First interaction
-                                                    session["user_ai_interaction"][1],  # Second interaction
-                                                    session["user_ai_interaction"][-2],  # Second-to-last interaction
-                                                    session["user_ai_interaction"][-1]  # Last interaction
-                                                ]
-                                        
-                                        st.write_stream(
-                                            response_generator(f"Searching in **{os.path.splitext(file)[0]}** (limited to most recent 2 sessions, truncated)...")
-                                        )
-                                        p_info = self.llm_call_to_retrieve_personal_info(sender, reduced_data)["content"]
-                                    else:
-                                        # Even for small datasets, truncate interactions
-                                        for i, session in enumerate(personal_data["Data"]):
-                                            if "user_ai_interaction" in session and len(session["user_ai_interaction"]) > 4:
-                                                session["user_ai_interaction"] = [
-                                                    session["user_ai_interaction"][0], 
-                                                    session["user_ai_interaction"][1],
-                                                    session["user_ai_interaction"][-2],
-                                                    session["user_ai_interaction"][-1]
-                                                ]
-                                        
-                                        p_info = self.llm_call_to_retrieve_personal_info(sender, personal_data)["content"]
-                                        st.write_stream(
-                                            response_generator(f"Searching in **{os.path.splitext(file)[0]}** (truncated interactions)...")
-                                        )
-                                else:
-                                    # If data format is unexpected, create minimal representation
-                                    minimal_data = {"Name": personal_data.get("Name", ""), "Summary": "Interaction history available but not processed in detail"}
-                                    p_info = self.llm_call_to_retrieve_personal_info(sender, minimal_data)["content"]
-                                    st.write_stream(
-                                        response_generator(f"Searching in **{os.path.splitext(file)[0]}** (minimal summary)...")
-                                    )
-                        except Exception as e:
-                            # If any error occurs, use minimal data
-                            print(f"Error processing {file}: {str(e)}")
-                            p_info = self.llm_call_to_retrieve_personal_info(sender, {"Note": f"User interaction data available but could not be processed: {str(e)}"})["content"]
-                            st.write_stream(
-                                response_generator(f"Searching in **{os.path.splitext(file)[0]}** (error occurred, using minimal data)...")
-                            )
-                    else:
-                        # For other files, still limit the size
-                        try:
-                            with open(file_path) as f:
-                                # Read as string first to check size
-                                file_content = f.read()
-                                # If file is too large (>10KB), just use a basic summary
-                                if len(file_content) > 10240:  # 10KB limit
-                                    personal_data = {"file": file, "note": "Large file available but not processed in detail for efficiency"}
-                                    st.write_stream(
-                                        response_generator(f"Searching in **{os.path.splitext(file)[0]}** (large file, using summary)...")
-                                    )
-                                else:
-                                    # Parse the JSON if it's a reasonable size
-                                    personal_data = json.loads(file_content)
-                                    st.write_stream(
-                                        response_generator(f"Searching in **{os.path.splitext(file)[0]}** ...")
-                                    )
-                            
-                            p_info = self.llm_call_to_retrieve_personal_info(sender, personal_data)["content"]
-                        except Exception as e:
-                            print(f"Error processing {file}: {str(e)}")
-                            p_info = f"Error processing {file}: {str(e)}"
-                            st.write_stream(
-                                response_generator(f"Error processing **{os.path.splitext(file)[0]}**")
-                            )
-                    
-                    st.write_stream(
-                        response_generator(p_info)
-                    )
-                    personal_preferences.append(p_info)
-        
-        with st.chat_message("user"):
-            # Summarize personal preferences
-            personal_preferences_text = "\n\n".join(personal_preferences)
-            # Limit the total text length to prevent token limit issues
-            if len(personal_preferences_text) > 4000:
-                personal_preferences_text = personal_preferences_text[:4000] + "\n\n[Additional data truncated for efficiency]"
-                
-            personal_preferences = self.llm_call_to_summarize_personal_preferences(sender, personal_preferences_text)
-            self.personal_preferences[sender.name] = personal_preferences["content"]
-            st.write_stream(
-                response_generator(f"✅ **Summarizing :blue[{self.owner}]'s personal preferences**")
-            )
-            st.write_stream(
-                response_generator(self.personal_preferences[sender.name])
-            )
+        Chat histories are replaced by their digest (see digest_history_file), and other files larger
+        than Settings.ingestion_stream_threshold are streamed and condensed to the information
+        relevant to the sender (see ingest_personal_data_file).
+
+        Returns a (personal_data, status) tuple, where status is a short note on how the data was
+        reduced. If the file cannot be processed, personal_data is None and status is the error.
+        """
+        file = os.path.basename(file_path)
+
+        try:
+            # Chat histories are condensed to a digest of every session
+            if file in CHAT_HISTORY_FILES:
+                return self.digest_history_file(file_path)
+            # Stream large files instead of loading them whole
+            if sender is not None and os.path.getsize(file_path) > self.settings.ingestion_stream_threshold:
+                return self.ingest_personal_data_file(file_path, sender)
+            return self.data_store.load_json(file_path), " "
+        except Exception as e:
+            print(f"Error processing {file}: {str(e)}")
+            return None, str(e)
+
+    @traced
+    def ingest_personal_data_file(self, file_path: str, sender: AI_Agent) -> tuple:
+        """
+        Condense a large personal data file to the information relevant to the sender, with map-reduce.
+
+        The file's records (e.g. Data[*].Conversations[*] of conversation_data.json) are parsed one at
+        a time and packed into chunks of at most Settings.ingestion_chunk_tokens. Each chunk is searched
+        with the retrieval prompt, a window of chunks per concurrent batch, and the findings are merged
+        until one remains. Only a window of chunks is held in memory, however large the file.
+
+        Returns a (personal_data, status) tuple like load_personal_data_file.
+        """
+        prefix = RECORD_PREFIXES.get(os.path.basename(file_path), DEFAULT_RECORD_PREFIX)
+        counts = {"records": 0, "chunks": 0}
+
+        def texts():
+            for record in iter_json_records(file_path, prefix):
+                counts["records"] += 1
+                yield render_record(record)
+
+        def chunks():
+            for chunk in chunk_texts(texts(), self.settings.ingestion_chunk_tokens, self.count_tokens):
+                counts["chunks"] += 1
+                yield chunk
+
+        personal_data = map_reduce(
+            chunks(),
+            lambda batch: self.generate_texts([self.retrieve_personal_info_prompt(sender, chunk) for chunk in batch], "extraction"),
+            lambda groups: self.generate_texts([self.merge_personal_info_prompt(sender, findings) for findings in groups], "summarization"),
+            window=self.settings.ingestion_map_window,
+            fan_in=self.settings.ingestion_reduce_fan_in,
+        )
+        if personal_data is None:
+            return None, "no records found"
+        return personal_data, f" (streamed {counts['records']} records in {counts['chunks']} chunks)"
+
+    @traced
+    def digest_history_file(self, file_path: str) -> tuple:
+        """
+        Condense a chat history file to a digest of all of its sessions.
+
+        Sessions are ordered by time and packed into leaves of about Settings.summary_fan_in sessions
+        and at most Settings.summary_leaf_tokens, with boundaries set by the sessions' content. The
+        leaves are summarized and merged up to one digest by the history summarizer, whose summaries
+        are cached by content, so a new session only regenerates the path from its leaf to the root.
+        The file is streamed twice, first for the time, key and size of every session, then for the
+        text of the sessions whose leaves have to be summarized. The digest doesn't depend on the
+        guest agent and is shared by all of them.
+
+        Returns a (personal_data, status) tuple like load_personal_data_file.
+        """
+        prefix = RECORD_PREFIXES[os.path.basename(file_path)]
+        sessions = []
+        for position, record in enumerate(iter_json_records(file_path, prefix)):
+            text = render_record(record)
+            # Sessions without a readable time keep their file order after the rest
+            sessions.append((session_time(record) or datetime.max, position, hash_key(text), self.count_tokens(text)))
+        if not sessions:
+            return None, "no sessions found"
+        sessions.sort(key=lambda session: session[:2])
+        leaves = content_groups([session[2] for session in sessions], [session[3] for session in sessions],
+                                self.settings.summary_fan_in, self.settings.summary_leaf_tokens, salt="leaf")
+
+        def load_leaves(indices: list) -> list:
+            positions = {sessions[session][1] for index in indices for session in leaves[index]}
+            texts = {}
+            for position, record in enumerate(iter_json_records(file_path, prefix)):
+                if position in positions:
+                    # A session over the leaf size on its own is cut to fit
+                    texts[position] = next(chunk_texts([render_record(record)], self.settings.summary_leaf_tokens, self.count_tokens))
+            return ["\n\n".join(texts[sessions[session][1]] for session in leaves[index]) for index in indices]
+
+        summarizer = self.history_summarizer()
+        digest = summarizer.summarize_leaves([[sessions[session][2] for session in leaf] for leaf in leaves], load_leaves)
+        stats = summarizer.stats()
+        return digest, f" (digest of {len(sessions)} sessions, {stats['computed']} of {stats['computed'] + stats['cached']} summaries updated)"
+
+    def history_summarizer(self) -> HierarchicalSummarizer:
+        """Summarizer of the owner's chat histories, caching its summaries in the summary cache"""
+        return HierarchicalSummarizer(
+            lambda leaves: self.generate_texts([SUMMARIZE_HISTORY_PROMPT.format(owner=self.owner, history=leaf) for leaf in leaves], "summarization"),
+            lambda groups: self.generate_texts([MERGE_HISTORY_SUMMARIES_PROMPT.format(owner=self.owner, summaries=group) for group in groups], "summarization"),
+            cache=self.summary_cache,
+            fan_in=self.settings.summary_fan_in,
+            key=[self.owner, SUMMARIZE_HISTORY_PROMPT, MERGE_HISTORY_SUMMARIES_PROMPT, self.llm.provider("summarization").model],
+        )
+
+    def generate_texts(self, prompts: list, route: str) -> list:
+        """Generate a response to each prompt, concurrently in parallel mode, and return their contents"""
+        requests = [{"prompt": prompt, "route": route} for prompt in prompts]
+        if self.parallel_retrieval:
+            return [response["content"] for response in self.llm.generate_batch(requests)]
+        return [self.llm.generate(**request)["content"] for request in requests]
 
+    def count_tokens(self, text: str) -> int:
+        return count_text_tokens(self.llm.provider("extraction").encoding_name, text)
+
+    @traced
     def generate_response(self, message: Message, sender: AI_Agent) -> str:
-        # Check if the task is complete
-        chat_state = self.llm_call_to_check_chat_state(sender)
-        if chat_state["content"] == "[CONVERSATION_ENDS]":
+        # Check if the task is complete, without an LLM call when the rules can tell
+        chat_state = self.chat_state_classifier.classify_without_llm(self.context.history)
+        if chat_state == CONVERSATION_ENDS:
+            self.task_complete = True
+            return {"content": "[CONVERSATION_ENDS]"}
+
+        if self.response_candidates > 1:
+            return self.speculative_generate_response(message, sender, chat_state)
+
+        requests = [{"prompt": self.generate_response_prompt(sender), "tools": PERSONAL_AI_TOOLS}]
+        if chat_state is None:
+            # Check the chat state and draft the first response concurrently, the draft is discarded if the chat ends
+            requests.append({"prompt": self.check_chat_state_prompt(sender), "route": "state_check"})
+        responses = self.llm.generate_batch(requests)
+        calls_left = self.max_llm_calls_per_turn - len(requests)
+        response = responses[0]
+        if chat_state is None:
+            self.chat_state_classifier.record_llm_decision()
+            chat_state = responses[1]["content"]
+        if chat_state == CONVERSATION_ENDS:
             self.task_complete = True
             return {"content": "[CONVERSATION_ENDS]"}
 
         retry = 0
         validator_response = {}
+        # The last response that can be sent, in case the budget runs out before one is accepted
+        usable_response = None
         while retry < 3:
             # Generate response
-            response = self.llm_call_to_generate_response(sender, validator_response)
+            if retry > 0:
+                if calls_left < 1:
+                    break
+                response = self.llm_call_to_generate_response(sender, validator_response)
+                calls_left -= 1
 
             # Tool call
             if response["tool_calls"]:
-                for tool_call in response["tool_calls"]:
-                    tool_func_name = tool_call.function.name
-                    tool_func_args = tool_call.function.arguments
-                    tool_func_result = self.tools[tool_func_name](tool_func_args, message)
-                    
-                    # Update context
-                    self.context.history.append(
-                        Message(role="user", 
-                                content=f"{tool_func_result}", 
-                                sender=f"[{tool_func_name}] tool", 
-                                receiver=sender.name,
-                                timestamp=datetime.now())
-                    )
-                
+                self.run_tool_calls(response["tool_calls"], message, sender)
+
                 # Regenerate response
+                if calls_left < 1:
+                    break
                 response = self.llm_call_to_generate_response(sender, validator_response)
+                calls_left -= 1
+            if response["content"] and not response["tool_calls"]:
+                usable_response = response
             
             # Validate response
+            if calls_left < 1:
+                break
             validator_response = self.llm_call_to_validate_response(response["content"], sender)
+            calls_left -= 1
             if validator_response["content"] == "[YES]":
                 return response
             
@@ -217,74 +383,220 @@ class PersonalAI(AI_Agent):
             
             retry += 1
 
-        return response
+        if usable_response is not None:
+            return usable_response
+        # Out of budget before any usable response, e.g. after a run of tool calls
+        self.task_complete = True
+        return {"content": "[CONVERSATION_ENDS]"}
 
-    def llm_call_to_validate_response(self, input_message: str, sender: AI_Agent) -> dict:
-        prompt = VALIDATE_RESPONSE_PROMPT.format(
+    @traced
+    def speculative_generate_response(self, message: Message, sender: AI_Agent, chat_state: str = None) -> dict:
+        """
+        Generate several candidate responses in parallel, validate them concurrently and return the
+        first one the validator accepts, so a turn normally takes one generate plus one validate.
+        Candidates that call tools win immediately: their tools are run and a new round of
+        candidates is generated from the results. Rounds stop when the per-turn LLM call budget runs out.
+        """
+        calls_left = self.max_llm_calls_per_turn
+        check_state = chat_state is None
+        validator_response = {}
+        response = None
+        while True:
+            # Each candidate costs a generate and a validate
+            num_candidates = min(self.response_candidates, (calls_left - check_state) // 2)
+            if num_candidates < 1:
+                if response is not None and response["content"]:
+                    return response
+                # Out of budget before any usable response, e.g. after a run of tool calls
+                self.task_complete = True
+                return {"content": "[CONVERSATION_ENDS]"}
+
+            outcome = run_coroutine(self.speculate(sender, validator_response, num_candidates, check_state))
+            calls_left -= outcome["calls"]
+            if check_state:
+                self.chat_state_classifier.record_llm_decision()
+                check_state = False
+            if outcome["chat_state"] == CONVERSATION_ENDS:
+                self.task_complete = True
+                return {"content": "[CONVERSATION_ENDS]"}
+
+            response = outcome["response"]
+            if response["tool_calls"]:
+                self.run_tool_calls(response["tool_calls"], message, sender)
+                continue
+            if outcome["validator_response"]["content"] == "[YES]":
+                return response
+            validator_response = outcome["validator_response"]
+
+    @traced
+    async def speculate(self, sender: AI_Agent, validator_response: dict, num_candidates: int, check_state: bool) -> dict:
+        """
+        Run one round of speculative generation on the shared LLM event loop
+
+        Args:
+            sender (AI_Agent): The service agent being replied to
+            validator_response (dict): Feedback from the previous round's validator, if any
+            num_candidates (int): Number of candidates to generate
+            check_state (bool): Also check the chat state with the LLM, concurrently with the candidates
+
+        Returns:
+            dict: The chat state (None unless checked), the chosen response, its validator response
+                (None for tool calls) and the number of LLM calls issued
+        """
+        calls = num_candidates + check_state
+        prompt = self.generate_response_prompt(sender, validator_response)
+
+        async def generate_and_validate(index: int) -> dict:
+            nonlocal calls
+            # Only the first candidate may come from the response cache, the others have to be fresh samples
+            response = await self.llm.agenerate(prompt=prompt, tools=PERSONAL_AI_TOOLS, cache=index == 0)
+            if response["tool_calls"]:
+                return {"index": index, "response": response, "validator_response": None}
+            calls += 1
+            validation = await self.llm.agenerate(prompt=self.validate_response_prompt(response["content"], sender), route="validation")
+            return {"index": index, "response": response,
+                    "validator_response": self.validator_feedback(validation, response["content"])}
+
+        tasks = [asyncio.ensure_future(generate_and_validate(index)) for index in range(num_candidates)]
+        try:
+            if check_state:
+                state_response = await self.llm.agenerate(prompt=self.check_chat_state_prompt(sender), route="state_check")
+                if state_response["content"] == CONVERSATION_ENDS:
+                    return {"chat_state": CONVERSATION_ENDS, "response": None, "validator_response": None, "calls": calls}
+
+            rejected, errors = [], []
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    candidate = await next_done
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                if candidate["validator_response"] is None or candidate["validator_response"]["content"] == "[YES]":
+                    return {"chat_state": None, "calls": calls, **candidate}
+                rejected.append(candidate)
+            if not rejected:
+                raise errors[0]
+            # Nothing passed: carry the first candidate's feedback into the next round
+            return {"chat_state": None, "calls": calls, **min(rejected, key=lambda candidate: candidate["index"])}
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @traced
+    def run_tool_calls(self, tool_calls: list, message: Message, sender: AI_Agent) -> None:
+        """Run the tools a response called and add their results to the context"""
+        for tool_call in tool_calls:
+            tool_func_name = tool_call.function.name
+            tool_func_args = tool_call.function.arguments
+            tool_func_result = self.tools[tool_func_name](tool_func_args, message, events=self.events)
+            self.events.publish(ToolCalled(agent=self.name, tool=tool_func_name, arguments=tool_func_args,
+                                           result=f"{tool_func_result}"))
+            
+            # Update context
+            self.context.history.append(
+                Message(role="user", 
+                        content=f"{tool_func_result}", 
+                        sender=f"[{tool_func_name}] tool", 
+                        receiver=sender.name,
+                        timestamp=datetime.now())
+            )
+
+    def format_conversation_history(self) -> str:
+        """Format the last 10 messages of the conversation for prompt context."""
+        return "\n".join([f"{msg.sender}: {msg.content}" for msg in self.context.history][-10:])
+
+    def validate_response_prompt(self, input_message: str, sender: AI_Agent) -> str:
+        return VALIDATE_RESPONSE_PROMPT.format(
             owner=self.owner,
             user_intent=self.user_intent,
             service_agent_description=sender.description,
-            conversation_history="\n".join([f"{msg.sender}: {msg.content}" for msg in self.context.history][-10:]),
+            conversation_history=self.format_conversation_history(),
             input_message=input_message
         )
-        response = self.llm.generate(prompt=prompt)
+
+    def validator_feedback(self, response: dict, input_message: str) -> dict:
+        """Turn a rejection from the validator into notes for regenerating the response"""
         if response["content"] != "[YES]":
             response["content"] = f"# Notes\nPlease do not generate response like this: \n{input_message}\n\nThe reason is: \n{response['content']}"
         return response
+
+    @traced
+    def llm_call_to_validate_response(self, input_message: str, sender: AI_Agent) -> dict:
+        response = self.llm.generate(prompt=self.validate_response_prompt(input_message, sender), route="validation")
+        return self.validator_feedback(response, input_message)
     
-    def llm_call_to_check_chat_state(self, sender: AI_Agent) -> dict:
-        conversation_history = "\n".join([f"{msg.sender}: {msg.content}" for msg in self.context.history][-10:])
-        
-        if "[PAYMENT_SUCCEEDED]" in conversation_history:
-            return {"content": "[CONVERSATION_ENDS]"}
-        
-        prompt = CHECK_CHAT_STATE_PROMPT.format(
+    def check_chat_state_prompt(self, sender: AI_Agent) -> str:
+        return CHECK_CHAT_STATE_PROMPT.format(
             agent_name=self.name,
             owner=self.owner,
             user_intent=self.user_intent,
             service_agent_description=sender.description,
-            conversation_history=conversation_history,
+            conversation_history=self.format_conversation_history(),
         )
-        response = self.llm.generate(prompt=prompt)
-        return response
+
+    @traced
+    def llm_call_to_check_chat_state(self, sender: AI_Agent) -> dict:
+        chat_state = self.chat_state_classifier.classify(
+            self.context.history,
+            lambda: self.llm.generate(prompt=self.check_chat_state_prompt(sender), route="state_check")
+        )
+        return {"content": chat_state}
     
-    def llm_call_to_generate_response(self, sender: AI_Agent, validator_response: dict = {}) -> dict:
-        # Generate response
-        prompt = GENERATE_RESPONSE_PROMPT.format(
+    def generate_response_prompt(self, sender: AI_Agent, validator_response: dict = {}) -> str:
+        return GENERATE_RESPONSE_PROMPT.format(
             owner=self.owner,
-            owner_personal_info=f"{self.personal_basic_info}\n\n{self.personal_preferences[sender.name]}",
+            owner_personal_info=self.personal_info(sender),
             service_agent_name=sender.name,
             service_agent_description=sender.description,
-            conversation_history="\n".join([f"{msg.sender}: {msg.content}" for msg in self.context.history][-10:]),
+            conversation_history=self.format_conversation_history(),
             user_intent=self.user_intent,
             validator_message=validator_response["content"] if validator_response else "",
             self_name=self.name
         )
-        response = self.llm.generate(prompt=prompt, tools=PERSONAL_AI_TOOLS)
+
+    @traced
+    def llm_call_to_generate_response(self, sender: AI_Agent, validator_response: dict = {}) -> dict:
+        # Generate response
+        response = self.llm.generate(prompt=self.generate_response_prompt(sender, validator_response), tools=PERSONAL_AI_TOOLS)
         return response
 
-    def llm_call_to_retrieve_personal_info(self, sender: AI_Agent, owner_personal_data: str) -> dict:
+    def retrieve_personal_info_prompt(self, sender: AI_Agent, owner_personal_data: str) -> str:
         # Convert data to string if it's a dictionary to ensure consistent handling
         if isinstance(owner_personal_data, dict):
             owner_personal_data = json.dumps(owner_personal_data, indent=2)
             
-        prompt = RETRIEVE_PERSONAL_INFO_PROMPT.format(
+        return RETRIEVE_PERSONAL_INFO_PROMPT.format(
             owner=self.owner,
             service_agent_name=sender.name,
             service_agent_description=sender.description,
             user_intent=self.user_intent,
             owner_personal_data=owner_personal_data
         )
-        response = self.llm.generate(prompt=prompt)
+
+    @traced
+    def llm_call_to_retrieve_personal_info(self, sender: AI_Agent, owner_personal_data: str) -> dict:
+        response = self.llm.generate(prompt=self.retrieve_personal_info_prompt(sender, owner_personal_data), route="extraction")
         return response
 
-    def llm_call_to_summarize_personal_preferences(self, sender: AI_Agent, owner_personal_data: str) -> dict:
-        prompt = SUMMARIZE_PERSONAL_PREFERENCES_PROMPT.format(
+    def merge_personal_info_prompt(self, sender: AI_Agent, findings: str) -> str:
+        return MERGE_PERSONAL_INFO_PROMPT.format(
+            owner=self.owner,
+            service_agent_name=sender.name,
+            user_intent=self.user_intent,
+            findings=findings
+        )
+
+    def summarize_personal_preferences_prompt(self, owner_personal_data: str) -> str:
+        return SUMMARIZE_PERSONAL_PREFERENCES_PROMPT.format(
             owner_personal_data=owner_personal_data
         )
-        response = self.llm.generate(prompt=prompt)
+
+    @traced
+    def llm_call_to_summarize_personal_preferences(self, sender: AI_Agent, owner_personal_data: str) -> dict:
+        response = self.llm.generate(prompt=self.summarize_personal_preferences_prompt(owner_personal_data), route="summarization")
         return response
 
+    @traced
     def respond_to_user(self, user_message: str) -> str:
         """Generate a response directly to the user's message."""
         prompt = f"""
@@ -300,9 +612,11 @@ class PersonalAI(AI_Agent):
         Respond in a friendly, conversational manner.
         """
         
-        response = self.llm.generate(prompt=prompt)
+        # Near-duplicate questions may share a reply (RESPONSE_CACHE_SEMANTIC)
+        response = self.llm.generate(prompt=prompt, semantic_cache_key=user_message)
         return response["content"]
     
+    @traced
     def summarize_agent_chat(self, agent_chat_summary: str, original_user_message: str) -> str:
         """Summarize the conversation with another agent and provide a response to the user."""
         prompt = f"""
@@ -413,6 +727,35 @@ Based on the selected personal info, estimate the personal information for the t
 {owner_personal_data}
 """
 
+MERGE_PERSONAL_INFO_PROMPT = """
+I am doing a task for my client {owner}. The agent I am working with is {service_agent_name}.
+
+# The task description from my client
+{user_intent}
+
+# Your task
+The notes below were each extracted from a different part of {owner}'s personal information.
+Merge them into one single paragraph of at most 100 words. Keep every specific fact relevant to the task and the service agent, and drop duplicates.
+
+# Notes
+{findings}
+"""
+
+SUMMARIZE_HISTORY_PROMPT = """
+Below are past chat sessions of {owner}. Summarize what they reveal about {owner} in one single paragraph of at most 100 words: preferences, habits, plans, health and lifestyle, relationships and other specific facts. Leave out small talk.
+
+# Chat sessions
+{history}
+"""
+
+MERGE_HISTORY_SUMMARIES_PROMPT = """
+The summaries below each cover a different part of {owner}'s personal information, in chronological order.
+Merge them into one single paragraph of at most 150 words. Keep the specific facts, prefer the later ones where they conflict, and drop duplicates.
+
+# Summaries
+{summaries}
+"""
+
 SUMMARIZE_PERSONAL_PREFERENCES_PROMPT = """
 Please summarize the following personal information into one single paragraph of 100 words.
 
@@ -1,9 +1,8 @@
 import os
 import time
 import re
-import streamlit as st
 
-from typing import Optional
+from typing import Literal, Optional
 from pydantic_settings import BaseSettings
 from functools import lru_cache
 from dotenv import load_dotenv
@@ -16,6 +15,88 @@ class Settings(BaseSettings):
     openai_api_key: Optional[str] = os.getenv("OPENAI_API_KEY")
     google_api_key: Optional[str] = os.getenv("GOOGLE_API_KEY")
     port: int = int(os.getenv("PORT", "8000"))
+    openai_base_url: Optional[str] = os.getenv("OPENAI_BASE_URL")
+    # Default models for replies/summaries and for cheap classification-style calls
+    llm_model: str = os.getenv("LLM_MODEL", "openai:gpt-4o")
+    llm_fast_model: str = os.getenv("LLM_FAST_MODEL", "openai:gpt-4o-mini")
+    llm_max_concurrency: int = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+    # Per-model rate limits shared by all agents in the process (0 disables), and retries of failed requests
+    llm_requests_per_minute: int = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "500"))
+    llm_tokens_per_minute: int = int(os.getenv("LLM_TOKENS_PER_MINUTE", "30000"))
+    llm_max_retries: int = int(os.getenv("LLM_MAX_RETRIES", "6"))  # Retries after the first attempt, 0 for none
+    llm_backoff_base: float = float(os.getenv("LLM_BACKOFF_BASE", "1"))  # Seconds
+    llm_backoff_max: float = float(os.getenv("LLM_BACKOFF_MAX", "60"))  # Seconds
+    # HTTP connection pool shared by all LLM clients
+    llm_max_connections: int = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+    llm_max_keepalive_connections: int = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+    llm_keepalive_expiry: float = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))  # Seconds
+    llm_timeout: float = float(os.getenv("LLM_TIMEOUT", "600"))  # Seconds
+    parallel_retrieval: bool = os.getenv("PARALLEL_RETRIEVAL", "True").lower() in ("true", "1", "t")
+    cache_dir: str = os.getenv("CACHE_DIR", ".cache")
+    cache_ttl: float = float(os.getenv("CACHE_TTL", str(7 * 24 * 3600)))  # Seconds
+    cache_max_entries: int = int(os.getenv("CACHE_MAX_ENTRIES", "1000"))  # Per cache namespace
+    preference_cache: bool = os.getenv("PREFERENCE_CACHE", "True").lower() in ("true", "1", "t")
+    # Personal data files larger than this are streamed record by record, packed into chunks of at most
+    # ingestion_chunk_tokens and summarized with map-reduce: ingestion_map_window chunks are mapped at
+    # once and ingestion_reduce_fan_in partial summaries are merged per step
+    ingestion_stream_threshold: int = int(os.getenv("INGESTION_STREAM_THRESHOLD", "10240"))  # Bytes
+    ingestion_chunk_tokens: int = int(os.getenv("INGESTION_CHUNK_TOKENS", "6000"))
+    ingestion_map_window: int = int(os.getenv("INGESTION_MAP_WINDOW", "8"))
+    ingestion_reduce_fan_in: int = int(os.getenv("INGESTION_REDUCE_FAN_IN", "4"))
+    # Chat histories (conversation and AI interaction data) are digested bottom-up: leaves of about
+    # summary_fan_in sessions in time order, up to summary_leaf_tokens, are summarized, then merged about
+    # summary_fan_in at a time, every node cached by content. Merged per-file preferences over personal_preferences_max_tokens are merged the same way
+    summary_cache: bool = os.getenv("SUMMARY_CACHE", "True").lower() in ("true", "1", "t")
+    summary_leaf_tokens: int = int(os.getenv("SUMMARY_LEAF_TOKENS", "2000"))
+    summary_fan_in: int = int(os.getenv("SUMMARY_FAN_IN", "4"))
+    personal_preferences_max_tokens: int = int(os.getenv("PERSONAL_PREFERENCES_MAX_TOKENS", "1000"))
+    # Personal context of agent prompts: "index" retrieves the chunks of the user's data most relevant to the
+    # task and latest message from a local vector index, "summary" summarizes every data file with the LLM
+    personal_context: str = os.getenv("PERSONAL_CONTEXT", "index")
+    personal_context_top_k: int = int(os.getenv("PERSONAL_CONTEXT_TOP_K", "5"))
+    personal_context_max_chars: int = int(os.getenv("PERSONAL_CONTEXT_MAX_CHARS", "3000"))
+    # Vector index: hashing embedding size, chunk size, and IVF lists (0 searches every chunk) and lists probed
+    personal_index_dim: int = int(os.getenv("PERSONAL_INDEX_DIM", "4096"))
+    personal_index_chunk_chars: int = int(os.getenv("PERSONAL_INDEX_CHUNK_CHARS", "1200"))
+    personal_index_ivf_lists: int = int(os.getenv("PERSONAL_INDEX_IVF_LISTS", "0"))
+    personal_index_n_probe: int = int(os.getenv("PERSONAL_INDEX_N_PROBE", "4"))
+    # Health findings (flags, changes and averages computed from the health data) given to the Health AI
+    # instead of the raw data; sleep, exercise and nutrition are averaged over health_rolling_days
+    health_findings: bool = os.getenv("HEALTH_FINDINGS", "True").lower() in ("true", "1", "t")
+    health_rolling_days: int = int(os.getenv("HEALTH_ROLLING_DAYS", "7"))
+    # Purchased products added to health queries: JSON file of symptom -> product categories, and size limits
+    symptom_taxonomy_file: Optional[str] = os.getenv("SYMPTOM_TAXONOMY_FILE")
+    purchase_context_top_k: int = int(os.getenv("PURCHASE_CONTEXT_TOP_K", "5"))
+    purchase_context_max_chars: int = int(os.getenv("PURCHASE_CONTEXT_MAX_CHARS", "1000"))
+    # LLM response cache: exact-match LRU (persisted under cache_dir), plus an optional semantic tier
+    # that reuses the reply to a near-duplicate user question, for calls that opt in (semantic_cache_key)
+    response_cache: bool = os.getenv("RESPONSE_CACHE", "True").lower() in ("true", "1", "t")
+    response_cache_max_entries: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+    response_cache_persist: bool = os.getenv("RESPONSE_CACHE_PERSIST", "True").lower() in ("true", "1", "t")
+    response_cache_semantic: bool = os.getenv("RESPONSE_CACHE_SEMANTIC", "False").lower() in ("true", "1", "t")
+    response_cache_similarity_threshold: float = float(os.getenv("RESPONSE_CACHE_SIMILARITY_THRESHOLD", "0.95"))
+    response_cache_embedding_model: str = os.getenv("RESPONSE_CACHE_EMBEDDING_MODEL", "text-embedding-3-small")
+    # How agent replies are rendered: "instant" (whole reply at once), "paced" (word by word with
+    # artificial delays, for demos) or "stream" (token by token as the LLM generates it)
+    render_mode: Literal["instant", "paced", "stream"] = os.getenv("RENDER_MODE", "instant")
+    # Chat-state detection: conversations end once an agent's history reaches this many messages,
+    # and the local farewell classifier can be enabled to settle more turns without an LLM call
+    chat_max_history_messages: int = int(os.getenv("CHAT_MAX_HISTORY_MESSAGES", "80"))
+    chat_state_local_classifier: bool = os.getenv("CHAT_STATE_LOCAL_CLASSIFIER", "False").lower() in ("true", "1", "t")
+    # Personal AI replies: candidates generated and validated in parallel per turn (1 generates and
+    # validates one response at a time), and a cap on the LLM calls a single turn may make
+    personal_ai_response_candidates: int = int(os.getenv("PERSONAL_AI_RESPONSE_CANDIDATES", "1"))
+    personal_ai_max_llm_calls_per_turn: int = int(os.getenv("PERSONAL_AI_MAX_LLM_CALLS_PER_TURN", "10"))
+    # Concurrent chat sessions: sessions running at once, and sessions allowed to wait for a worker
+    max_concurrent_sessions: int = int(os.getenv("MAX_CONCURRENT_SESSIONS", "32"))
+    max_pending_sessions: int = int(os.getenv("MAX_PENDING_SESSIONS", "256"))
+    # Offline "replay:<model>" LLM backend: recorded responses, record mode and synthetic latency
+    replay_cassette_dir: str = os.getenv("REPLAY_CASSETTE_DIR", "cassettes")
+    replay_mode: str = os.getenv("REPLAY_MODE", "replay")  # "replay" or "record"
+    replay_latency: str = os.getenv("REPLAY_LATENCY", "lognormal:0.8:0.5")  # See LatencyModel
+    # Tracing of sessions, turns, agent methods and LLM calls; spans are appended to trace_file (OTLP/JSON lines) if set
+    tracing: bool = os.getenv("TRACING", "True").lower() in ("true", "1", "t")
+    trace_file: Optional[str] = os.getenv("TRACE_FILE")
 
     class Config:
         env_file = ".env"
@@ -27,16 +108,42 @@ def get_settings() -> Settings:
 
 
 def setup_streamlit():
+    # Imported here so headless runs don't need Streamlit
+    import streamlit as st
+
     # Streamlit page config
     st.set_page_config(page_title="PIN AI Agent Marketplace", page_icon="🤖")
     st.title("🤖 PIN AI Agent Marketplace")
     st.caption("An example of two-way agent-to-agent chat to complete a task")
 
 
+# Pause between the messages of a live consultation in paced render mode
+PACED_MESSAGE_PAUSE = 0.5
+
+
 # Streamed response emulator
-def response_generator(response):
+def response_generator(response, render_mode: Optional[str] = None):
+    render_mode = render_mode or get_settings().render_mode
+    if render_mode != "paced":
+        # Nothing to wait for, render the whole response at once
+        yield response
+        return
+
     # Split response into words while preserving whitespace and newlines
     words = re.split(r'(\s+)', response)
     for word in words:
         yield word
         time.sleep(0.01) 
+
+
+def reply_generator(agent, message, sender, render_mode: Optional[str] = None):
+    """
+    Generate an agent's reply to a message for st.write_stream according to the render mode.
+    The complete reply is stored in agent.last_message once the generator is exhausted.
+    """
+    render_mode = render_mode or get_settings().render_mode
+    if render_mode == "stream":
+        yield from agent.stream_message(message, sender)
+    else:
+        agent.last_message = agent.on_message(message, sender)
+        yield from response_generator(agent.last_message.content, render_mode)
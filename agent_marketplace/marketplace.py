@@ -1,15 +1,17 @@
-from datetime import datetime
-
-import streamlit as st
+from concurrent.futures import Future
+from typing import List, Tuple
 
 from agent_marketplace.agents.ai_agent import AI_Agent
-from agent_marketplace.schemas.agents import Message
-from agent_marketplace.config import response_generator, setup_streamlit
+from agent_marketplace.services.events import ConsoleSink, EventBus, StreamlitSink
+from agent_marketplace.sessions import ChatSession, SessionEngine
 
 class AgentMarketplace:
-    def __init__(self):
+    def __init__(self, events: EventBus = None):
         self.agents: dict[str, AI_Agent] = {}
         self.max_chat_round = 40  # Maximum number of rounds for the chat
+        # Where headless sessions publish their events, nowhere by default
+        self.events = events or EventBus()
+        self._session_engine: SessionEngine = None
         
     def add_agent(self, agent: AI_Agent) -> None:
         self.agents[agent.name] = agent
@@ -20,103 +22,51 @@ class AgentMarketplace:
     def get_agent(self, agent_name: str) -> AI_Agent:
         return self.agents[agent_name]
     
-    def list_agents(self) -> list[str]:
+    def list_agents(self) -> List[str]:
         return list(self.agents.keys())
-    
-    def start_agent_chat(self, agent_name_1: str, agent_name_2: str, return_messages: bool = False):
-        print("\n" + "="*80)
-        print("🤖 Agent-to-Agent Chat 🤖".center(80))
-        print("="*80 + "\n")
-
-        # Setup streamlit
-        setup_streamlit()
-
-        # Create agents
-        agent_1 = self.agents[agent_name_1]
-        agent_2 = self.agents[agent_name_2]
-
-        # Initialize message list if returning messages
-        all_messages = []
 
-        print("\n" + "-"*80)
-        print(f"Creating agents: \033[1;34m{agent_1.name}\033[0m and \033[1;32m{agent_2.name}\033[0m")
-        print("-"*80 + "\n")
-        with st.chat_message("user"):
-            st.write_stream(
-            response_generator(f"Hi :blue[**{agent_1.owner}**], I am your personal AI and I am here to help you with your task.")
-            )
-            st.write_stream(
-                response_generator(f'📝 Task: :blue[**"{agent_1.user_intent}"**]')
-            )
-            st.write_stream(
-                response_generator(f"🤖 Service Agent: :violet[**{agent_2.name}**]")
-            )
+    @property
+    def session_engine(self) -> SessionEngine:
+        """Engine running headless sessions, created on first use"""
+        if self._session_engine is None:
+            self._session_engine = SessionEngine(max_chat_round=self.max_chat_round, events=self.events)
+        return self._session_engine
 
-        # Initialize chat
-        print("\n" + "-"*80)
-        print(f"Initializing chat for \033[1;34m{agent_1.name}\033[0m and \033[1;32m{agent_2.name}\033[0m")
-        print("-"*80 + "\n")
-        agent_1.init_chat(guest_agent=agent_2)
-        agent_2.init_chat(guest_agent=agent_1)
+    def submit_session(self, agent_name_1: str, agent_name_2: str, session_id: str = None,
+                       block: bool = True) -> "Future[ChatSession]":
+        """Start a headless chat between two registered agents without waiting for it to finish"""
+        return self.session_engine.submit(self.agents[agent_name_1], self.agents[agent_name_2],
+                                          session_id=session_id, block=block)
 
-        # Agent 1 initiate the conversation
-        sender = agent_1
-        sender_message = agent_1.on_message(  # Agent 1 generates the first message
-            Message(role="user", content="", sender=agent_1.name, receiver=agent_2.name, timestamp=datetime.now()), 
-            sender=agent_2
-        )  
-        print(f"\033[1;34m{agent_1.name}\033[0m:\n\n{sender_message.content}") 
-        print("\n" + "-"*100 + "\n")
-        st.chat_message("user").write_stream(
-                response_generator(f"**[💬 Start to chat with 🤖 :violet[{agent_2.name}]]**")
-            )
-        st.chat_message("user").write_stream(response_generator(sender_message.content))
-        
-        # Add first message to list if returning messages
-        if return_messages:
-            all_messages.append({
-                "sender": sender_message.sender,
-                "content": sender_message.content,
-                "timestamp": sender_message.timestamp.isoformat() if hasattr(sender_message.timestamp, 'isoformat') else str(sender_message.timestamp)
-            })
-                
-        # Conversation loop starts
-        receiver = agent_2
-        round = 0
-        while round < self.max_chat_round:
-            response = receiver.on_message(sender_message, sender=sender)
-            if receiver == agent_1:
-                print(f"\033[1;34m{receiver.name}\033[0m:\n\n{response.content}")
-                print("\n" + "-"*100 + "\n")
-                st.chat_message("user").write_stream(response_generator(response.content))
-            else:
-                print(f"\033[1;32m{receiver.name}\033[0m:\n\n{response.content}")
-                print("\n" + "-"*100 + "\n")
-                st.chat_message("assistant").write_stream(response_generator(response.content))
-            
-            # Add message to list if returning messages
-            if return_messages:
-                all_messages.append({
-                    "sender": response.sender,
-                    "content": response.content,
-                    "timestamp": response.timestamp.isoformat() if hasattr(response.timestamp, 'isoformat') else str(response.timestamp)
-                })
-            
-            sender = agent_1 if sender == agent_2 else agent_2
-            sender_message = response
+    def run_sessions(self, agent_name_pairs: List[Tuple[str, str]]) -> List[ChatSession]:
+        """Run headless chats for many pairs of registered agents concurrently, returned in order"""
+        return self.session_engine.run_sessions(
+            (self.agents[agent_name_1], self.agents[agent_name_2]) for agent_name_1, agent_name_2 in agent_name_pairs
+        )
+    
+    def start_agent_chat(self, agent_name_1: str, agent_name_2: str, return_messages: bool = False,
+                         events: EventBus = None):
+        """
+        Run a chat between two registered agents on the agents themselves
 
-            receiver = agent_1 if sender == agent_2 else agent_2
+        Args:
+            agent_name_1 (str): Name of the personal AI, which opens the conversation
+            agent_name_2 (str): Name of the service agent
+            return_messages (bool, optional): Return the messages of the conversation
+            events (EventBus, optional): Where the conversation is rendered, defaults to the
+                Streamlit app and the console
 
-            if agent_1.task_complete and agent_2.task_complete:
-                break
+        Returns:
+            list[dict]: The messages, if return_messages is set
+        """
+        if events is None:
+            events = EventBus([StreamlitSink(), ConsoleSink()])
+        session = ChatSession(self.agents[agent_name_1], self.agents[agent_name_2], max_chat_round=self.max_chat_round,
+                              events=events, new_session=False)
+        session.run()
+        if session.error is not None:
+            raise session.error
 
-            round += 1
-        
-        if round >= self.max_chat_round:
-            print("Communication is not completed within the maximum number of rounds.")
-        else:
-            print("Communication ends successfully.")
-        
         # Return all messages if requested
         if return_messages:
-            return all_messages
+            return session.message_dicts()
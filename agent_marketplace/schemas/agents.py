@@ -1,4 +1,5 @@
 from datetime import datetime
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -8,7 +9,7 @@ class Message(BaseModel):
     sender: str
     receiver: str
     timestamp: datetime
-    metadata: dict | None = None
+    metadata: Optional[dict] = None
 
 class Context(BaseModel):
-    history: list[Message]
\ No newline at end of file
+    history: List[Message]
\ No newline at end of file
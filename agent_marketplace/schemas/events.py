@@ -0,0 +1,59 @@
+from datetime import datetime
+from typing import Literal, Optional
+
+from pydantic import BaseModel, Field
+
+class ChatEvent(BaseModel):
+    type: str
+    session_id: Optional[str] = None
+    timestamp: datetime = Field(default_factory=datetime.now)
+
+class ChatStarted(ChatEvent):
+    type: Literal["chat_started"] = "chat_started"
+    personal_ai: str
+    service_agent: str
+    owner: str
+    user_intent: str = ""
+
+class StatusUpdate(ChatEvent):
+    # Progress of an agent or tool outside the conversation itself, e.g. data retrieval or payment.
+    # Consecutive updates with the same section belong together (one chat bubble in the UI).
+    type: Literal["status_update"] = "status_update"
+    agent: str
+    section: str
+    text: str
+    detail: Optional[str] = None
+    level: Literal["info", "error"] = "info"
+
+class TurnStarted(ChatEvent):
+    type: Literal["turn_started"] = "turn_started"
+    turn: int  # Number of messages sent so far in the conversation
+    agent: str  # Agent about to reply
+    receiver: str
+
+class MessageSent(ChatEvent):
+    type: Literal["message_sent"] = "message_sent"
+    sender: str
+    receiver: str
+    content: str
+    side: Literal["user", "assistant"]  # Side of the chat the message is shown on
+    streamed: bool = False  # Already rendered live by a streaming sink
+
+class ToolCalled(ChatEvent):
+    type: Literal["tool_called"] = "tool_called"
+    agent: str
+    tool: str
+    arguments: str
+    result: str
+
+class StateChanged(ChatEvent):
+    type: Literal["state_changed"] = "state_changed"
+    agent: str
+    task_complete: bool
+
+class ChatFinished(ChatEvent):
+    type: Literal["chat_finished"] = "chat_finished"
+    status: str
+    rounds: int
+    messages: int
+    trace_summary: Optional[dict] = None  # See tracing.summarize_trace, when tracing is enabled
@@ -0,0 +1,48 @@
+from typing import Dict, List, Optional, Union
+
+from pydantic import BaseModel, ConfigDict, Field
+
+class PersonalDataModel(BaseModel):
+    # Personal data files use camelCase keys
+    model_config = ConfigDict(populate_by_name=True)
+
+class Measurement(PersonalDataModel):
+    value: Optional[Union[int, float, str]] = None
+    unit: Optional[str] = None
+    normal_range: Optional[str] = Field(None, alias="normalRange")
+    status: Optional[str] = None
+
+class BloodTest(PersonalDataModel):
+    date: str
+    results: Dict[str, Measurement] = {}
+
+class BloodPressure(PersonalDataModel):
+    systolic: Optional[Union[int, float]] = None
+    diastolic: Optional[Union[int, float]] = None
+    status: Optional[str] = None
+
+class Vitals(PersonalDataModel):
+    date: str
+    blood_pressure: Optional[BloodPressure] = Field(None, alias="bloodPressure")
+    heart_rate: Optional[Measurement] = Field(None, alias="heartRate")
+    oxygen_saturation: Optional[Measurement] = Field(None, alias="oxygenSaturation")
+    temperature: Optional[Measurement] = None
+
+class Medication(PersonalDataModel):
+    name: str
+    dosage: Optional[str] = None
+    frequency: Optional[str] = None
+    purpose: Optional[str] = None
+    start_date: Optional[str] = Field(None, alias="startDate")
+
+class Product(PersonalDataModel):
+    title: str
+    description: str = ""
+    brand: Optional[str] = None
+    categories: List[str] = []
+
+class Purchase(PersonalDataModel):
+    # One shopping session and the products bought in it
+    session: Optional[str] = None
+    time: Optional[str] = None
+    products: List[Product] = Field([], alias="purchase_history")
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from agent_marketplace.config import get_settings
+
+
+def hash_key(*parts: Any) -> str:
+    """
+    Build a content-addressed cache key from arbitrary JSON-serializable parts
+
+    Args:
+        *parts: Values that together identify the cached item (file contents, prompts, model, ...)
+
+    Returns:
+        str: Hex SHA-256 digest of the parts
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, bytes):
+            digest.update(part)
+        elif isinstance(part, str):
+            digest.update(part.encode("utf-8"))
+        else:
+            digest.update(json.dumps(part, sort_keys=True, default=str).encode("utf-8"))
+        # Separator so ("ab", "c") and ("a", "bc") hash differently
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class JSONDiskCache:
+    """
+    Directory of JSON blobs, one file per key, with TTL and least recently used eviction.
+
+    Entries survive process restarts, so anything expensive to recompute (LLM summaries) can be
+    reused across sessions as long as the key captures everything the value depends on. A file's
+    mtime is its write time (for the TTL) and its atime the last hit (for LRU eviction). Writes keep
+    a running entry count and only scan the directory when it exceeds max_entries, or every
+    EVICT_INTERVAL writes to drop expired entries and resync the count with other processes.
+    """
+    EVICT_INTERVAL = 100
+    # Eviction trims the cache this far below max_entries, so it does not rescan on every next write
+    EVICT_HEADROOM = 0.1
+
+    def __init__(self, directory: str, ttl: Optional[float] = None, max_entries: Optional[int] = None):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._entries: Optional[int] = None  # Unknown until the first scan
+        self._writes = 0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Return the cached value for key, or None if it is missing or expired"""
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self._misses += 1
+            return None
+
+        if self.ttl is not None and time.time() - entry.get("created_at", 0) > self.ttl:
+            self._remove(path)
+            with self._lock:
+                self._misses += 1
+                self._evictions += 1
+                if self._entries:
+                    self._entries -= 1
+            return None
+
+        self._touch(path)
+        with self._lock:
+            self._hits += 1
+        return entry.get("value")
+
+    @staticmethod
+    def _touch(path: str) -> None:
+        """Mark an entry as just used (atime) and keep its write time (mtime)"""
+        try:
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+        except OSError:
+            pass
+
+    def set(self, key: str, value: Any) -> None:
+        """Store a JSON-serializable value under key and evict entries once over the size limit"""
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"created_at": time.time(), "value": value}, f)
+        is_new = not os.path.exists(path)
+        # Atomic rename so concurrent readers never see a partial blob
+        os.replace(tmp_path, path)
+        if self.ttl is None and self.max_entries is None:
+            return
+
+        with self._lock:
+            self._writes += 1
+            if self._entries is not None and is_new:
+                self._entries += 1
+            needs_eviction = (self._entries is None or self._writes % self.EVICT_INTERVAL == 0
+                              or (self.max_entries is not None and self._entries > self.max_entries))
+        if needs_eviction:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Remove expired entries, then the least recently used entries beyond max_entries
+        (down to EVICT_HEADROOM below it)
+
+        Returns:
+            int: Number of entries removed
+        """
+        entries = []
+        for file in os.listdir(self.directory):
+            if file.endswith(".json"):
+                path = os.path.join(self.directory, file)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, max(stat.st_atime, stat.st_mtime), path))
+
+        now = time.time()
+        removed = {path for mtime, _, path in entries if self.ttl is not None and now - mtime > self.ttl}
+        alive = sorted((used, path) for _, used, path in entries if path not in removed)
+        if self.max_entries is not None and len(alive) > self.max_entries:
+            keep = self.max_entries - int(self.max_entries * self.EVICT_HEADROOM)
+            removed.update(path for _, path in alive[:len(alive) - keep])
+
+        for path in removed:
+            self._remove(path)
+        with self._lock:
+            self._evictions += len(removed)
+            self._entries = len(entries) - len(removed)
+        return len(removed)
+
+    def clear(self) -> None:
+        for file in os.listdir(self.directory):
+            if file.endswith(".json"):
+                self._remove(os.path.join(self.directory, file))
+        with self._lock:
+            self._entries = 0
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit/miss/eviction counters and the current on-disk footprint"""
+        files = [os.path.join(self.directory, f) for f in os.listdir(self.directory) if f.endswith(".json")]
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": self._hits / lookups if lookups else 0.0,
+                "evictions": self._evictions,
+                "entries": len(files),
+                "size_bytes": sum(os.path.getsize(f) for f in files if os.path.exists(f)),
+            }
+
+
+@lru_cache()
+def get_disk_cache(namespace: str) -> JSONDiskCache:
+    """Return the process-wide disk cache for a namespace, stored under Settings.cache_dir"""
+    settings = get_settings()
+    return JSONDiskCache(
+        os.path.join(settings.cache_dir, namespace),
+        ttl=settings.cache_ttl,
+        max_entries=settings.cache_max_entries,
+    )
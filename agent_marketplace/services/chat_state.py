@@ -0,0 +1,136 @@
+import re
+import threading
+from typing import Callable, Dict, List, Optional
+
+from agent_marketplace.config import get_settings
+from agent_marketplace.schemas.agents import Message
+
+CONTINUE = "[CONTINUE]"
+CONVERSATION_ENDS = "[CONVERSATION_ENDS]"
+
+# Tokens that mean the task is over as soon as they appear in the conversation
+END_SENTINELS = ["[PAYMENT_SUCCEEDED]", "[CONVERSATION_ENDS]"]
+
+FAREWELL_PATTERN = re.compile(
+    r"\b(goodbye|bye|have a (great|nice|good|wonderful) (day|evening|week)|take care|"
+    r"thanks? (you )?(so much )?for (your|the) help|that'?s all)\b",
+    re.IGNORECASE,
+)
+
+
+def farewell_classifier(history: List[Message]) -> Optional[str]:
+    """
+    Small local chat-state classifier: a farewell without a pending question ends the chat.
+    Returns None when it is not confident, so the next tier decides.
+    """
+    if not history:
+        return None
+    last_message = history[-1].content.strip()
+    if FAREWELL_PATTERN.search(last_message) and "?" not in last_message:
+        return CONVERSATION_ENDS
+    return None
+
+
+class ChatStateClassifier:
+    """
+    Decides whether a conversation continues ([CONTINUE]) or is finished ([CONVERSATION_ENDS]).
+
+    Tiers are tried from cheapest to most expensive: deterministic rules, then an optional local
+    classifier, and the LLM only when neither is confident. Counters record how often each tier
+    made the decision.
+    """
+    def __init__(self, max_history_messages: Optional[int] = None, min_history_messages: int = 2,
+                 history_window: int = 10, min_repeated_message_chars: int = 20,
+                 local_classifier: Optional[Callable[[List[Message]], Optional[str]]] = None):
+        self.max_history_messages = max_history_messages
+        self.min_history_messages = min_history_messages
+        self.history_window = history_window
+        self.min_repeated_message_chars = min_repeated_message_chars
+        self.local_classifier = local_classifier
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {"rules": 0, "local": 0, "llm": 0}
+
+    def apply_rules(self, history: List[Message]) -> Optional[str]:
+        """Deterministic rules; returns None when they don't settle the state"""
+        recent = history[-self.history_window:]
+
+        # Sentinel tokens
+        if any(sentinel in msg.content for msg in recent for sentinel in END_SENTINELS):
+            return CONVERSATION_ENDS
+
+        # Turn budget
+        if self.max_history_messages is not None and len(history) >= self.max_history_messages:
+            return CONVERSATION_ENDS
+
+        # Repeated message: a participant sending the same substantial message twice in a row means the
+        # chat is looping. Short replies such as "Yes" or "Sounds good" are often repeated legitimately
+        if recent and len(recent[-1].content.strip()) >= self.min_repeated_message_chars:
+            last = recent[-1]
+            previous = next((msg for msg in reversed(recent[:-1]) if msg.sender == last.sender), None)
+            if previous is not None and previous.content.strip() == last.content.strip():
+                return CONVERSATION_ENDS
+
+        # The conversation has barely started, or someone is waiting for an answer
+        if len(history) < self.min_history_messages:
+            return CONTINUE
+        if recent[-1].content.rstrip().endswith("?"):
+            return CONTINUE
+        return None
+
+    def classify_without_llm(self, history: List[Message]) -> Optional[str]:
+        """Run the rule and local classifier tiers; returns None if the LLM has to decide"""
+        state = self.apply_rules(history)
+        if state is not None:
+            self._count("rules")
+            return state
+        if self.local_classifier is not None:
+            state = self.local_classifier(history)
+            if state is not None:
+                self._count("local")
+                return state
+        return None
+
+    def record_llm_decision(self) -> None:
+        """Count a decision made by the LLM tier, for callers that batch the LLM call themselves"""
+        self._count("llm")
+
+    def classify(self, history: List[Message], llm_call: Callable[[], dict]) -> str:
+        """
+        Decide the chat state, calling the LLM only as the last resort
+
+        Args:
+            history (List[Message]): Conversation history
+            llm_call (Callable[[], dict]): Runs the LLM chat-state check and returns its response
+
+        Returns:
+            str: [CONTINUE] or [CONVERSATION_ENDS]
+        """
+        state = self.classify_without_llm(history)
+        if state is not None:
+            return state
+        self.record_llm_decision()
+        return llm_call()["content"]
+
+    def _count(self, tier: str) -> None:
+        with self._lock:
+            self.counters[tier] += 1
+
+    def stats(self) -> Dict[str, float]:
+        """Return how many decisions each tier made and the share that avoided an LLM call"""
+        with self._lock:
+            total = sum(self.counters.values())
+            return {
+                **self.counters,
+                "total": total,
+                "llm_avoided_rate": (total - self.counters["llm"]) / total if total else 0.0,
+            }
+
+
+def create_chat_state_classifier(model_config: dict) -> ChatStateClassifier:
+    """Create a chat-state classifier configured from an agent's model_config, falling back to Settings"""
+    settings = get_settings()
+    use_local_classifier = model_config.get("chat_state_local_classifier", settings.chat_state_local_classifier)
+    return ChatStateClassifier(
+        max_history_messages=model_config.get("chat_max_history_messages", settings.chat_max_history_messages),
+        local_classifier=farewell_classifier if use_local_classifier else None,
+    )
@@ -0,0 +1,64 @@
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional
+
+
+class ContextWindow(NamedTuple):
+    messages: List[Dict[str, str]]  # Messages that fit the budget, in chronological order
+    tokens_used: int  # Tokens used by the kept messages, including the reply priming
+    dropped: int  # Number of history messages left out
+
+
+def fit_context_window(messages: List[Dict[str, str]], max_tokens: int,
+                       count_message: Callable[[Dict[str, str]], int],
+                       pinned: Optional[Iterable[int]] = None,
+                       reply_tokens: int = 2) -> ContextWindow:
+    """
+    Select the most recent messages that fit in a token budget, in a single pass
+
+    System prompts, the latest user turn and tool results are always kept. The remaining history is
+    walked once from newest to oldest and kept while it fits, so the window is a contiguous run of
+    the latest turns. A kept run never starts with an assistant reply whose user turn was dropped.
+
+    Args:
+        messages (List[Dict[str, str]]): Chat messages in chronological order
+        max_tokens (int): Token budget for the whole request
+        count_message (Callable): Returns the token count of one message
+        pinned (Iterable[int], optional): Extra message indices that must always be kept
+        reply_tokens (int, optional): Tokens reserved for priming the reply
+
+    Returns:
+        ContextWindow: The kept messages, the tokens they use and how many messages were dropped
+    """
+    keep = [False] * len(messages)
+    for index in pinned or ():
+        keep[index] = True
+    last_user = None
+    for index, msg in enumerate(messages):
+        if msg["role"] in ("system", "tool"):
+            keep[index] = True
+        elif msg["role"] == "user":
+            last_user = index
+    if last_user is not None:
+        keep[last_user] = True
+
+    counts = [count_message(msg) for msg in messages]
+    tokens_used = reply_tokens + sum(count for count, kept in zip(counts, keep) if kept)
+
+    # Walk the history once from newest to oldest, stopping at the first message that doesn't fit
+    oldest_kept = None
+    for index in range(len(messages) - 1, -1, -1):
+        if keep[index]:
+            continue
+        if tokens_used + counts[index] > max_tokens:
+            break
+        keep[index] = True
+        tokens_used += counts[index]
+        oldest_kept = index
+
+    # Keep user/assistant alternation: drop a reply whose prompting user turn didn't fit
+    if oldest_kept is not None and oldest_kept > 0 and messages[oldest_kept]["role"] == "assistant" \
+            and not (keep[oldest_kept - 1] and messages[oldest_kept - 1]["role"] == "user"):
+        keep[oldest_kept] = False
+        tokens_used -= counts[oldest_kept]
+
+    window = [msg for msg, kept in zip(messages, keep) if kept]
+    return ContextWindow(messages=window, tokens_used=tokens_used, dropped=len(messages) - len(window))
@@ -0,0 +1,205 @@
+import re
+import queue
+import threading
+from typing import Iterable, Iterator, List, Optional
+
+from agent_marketplace.config import response_generator, setup_streamlit
+from agent_marketplace.schemas.events import (
+    ChatEvent, ChatFinished, ChatStarted, MessageSent, StatusUpdate, ToolCalled, TurnStarted
+)
+from agent_marketplace.services.tracing import format_trace_summary
+
+
+class EventSink:
+    """Receives the events published on an EventBus"""
+    # Sinks that render a reply's text deltas live (see EventBus.stream_sink)
+    renders_streams = False
+
+    def handle(self, event: ChatEvent) -> None:
+        raise NotImplementedError("Subclasses must implement this method")
+
+    def render_stream(self, deltas: Iterator[str], side: str) -> None:
+        raise NotImplementedError("Only sinks with renders_streams = True render streams")
+
+    def close(self) -> None:
+        pass
+
+
+class NullSink(EventSink):
+    """Discards every event"""
+    def handle(self, event: ChatEvent) -> None:
+        pass
+
+
+def strip_markdown(text: str) -> str:
+    """Remove the Streamlit markdown (bold, :color[...]) used in status texts, for plain-text sinks"""
+    text = re.sub(r":[a-z]+\[(.*?)\]", r"\1", text)
+    return text.replace("**", "")
+
+
+class ConsoleSink(EventSink):
+    """Prints the conversation to the terminal with ANSI colors"""
+    def handle(self, event: ChatEvent) -> None:
+        if isinstance(event, ChatStarted):
+            print("\n" + "="*80)
+            print("🤖 Agent-to-Agent Chat 🤖".center(80))
+            print("="*80 + "\n")
+            print("\n" + "-"*80)
+            print(f"Creating agents: \033[1;34m{event.personal_ai}\033[0m and \033[1;32m{event.service_agent}\033[0m")
+            print("-"*80 + "\n")
+            print("\n" + "-"*80)
+            print(f"Initializing chat for \033[1;34m{event.personal_ai}\033[0m and \033[1;32m{event.service_agent}\033[0m")
+            print("-"*80 + "\n")
+        elif isinstance(event, StatusUpdate):
+            color = "\033[1;31m" if event.level == "error" else "\033[1;33m"
+            print(f"{color}[{event.agent}]\033[0m {strip_markdown(event.text)}")
+        elif isinstance(event, MessageSent):
+            color = "\033[1;34m" if event.side == "user" else "\033[1;32m"
+            print(f"{color}{event.sender}\033[0m:\n\n{event.content}")
+            print("\n" + "-"*100 + "\n")
+        elif isinstance(event, ToolCalled):
+            print(f"\033[1;35m[{event.tool}]\033[0m {event.result}")
+        elif isinstance(event, ChatFinished):
+            if event.status == "max_rounds":
+                print("Communication is not completed within the maximum number of rounds.")
+            elif event.status == "failed":
+                print("Communication failed.")
+            else:
+                print("Communication ends successfully.")
+            if event.trace_summary:
+                print(format_trace_summary(event.trace_summary))
+
+
+class JSONLSink(EventSink):
+    """Appends every event as one JSON line to a file, e.g. for batch runs and later analysis"""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def handle(self, event: ChatEvent) -> None:
+        line = event.model_dump_json()
+        with self._lock:
+            self._file.write(line + "\n")
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+
+class StreamlitSink(EventSink):
+    """
+    Renders the conversation into the Streamlit app. Has to run on the script thread, so it is
+    never wrapped in a BackgroundSink. Consecutive status updates of the same section share one
+    chat bubble.
+    """
+    renders_streams = True
+
+    def __init__(self, setup_page: bool = True):
+        import streamlit as st
+
+        self.st = st
+        self.setup_page = setup_page
+        self._section = None
+        self._section_container = None
+
+    def handle(self, event: ChatEvent) -> None:
+        st = self.st
+        if not isinstance(event, StatusUpdate):
+            self._section = self._section_container = None
+
+        if isinstance(event, ChatStarted):
+            if self.setup_page:
+                setup_streamlit()
+            with st.chat_message("user"):
+                st.write_stream(response_generator(
+                    f"Hi :blue[**{event.owner}**], I am your personal AI and I am here to help you with your task."
+                ))
+                st.write_stream(response_generator(f'📝 Task: :blue[**"{event.user_intent}"**]'))
+                st.write_stream(response_generator(f"🤖 Service Agent: :violet[**{event.service_agent}**]"))
+        elif isinstance(event, StatusUpdate):
+            if (event.agent, event.section) != self._section:
+                self._section = (event.agent, event.section)
+                self._section_container = st.chat_message("user")
+            with self._section_container:
+                st.write_stream(response_generator(event.text))
+                if event.detail:
+                    st.write_stream(response_generator(event.detail))
+        elif isinstance(event, TurnStarted) and event.turn == 0:
+            st.chat_message("user").write_stream(
+                response_generator(f"**[💬 Start to chat with 🤖 :violet[{event.receiver}]]**")
+            )
+        elif isinstance(event, MessageSent) and not event.streamed:
+            st.chat_message(event.side).write_stream(response_generator(event.content))
+
+    def render_stream(self, deltas: Iterator[str], side: str) -> None:
+        self._section = self._section_container = None
+        self.st.chat_message(side).write_stream(deltas)
+
+
+class BackgroundSink(EventSink):
+    """
+    Hands events to another sink on a worker thread, so slow sinks (console, files) stay off the
+    conversation's hot path. The queue is bounded: if the sink falls behind, publishing blocks
+    instead of buffering without limit. close() flushes the queue and closes the wrapped sink.
+    """
+    _closed = object()
+
+    def __init__(self, sink: EventSink, max_queue: int = 10000):
+        self.sink = sink
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue)
+        self._thread = threading.Thread(target=self._run, name=f"event-sink-{type(sink).__name__}", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            event = self._queue.get()
+            if event is self._closed:
+                break
+            try:
+                self.sink.handle(event)
+            except Exception as e:
+                print(f"Error in event sink {type(self.sink).__name__}: {str(e)}")
+
+    def handle(self, event: ChatEvent) -> None:
+        self._queue.put(event)
+
+    def close(self) -> None:
+        self._queue.put(self._closed)
+        self._thread.join()
+        self.sink.close()
+
+
+class EventBus:
+    """
+    Publishes typed chat events (see agent_marketplace.schemas.events) to subscribed sinks.
+
+    A bus without sinks costs next to nothing, so agents can always publish. bind() returns a bus
+    sharing the same sinks that stamps every event with a session id.
+    """
+    def __init__(self, sinks: Optional[Iterable[EventSink]] = None, session_id: Optional[str] = None):
+        self.sinks: List[EventSink] = list(sinks or [])
+        self.session_id = session_id
+
+    def subscribe(self, sink: EventSink) -> None:
+        self.sinks.append(sink)
+
+    def bind(self, session_id: str) -> "EventBus":
+        return EventBus(self.sinks, session_id)
+
+    @property
+    def stream_sink(self) -> Optional[EventSink]:
+        """The sink that renders replies live as they stream, if any"""
+        return next((sink for sink in self.sinks if sink.renders_streams), None)
+
+    def publish(self, event: ChatEvent) -> None:
+        if not self.sinks:
+            return
+        if event.session_id is None:
+            event.session_id = self.session_id
+        for sink in self.sinks:
+            sink.handle(event)
+
+    def close(self) -> None:
+        for sink in self.sinks:
+            sink.close()
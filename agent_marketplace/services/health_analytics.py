@@ -0,0 +1,170 @@
+import re
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from agent_marketplace.services.health_series import HealthSeries, MetricSeries
+
+# Metrics read from dated measurements (compared reading to reading) and from daily logs (averaged)
+MEASUREMENT_PREFIXES = ("bloodTests.", "vitals.")
+DAILY_PREFIXES = ("sleepData.", "exerciseData.", "nutritionData.")
+
+# Statuses of a measurement that need no flag
+NORMAL_STATUSES = {"", "normal", "optimal"}
+
+# Condition keyword in the family history -> the user's metrics that indicate the risk
+FAMILY_RISK_METRICS: Dict[str, List[str]] = {
+    "diabetes": ["bloodTests.glucose"],
+    "hypertension": ["vitals.bloodPressure.systolic", "vitals.bloodPressure.diastolic"],
+    "heart": ["bloodTests.cholesterolLDL", "bloodTests.cholesterolTotal", "vitals.bloodPressure.systolic"],
+    "stroke": ["vitals.bloodPressure.systolic", "bloodTests.cholesterolLDL"],
+    "cholesterol": ["bloodTests.cholesterolLDL", "bloodTests.cholesterolTotal", "bloodTests.triglycerides"],
+    "kidney": ["bloodTests.creatinine", "bloodTests.bloodUreaNitrogen"],
+    "thyroid": ["bloodTests.thyroidStimulatingHormone"],
+}
+# A family condition is a near-term risk once the user is within this many years of its onset age
+ONSET_AGE_MARGIN = 10
+
+# A normalRange string, with an optional unit after the numbers, e.g. "70-99", "<200", "< 5.7%" or "4.0-5.6 %"
+RANGE_PATTERN = re.compile(
+    r"^\s*(?:(?P<low>[\d.]+)\s*[-–]\s*(?P<high>[\d.]+)|(?P<op>[<>]=?|≤|≥)\s*(?P<bound>[\d.]+))\s*[^\d\s]*\s*$"
+)
+
+
+class Finding(NamedTuple):
+    metric: str
+    latest: str  # Latest value with its unit and date, or the family condition
+    normal_range: str
+    flag: str  # e.g. HIGH, LOW, ELEVATED, RISK; "" if nothing stands out
+    change: str  # Change since the previous reading, rolling average or onset details
+
+
+def parse_normal_range(normal_range: Optional[str]) -> Tuple[float, float, bool, bool]:
+    """
+    Parse a normalRange string such as "70-99", "<200", ">40" or "< 5.7%"
+
+    Returns:
+        Tuple[float, float, bool, bool]: Lower and upper bound (-inf/inf if open, nan if unparseable),
+            and whether each bound is itself out of range ("<200" excludes 200, "70-99" includes 99)
+    """
+    match = RANGE_PATTERN.match(normal_range or "")
+    if not match:
+        return np.nan, np.nan, False, False
+    if match["low"] is not None:
+        return float(match["low"]), float(match["high"]), False, False
+    bound, op = float(match["bound"]), match["op"]
+    if op in ("<", "<=", "≤"):
+        return -np.inf, bound, False, op == "<"
+    return bound, np.inf, op == ">", False
+
+
+def out_of_range(values: np.ndarray, normal_ranges: List[Optional[str]]) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized (below, above) flags of values against their normal ranges; False where there is no range"""
+    bounds = np.array([parse_normal_range(normal_range) for normal_range in normal_ranges], dtype=np.float64).reshape(-1, 4)
+    low, high, low_strict, high_strict = bounds.T
+    with np.errstate(invalid="ignore"):
+        below = np.where(low_strict.astype(bool), values <= low, values < low)
+        above = np.where(high_strict.astype(bool), values >= high, values > high)
+    return below & ~np.isnan(low), above & ~np.isnan(high)
+
+
+def rolling_mean(series: MetricSeries, days: int) -> np.ndarray:
+    """Mean of the readings of the `days` days up to each reading, for every reading at once"""
+    if not len(series):
+        return np.array([], dtype=np.float64)
+    sums = np.concatenate(([0.0], np.cumsum(series.values)))
+    starts = np.searchsorted(series.dates, series.dates - np.timedelta64(days - 1, "D"), side="left")
+    ends = np.arange(1, len(series) + 1)
+    return (sums[ends] - sums[starts]) / (ends - starts)
+
+
+def format_number(value: float) -> str:
+    return f"{value:.6g}" if np.isfinite(value) else ""
+
+
+def measurement_findings(health_series: HealthSeries) -> List[Finding]:
+    """Latest value, out-of-range or status flag and change since the previous reading of every measurement"""
+    names = [name for name in health_series.names() if name.startswith(MEASUREMENT_PREFIXES)]
+    if not names:
+        return []
+    metrics = [health_series[name] for name in names]
+    latest = np.array([metric.values[-1] for metric in metrics])
+    previous = np.array([metric.values[-2] if len(metric) > 1 else np.nan for metric in metrics])
+    normal_ranges = [str(metric.normal_ranges[-1]) for metric in metrics]
+    below, above = out_of_range(latest, normal_ranges)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        delta = latest - previous
+        percent = np.where(previous != 0, delta / np.abs(previous) * 100, np.nan)
+
+    findings = []
+    for i, (name, metric) in enumerate(zip(names, metrics)):
+        status = str(metric.statuses[-1])
+        flag = "LOW" if below[i] else "HIGH" if above[i] else "" if status.lower() in NORMAL_STATUSES else status.upper()
+        change = ""
+        if np.isfinite(delta[i]):
+            change = f"{delta[i]:+.6g}" + (f" ({percent[i]:+.1f}%)" if np.isfinite(percent[i]) else "") + f" since {metric.dates[-2]}"
+        unit = f" {metric.units[-1]}" if metric.units[-1] else ""
+        findings.append(Finding(name, f"{format_number(latest[i])}{unit} ({metric.dates[-1]})", normal_ranges[i], flag, change))
+    return findings
+
+
+def daily_findings(health_series: HealthSeries, days: int) -> List[Finding]:
+    """Latest value, rolling average over `days` days and daily trend of every sleep, exercise and nutrition metric"""
+    findings = []
+    for name in health_series.names():
+        if not name.startswith(DAILY_PREFIXES):
+            continue
+        metric = health_series[name]
+        average = rolling_mean(metric, days)[-1]
+        change = f"{days}-day avg {format_number(average)}"
+        trend = metric.trend(days)
+        if trend is not None:
+            change += f", {trend.slope_per_day:+.3g}/day"
+        findings.append(Finding(name, f"{format_number(metric.values[-1])} ({metric.dates[-1]})", "", "", change))
+    return findings
+
+
+def family_history_findings(health_data: Dict[str, Any], flagged: Dict[str, str]) -> List[Finding]:
+    """
+    Risk flags from the family history
+
+    A condition is flagged RISK when one of the user's related metrics is flagged (`flagged`, metric
+    -> flag) or the user is within ONSET_AGE_MARGIN years of the relative's onset age, else HISTORY.
+    """
+    medical_history = health_data.get("medicalHistory") or {}
+    family_history = medical_history.get("familyHistory") or {}
+    age = (health_data.get("user") or {}).get("age")
+    findings = []
+    for relative, conditions in family_history.items():
+        for condition in conditions or []:
+            name = condition.get("condition") or ""
+            onset_age = condition.get("onsetAge")
+            related = [metric for keyword, metrics in FAMILY_RISK_METRICS.items() if keyword in name.lower() for metric in metrics]
+            signals = [f"{metric.split('.')[-1]} {flagged[metric]}" for metric in dict.fromkeys(related) if metric in flagged]
+            near_onset = isinstance(age, (int, float)) and isinstance(onset_age, (int, float)) and age >= onset_age - ONSET_AGE_MARGIN
+            details = [f"onset {onset_age}" if onset_age is not None else "", f"user age {age}" if age is not None else ""] + signals
+            findings.append(Finding(f"familyHistory.{relative}", name, "", "RISK" if signals or near_onset else "HISTORY",
+                                    ", ".join(detail for detail in details if detail)))
+    return findings
+
+
+def analyze_health(health_series: HealthSeries, health_data: Dict[str, Any], rolling_days: int = 7) -> List[Finding]:
+    """
+    Deterministic findings from a user's health data: out-of-range and status flags with the change
+    since the previous reading for blood tests and vitals, rolling averages and trends for sleep,
+    exercise and nutrition, and family history risk flags. Flagged findings come first.
+    """
+    measurements = measurement_findings(health_series)
+    flagged = {finding.metric: finding.flag for finding in measurements if finding.flag}
+    findings = measurements + daily_findings(health_series, rolling_days) + family_history_findings(health_data, flagged)
+    return sorted(findings, key=lambda finding: finding.flag in ("", "HISTORY"))
+
+
+def format_findings_table(findings: List[Finding]) -> str:
+    """Render findings as a compact Markdown table"""
+    if not findings:
+        return ""
+    rows = ["| Metric | Latest | Normal range | Flag | Change |", "|---|---|---|---|---|"]
+    rows += [f"| {finding.metric} | {finding.latest} | {finding.normal_range} | {finding.flag} | {finding.change} |"
+             for finding in findings]
+    return "\n".join(rows)
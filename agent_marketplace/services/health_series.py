@@ -0,0 +1,164 @@
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+# Series of dated records in sample_health_data.json, by their path in the file
+RECORD_SERIES = {
+    "bloodTests": ("bloodTests",),
+    "vitals": ("vitals",),
+    "sleepData": ("healthMetrics", "sleepData"),
+    "exerciseData": ("healthMetrics", "exerciseData"),
+    "nutritionData": ("healthMetrics", "nutritionData"),
+}
+
+
+class Reading(NamedTuple):
+    date: str
+    value: Union[int, float]  # An int for whole numbers, as in the health data file
+    unit: Optional[str]
+    normal_range: Optional[str]
+    status: Optional[str]
+
+    def as_dict(self) -> Dict[str, Any]:
+        """The reading in the camelCase shape of the health data file"""
+        reading = {"date": self.date, "value": self.value, "unit": self.unit,
+                   "normalRange": self.normal_range, "status": self.status}
+        return {key: value for key, value in reading.items() if value is not None}
+
+
+class Trend(NamedTuple):
+    start: str
+    end: str
+    readings: int
+    change: float  # Last value minus first value
+    slope_per_day: float  # Of the least-squares line through the readings
+
+
+class MetricSeries:
+    """
+    Readings of one metric (e.g. "bloodTests.glucose") as columns sorted by date.
+
+    Dates are a datetime64[D] array and values a float64 array, so date lookups are binary searches
+    and aggregates are vectorized. Units, normal ranges and statuses (or a record's label, such as the
+    sleep quality or the exercise type) are kept in parallel string columns, "" where missing.
+    """
+    def __init__(self, name: str, dates: np.ndarray, values: np.ndarray, units: np.ndarray,
+                 normal_ranges: np.ndarray, statuses: np.ndarray):
+        self.name = name
+        self.dates = dates
+        self.values = values
+        self.units = units
+        self.normal_ranges = normal_ranges
+        self.statuses = statuses
+
+    @classmethod
+    def from_rows(cls, name: str, rows: List[Tuple[str, float, Optional[str], Optional[str], Optional[str]]]) -> "MetricSeries":
+        """Build a series from (date, value, unit, normal range, status) rows in any order"""
+        dates = np.array([row[0] for row in rows], dtype="datetime64[D]")
+        order = np.argsort(dates, kind="stable")
+        columns = [np.array([row[column] or "" for row in rows], dtype=str)[order] for column in (2, 3, 4)]
+        return cls(name, dates[order], np.array([row[1] for row in rows], dtype=np.float64)[order], *columns)
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def __getitem__(self, index: Union[int, slice]) -> Union[Reading, "MetricSeries"]:
+        """The reading at a position (-1 is the latest), or a slice of the series"""
+        if isinstance(index, slice):
+            return MetricSeries(self.name, self.dates[index], self.values[index], self.units[index],
+                                self.normal_ranges[index], self.statuses[index])
+        value = float(self.values[index])
+        return Reading(str(self.dates[index]), int(value) if value.is_integer() else value, str(self.units[index]) or None,
+                       str(self.normal_ranges[index]) or None, str(self.statuses[index]) or None)
+
+    def latest(self) -> Optional[Reading]:
+        return self[-1] if len(self) else None
+
+    def between(self, start: Optional[str] = None, end: Optional[str] = None) -> "MetricSeries":
+        """The readings from start to end (YYYY-MM-DD, inclusive); either bound may be left open"""
+        first = np.searchsorted(self.dates, np.datetime64(start, "D"), side="left") if start else 0
+        last = np.searchsorted(self.dates, np.datetime64(end, "D"), side="right") if end else len(self)
+        return self[first:last]
+
+    def last_days(self, days: int, end: Optional[str] = None) -> "MetricSeries":
+        """The readings of the `days` days up to end, by default up to the latest reading"""
+        if not len(self):
+            return self
+        end_date = np.datetime64(end, "D") if end else self.dates[-1]
+        return self.between(str(end_date - np.timedelta64(days - 1, "D")), str(end_date))
+
+    def trend(self, days: Optional[int] = None) -> Optional[Trend]:
+        """Change and daily slope over the last `days` days (all readings by default); None under two readings"""
+        series = self.last_days(days) if days else self
+        if len(series) < 2:
+            return None
+        offsets = (series.dates - series.dates[0]).astype(np.float64)
+        slope = float(np.polyfit(offsets, series.values, 1)[0]) if offsets[-1] > 0 else 0.0
+        return Trend(str(series.dates[0]), str(series.dates[-1]), len(series),
+                     float(series.values[-1] - series.values[0]), slope)
+
+
+def _record_rows(record: Dict[str, Any], prefix: str) -> Iterator[Tuple[str, Any, Optional[str], Optional[str], Optional[str]]]:
+    """(metric, value, unit, normal range, status) of every numeric field of a dated record"""
+    fields = record.get("results", record)
+    # Text fields such as the sleep quality or the exercise type label the record's plain numbers
+    label = next((value for key, value in fields.items() if key != "date" and isinstance(value, str)), None)
+    for key, field in fields.items():
+        if isinstance(field, dict) and "value" in field:
+            yield f"{prefix}.{key}", field["value"], field.get("unit"), field.get("normalRange"), field.get("status")
+        elif isinstance(field, dict):
+            for sub_key, value in field.items():
+                yield f"{prefix}.{key}.{sub_key}", value, None, None, field.get("status")
+        elif key != "date":
+            yield f"{prefix}.{key}", field, None, None, label
+
+
+class HealthSeries:
+    """
+    Columnar view of one user's health data: a MetricSeries per metric, named after its path in the
+    health data file without the record index, e.g. "bloodTests.glucose",
+    "vitals.bloodPressure.systolic", "sleepData.totalHours" or "nutritionData.protein".
+    """
+    def __init__(self, metrics: Dict[str, MetricSeries]):
+        self.metrics = metrics
+
+    @classmethod
+    def from_health_data(cls, data: Dict[str, Any]) -> "HealthSeries":
+        rows: Dict[str, list] = defaultdict(list)
+        for prefix, path in RECORD_SERIES.items():
+            records: Any = data
+            for key in path:
+                records = records.get(key, {}) if isinstance(records, dict) else {}
+            for record in records if isinstance(records, list) else []:
+                if not isinstance(record, dict) or not record.get("date"):
+                    continue
+                for name, value, unit, normal_range, status in _record_rows(record, prefix):
+                    if isinstance(value, (int, float)) and not isinstance(value, bool):
+                        rows[name].append((record["date"], value, unit, normal_range, status))
+        return cls({name: MetricSeries.from_rows(name, metric_rows) for name, metric_rows in rows.items()})
+
+    def __contains__(self, name: str) -> bool:
+        return name in self.metrics
+
+    def __getitem__(self, name: str) -> MetricSeries:
+        return self.metrics[name]
+
+    def get(self, name: str) -> MetricSeries:
+        """A metric's series, empty if the user has no readings of it"""
+        if name in self.metrics:
+            return self.metrics[name]
+        empty = np.array([], dtype=str)
+        return MetricSeries(name, np.array([], dtype="datetime64[D]"), np.array([], dtype=np.float64), empty, empty, empty)
+
+    def names(self, prefix: str = "") -> List[str]:
+        return sorted(name for name in self.metrics if name.startswith(prefix))
+
+    def latest(self, name: str) -> Optional[Reading]:
+        return self.get(name).latest()
+
+    def trend(self, name: str, days: Optional[int] = None) -> Optional[Trend]:
+        return self.get(name).trend(days)
+
+    def between(self, name: str, start: Optional[str] = None, end: Optional[str] = None) -> MetricSeries:
+        return self.get(name).between(start, end)
@@ -0,0 +1,217 @@
+import json
+from datetime import datetime
+from itertools import islice
+from json.decoder import scanstring
+from typing import Any, Callable, IO, Iterable, Iterator, List, Optional
+
+try:
+    import ijson
+except ImportError:  # Optional, the built-in streaming parser below is used instead
+    ijson = None
+
+# Record paths in ijson prefix syntax ("item" is any array element), by personal data file
+RECORD_PREFIXES = {
+    "conversation_data.json": "Data.item.Conversations.item",
+    "user_ai_interaction_data.json": "Data.item",
+    "purchase_history_data.json": "Data.item",
+}
+DEFAULT_RECORD_PREFIX = "Data.item"
+# Files whose records are chat sessions
+CHAT_HISTORY_FILES = ("conversation_data.json", "user_ai_interaction_data.json")
+# Format of a chat session's "time", e.g. "2024/Oct/14/08:09 AM"
+SESSION_TIME_FORMAT = "%Y/%b/%d/%I:%M %p"
+
+WHITESPACE = " \t\n\r"
+NUMBER_CHARS = "0123456789+-.eE"
+
+
+class _JSONStream:
+    """
+    Minimal incremental JSON reader over a text file, used when ijson isn't installed.
+
+    Only the part of the file around the current position is kept in memory: the buffer is
+    extended a block at a time while a value is being read, and the consumed part is dropped.
+    """
+    def __init__(self, f: IO[str], block_size: int = 65536):
+        self.f = f
+        self.block_size = block_size
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _fill(self) -> bool:
+        """Read another block; returns False at the end of the file"""
+        if self.eof:
+            return False
+        # Read at least as much as is buffered, so decoding a large value is retried O(log n) times
+        block = self.f.read(max(self.block_size, len(self.buffer) - self.pos))
+        if not block:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + block
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Return the next non-whitespace character without consuming it, "" at the end of the file"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer) or not self._fill():
+                return self.buffer[self.pos:self.pos + 1]
+
+    def expect(self, chars: str) -> str:
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expected one of {chars!r} but found {char!r}")
+        self.pos += 1
+        return char
+
+    def read_value(self) -> Any:
+        """Decode the next complete value, reading ahead as far as needed"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # A number at the end of the buffer may continue in the next block
+                if self.eof or (end < len(self.buffer) and self.buffer[end] not in NUMBER_CHARS):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            self._fill()
+
+    def read_key(self) -> str:
+        self.expect('"')
+        while True:
+            try:
+                key, end = scanstring(self.buffer, self.pos)
+                self.pos = end
+                return key
+            except json.JSONDecodeError:
+                if not self._fill():
+                    raise
+
+    def items(self, path: List[str]) -> Iterator[Any]:
+        """Yield the values at an ijson-style path below the current position"""
+        if not path:
+            yield self.read_value()
+            return
+        segment, rest = path[0], path[1:]
+        char = self.peek()
+        if segment == "item" and char == "[":
+            self.expect("[")
+            if self.peek() == "]":
+                self.expect("]")
+                return
+            while True:
+                yield from self.items(rest)
+                if self.expect(",]") == "]":
+                    return
+        elif segment != "item" and char == "{":
+            self.expect("{")
+            if self.peek() == "}":
+                self.expect("}")
+                return
+            while True:
+                key = self.read_key()
+                self.expect(":")
+                if key == segment:
+                    yield from self.items(rest)
+                else:
+                    self.read_value()
+                if self.expect(",}") == "}":
+                    return
+        else:
+            # The document doesn't have this path
+            self.read_value()
+
+
+def iter_json_records(path: str, prefix: str) -> Iterator[Any]:
+    """
+    Lazily yield the records at `prefix` of a JSON file, e.g. "Data.item.Conversations.item"
+
+    Uses ijson when it is installed and a built-in incremental parser otherwise; either way only
+    one record at a time is held in memory, not the whole file.
+    """
+    if ijson is not None:
+        with open(path, "rb") as f:
+            yield from ijson.items(f, prefix, use_float=True)
+        return
+    with open(path, encoding="utf-8") as f:
+        yield from _JSONStream(f).items(prefix.split(".") if prefix else [])
+
+
+def render_record(record: Any) -> str:
+    """Compact text of a personal data record: chat turns one per line, anything else as JSON"""
+    if isinstance(record, dict):
+        turns = record.get("conversation") or record.get("user_ai_interaction")
+        if isinstance(turns, list):
+            header = " ".join(str(record[key]) for key in ("time", "target_name") if record.get(key))
+            lines = [f"[{header}]"] if header else []
+            lines += [f"{turn.get('role')}: {turn.get('content')}" for turn in turns if isinstance(turn, dict)]
+            return "\n".join(lines)
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def session_time(record: Any) -> Optional[datetime]:
+    """When a chat session took place, or None if the record has no readable time"""
+    try:
+        return datetime.strptime(record["time"], SESSION_TIME_FORMAT)
+    except (TypeError, KeyError, ValueError):
+        return None
+
+
+def chunk_texts(texts: Iterable[str], max_tokens: int, count_tokens: Callable[[str], int]) -> Iterator[str]:
+    """
+    Pack texts into chunks of at most max_tokens tokens, in order
+
+    A text longer than max_tokens on its own is cut to fit. Chunks are yielded as soon as they
+    are full, so the texts can be a lazy stream.
+    """
+    chunk: List[str] = []
+    chunk_tokens = 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if tokens > max_tokens:
+            text = text[:len(text) * max_tokens // tokens]
+            tokens = count_tokens(text)
+        if chunk and chunk_tokens + tokens > max_tokens:
+            yield "\n\n".join(chunk)
+            chunk, chunk_tokens = [], 0
+        chunk.append(text)
+        chunk_tokens += tokens
+    if chunk:
+        yield "\n\n".join(chunk)
+
+
+def batched(iterable: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def map_reduce(chunks: Iterable[str], map_batch: Callable[[List[str]], List[str]],
+               reduce_batch: Callable[[List[str]], List[str]], window: int = 8, fan_in: int = 4) -> Optional[str]:
+    """
+    Summarize a stream of chunks with map-reduce
+
+    Args:
+        chunks (Iterable[str]): Chunks of the input, consumed `window` at a time
+        map_batch (Callable): Summarizes a list of chunks, e.g. with one concurrent LLM batch
+        reduce_batch (Callable): Merges a list of texts, each holding up to `fan_in` joined
+            partial summaries, into one summary each
+        window (int, optional): Chunks mapped at once; bounds the input held in memory
+        fan_in (int, optional): Partial summaries merged per reduce step
+
+    Returns:
+        Optional[str]: The final summary, or None if there were no chunks
+    """
+    partials: List[str] = []
+    for window_chunks in batched(chunks, window):
+        partials.extend(map_batch(window_chunks))
+    while len(partials) > 1:
+        partials = reduce_batch(["\n\n".join(group) for group in batched(partials, fan_in)])
+    return partials[0] if partials else None
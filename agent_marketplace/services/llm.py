@@ -1,11 +1,83 @@
 import os
+import json
 import time
-from typing import Dict, List, Any, Optional, Union
-from openai import OpenAI
+import asyncio
+import queue
+import threading
+import contextvars
+import concurrent.futures
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Any, Optional, Union
 import tiktoken
 
 from agent_marketplace.config import get_settings
-from agent_marketplace.schemas.agents import Context
+from agent_marketplace.schemas.agents import Context, Message
+from agent_marketplace.services.context_window import ContextWindow, fit_context_window
+from agent_marketplace.services.openai_clients import get_openai_client
+from agent_marketplace.services.rate_limiter import (
+    RateLimiter, backoff_delay, get_rate_limiter, is_rate_limit_error, is_retryable_error, retry_after
+)
+from agent_marketplace.services.response_cache import ResponseCache, get_response_cache
+from agent_marketplace.services.tracing import LLM, Span, get_tracer
+
+# Used when the tiktoken encodings can't be loaded (offline, e.g. benchmarks): about 4 characters per token
+APPROXIMATE_ENCODING = "approximate"
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str) -> Optional[tiktoken.Encoding]:
+    """Resolve the tiktoken encoding for a model once per process, or None if it can't be loaded"""
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            # Fallback for models not explicitly supported by tiktoken
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken downloads encodings on first use, which fails without network access
+        print(f"Could not load the tiktoken encoding for {model}, approximating token counts: {str(e)}")
+        return None
+
+
+@lru_cache(maxsize=16384)
+def count_text_tokens(encoding_name: str, text: str) -> int:
+    """Count the tokens in a piece of text, memoized by (encoding, content)"""
+    if encoding_name == APPROXIMATE_ENCODING:
+        return (len(text) + 3) // 4
+    return len(tiktoken.get_encoding(encoding_name).encode(text))
+
+
+class TokenLedger:
+    """
+    Running token total of one conversation history.
+
+    Histories are append-mostly, so on each update only the messages added since the last update
+    are counted. If messages were popped or replaced, the ledger rewinds to the last message it
+    still shares with the history and recounts from there.
+    """
+    def __init__(self):
+        self.messages: List[Message] = []
+        self.counts: List[int] = []
+        self.total = 0
+
+    def update(self, history: List[Message], count_message: Callable[[str, str], int]) -> int:
+        shared = min(len(self.messages), len(history))
+        while shared and self.messages[shared - 1] is not history[shared - 1]:
+            shared -= 1
+        if shared < len(self.messages):
+            self.total -= sum(self.counts[shared:])
+            del self.messages[shared:]
+            del self.counts[shared:]
+
+        for msg in history[shared:]:
+            tokens = count_message(msg.role, msg.content)
+            self.messages.append(msg)
+            self.counts.append(tokens)
+            self.total += tokens
+        return self.total
+
 
 class OpenAILLMProvider:
     def __init__(self, config: Optional[Dict[str, Any]] = None):
@@ -13,77 +85,213 @@ class OpenAILLMProvider:
         self.settings = get_settings()
         self.api_key = self.config.get("api_key") or self.settings.openai_api_key or os.getenv("OPENAI_API_KEY")
         self.model = self.config.get("model", "gpt-4o")
-        self.client = OpenAI(api_key=self.api_key)
+        self.base_url = self.config.get("base_url") or self.settings.openai_base_url
+        self.client = self._create_client()
         self.max_tokens_per_request = self.config.get("max_tokens_per_request", 25000)  # Lower than the 30k TPM limit
+        self.max_retries = self.config.get("max_retries", self.settings.llm_max_retries)
+        self.max_concurrency = self.config.get("max_concurrency", self.settings.llm_max_concurrency)
+        # Running token totals per conversation, keyed by id(context) and bounded in size
+        self._token_ledgers: "OrderedDict[int, TokenLedger]" = OrderedDict()
+        self._token_ledgers_lock = threading.Lock()
+        # Window chosen by the last truncation, exposes the token budget actually used
+        self.last_context_window: Optional[ContextWindow] = None
+        self.response_cache: Optional[ResponseCache] = \
+            get_response_cache() if self.config.get("response_cache", self.settings.response_cache) else None
+        self.rate_limiter: Optional[RateLimiter] = self._create_rate_limiter()
+
+    def _create_client(self):
+        return get_openai_client(self.api_key, self.base_url, max_retries=0)
+
+    def _create_rate_limiter(self) -> Optional[RateLimiter]:
+        requests_per_minute = self.config.get("requests_per_minute", self.settings.llm_requests_per_minute)
+        tokens_per_minute = self.config.get("tokens_per_minute", self.settings.llm_tokens_per_minute)
+        if requests_per_minute <= 0 and tokens_per_minute <= 0:
+            return None
+        return get_rate_limiter(self.base_url, self.model, requests_per_minute, tokens_per_minute)
+
+    @property
+    def encoding(self) -> Optional[tiktoken.Encoding]:
+        return get_encoding(self.model)
+
+    @property
+    def encoding_name(self) -> str:
+        encoding = self.encoding
+        return encoding.name if encoding is not None else APPROXIMATE_ENCODING
+
+    def _count_message_tokens(self, role: str, content: Optional[str]) -> int:
+        """Count the tokens of a single message"""
+        num_tokens = 4  # Every message follows <im_start>{role/name}\n{content}<im_end>\n
+        num_tokens += count_text_tokens(self.encoding_name, role)
+        if content:
+            num_tokens += count_text_tokens(self.encoding_name, content)
+        return num_tokens
         
     def _count_tokens(self, messages: List[Dict[str, str]]) -> int:
         """Count the number of tokens in the messages"""
-        try:
-            encoding = tiktoken.encoding_for_model(self.model)
-        except KeyError:
-            # Fallback for models not explicitly supported by tiktoken
-            encoding = tiktoken.get_encoding("cl100k_base")
-            
-        num_tokens = 0
-        for message in messages:
-            # Add tokens for each message
-            num_tokens += 4  # Every message follows <im_start>{role/name}\n{content}<im_end>\n
-            for key, value in message.items():
-                if key == "content" and value:
-                    num_tokens += len(encoding.encode(value))
-                elif key == "role":
-                    num_tokens += len(encoding.encode(value))
-                    
+        num_tokens = sum(self._count_message_tokens(message["role"], message.get("content")) for message in messages)
         num_tokens += 2  # Every reply is primed with <im_start>assistant
         return num_tokens
+
+    def _count_history_tokens(self, context: Context) -> int:
+        """Count the tokens of a context's history, only encoding messages added since the last call"""
+        with self._token_ledgers_lock:
+            ledger = self._token_ledgers.pop(id(context), None) or TokenLedger()
+            self._token_ledgers[id(context)] = ledger
+            while len(self._token_ledgers) > 64:
+                self._token_ledgers.popitem(last=False)
+            return ledger.update(context.history, self._count_message_tokens)
     
     def _truncate_context(self, messages: List[Dict[str, str]], max_tokens: int) -> List[Dict[str, str]]:
         """Truncate conversation history to fit within token limits"""
-        # Always keep system and current user message
-        system_message = None
-        user_message = None
+        window = fit_context_window(
+            messages, max_tokens,
+            count_message=lambda msg: self._count_message_tokens(msg["role"], msg.get("content"))
+        )
+        self.last_context_window = window
+        return window.messages
         
-        # Extract system and most recent user message
-        history_messages = []
-        for msg in messages:
-            if msg["role"] == "system":
-                system_message = msg
-            elif msg["role"] == "user":
-                user_message = msg
-                # Add previous user messages to history
-                if user_message != msg:
-                    history_messages.append(msg)
-            else:
-                history_messages.append(msg)
-        
-        # Start with required messages
-        result = []
-        if system_message:
-            result.append(system_message)
-        if user_message:
-            result.append(user_message)
-            
-        # Calculate tokens used by required messages
-        token_count = self._count_tokens(result)
+    def _prepare_messages(self, prompt: str, system_prompt: str = "", context: Context = None) -> List[Dict[str, str]]:
+        """Build the chat messages for a request, truncating history to fit the token budget"""
+        messages = []
+        if system_prompt:
+            messages.append({"role": "system", "content": system_prompt})
         
-        # Add historical messages until we approach the token limit
-        # Start from the most recent history (reversed)
-        for msg in reversed(history_messages):
-            msg_tokens = self._count_tokens([msg])
-            if token_count + msg_tokens < max_tokens:
-                # Insert historical message at position 1 (after system, before current user message)
-                # This keeps the chronological order intact
-                insert_pos = 1 if system_message else 0
-                result.insert(insert_pos, msg)
-                token_count += msg_tokens
-            else:
-                break
+        # Add context if provided
+        if context:
+            for msg in context.history:
+                messages.append({"role": msg.role, "content": msg.content})
                 
-        return result
+        # Add current prompt
+        messages.append({"role": "user", "content": prompt})
+
+        # Check token count and truncate if needed
+        estimated_tokens = self._count_tokens([messages[0], messages[-1]] if system_prompt else [messages[-1]])
+        if context:
+            estimated_tokens += self._count_history_tokens(context)
+        if estimated_tokens > self.max_tokens_per_request:
+            messages = self._truncate_context(messages, self.max_tokens_per_request)
+        return messages
+
+    def _prepare_api_params(self, prompt: str, system_prompt: str = "", context: Context = None,
+                            tools: Optional[List[Dict[str, Any]]] = None,
+                            tool_choice: Optional[Union[str, Dict[str, Any]]] = "auto",
+                            response_format: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Build the keyword arguments for chat.completions.create"""
+        if not self.api_key:
+            raise ValueError("API key not provided")
+
+        api_params = {
+            "model": self.model,
+            "messages": self._prepare_messages(prompt, system_prompt, context),
+            "temperature": self.config.get("temperature", 0.7),
+            "max_tokens": self.config.get("max_tokens", 1000),
+        }
         
+        # Add tools and tool_choice if provided
+        if tools:
+            api_params["tools"] = tools
+            api_params["tool_choice"] = tool_choice
+
+        # Ask for structured output if a JSON schema is provided
+        if response_format:
+            api_params["response_format"] = response_format
+        return api_params
+
+    def _cached_response(self, api_params: Dict[str, Any], cache: bool,
+                         semantic_cache_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Look a request up in the response cache; cache hits report no token usage"""
+        if not cache or self.response_cache is None:
+            return None
+        response = self.response_cache.get(api_params, semantic_cache_key)
+        if response is None:
+            return None
+        return {**response, "usage": None, "cached": True}
+
+    def _cache_response(self, api_params: Dict[str, Any], response: Dict[str, Any], cache: bool,
+                        semantic_cache_key: Optional[str] = None) -> None:
+        if cache and self.response_cache is not None:
+            self.response_cache.set(api_params, response, semantic_cache_key)
+
+    @staticmethod
+    def _trace_response(span: Span, response: Dict[str, Any]) -> None:
+        """Record the token usage of a response on its LLM span"""
+        usage = response.get("usage")
+        if usage:
+            span.set_attributes(prompt_tokens=usage["prompt_tokens"], completion_tokens=usage["completion_tokens"])
+
+    def _estimate_tokens(self, api_params: Dict[str, Any]) -> int:
+        """Tokens a request counts against the rate limit before it runs: prompt plus max_tokens"""
+        return self._count_tokens(api_params["messages"]) + api_params.get("max_tokens", 0)
+
+    def _settle_tokens(self, reserved: int, response: Optional[Dict[str, Any]]) -> None:
+        """Correct the rate limiter's reservation with the tokens a request actually used"""
+        if self.rate_limiter is None:
+            return
+        usage = response.get("usage") if response else None
+        self.rate_limiter.settle(reserved, usage["total_tokens"] if usage else (reserved if response else 0))
+
+    def _send_request(self, api_params: Dict[str, Any], span: Span) -> Dict[str, Any]:
+        """Send one request once the rate limiter admits it"""
+        reserved = self._estimate_tokens(api_params)
+        response = None
+        try:
+            if self.rate_limiter is not None:
+                span.add("rate_limit_wait_s", self.rate_limiter.acquire(reserved))
+            response = self._parse_response(self.client.chat.completions.create(**api_params))
+        finally:
+            self._settle_tokens(reserved, response)
+        return response
+
+    def _retry_delay(self, error: Exception, attempt: int) -> Optional[float]:
+        """Return how long to wait before retrying a failed request, or None to give up"""
+        if attempt >= self.max_retries or not is_retryable_error(error):
+            return None
+        # Wait as long as the API asks to, or back off exponentially with jitter
+        delay = retry_after(error)
+        if delay is None:
+            delay = backoff_delay(attempt, self.settings.llm_backoff_base, self.settings.llm_backoff_max)
+        if self.rate_limiter is not None and is_rate_limit_error(error):
+            # Hold back every other request to this model too, instead of letting them hit the limit
+            self.rate_limiter.pause(delay)
+        return delay
+
+    @staticmethod
+    def _parse_response(response) -> Dict[str, Any]:
+        usage = getattr(response, "usage", None)
+        return {
+            "content": response.choices[0].message.content,
+            "tool_calls": response.choices[0].message.tool_calls,
+            "usage": {
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "total_tokens": usage.total_tokens,
+            } if usage else None
+        }
+
+    @staticmethod
+    def _parse_stream_chunk(chunk) -> List[Dict[str, Any]]:
+        """Turn a streamed completion chunk into content and tool call deltas"""
+        if not chunk.choices:
+            return []
+        delta = chunk.choices[0].delta
+        deltas = []
+        if delta.content:
+            deltas.append({"type": "content", "content": delta.content})
+        for tool_call in delta.tool_calls or []:
+            deltas.append({
+                "type": "tool_call",
+                "index": tool_call.index,
+                "id": tool_call.id,
+                "name": tool_call.function.name if tool_call.function else None,
+                "arguments": tool_call.function.arguments if tool_call.function else None,
+            })
+        return deltas
+
     def generate(self, prompt: str, system_prompt: str = "", context: Context = None, 
                  tools: Optional[List[Dict[str, Any]]] = None, 
-                 tool_choice: Optional[Union[str, Dict[str, Any]]] = "auto") -> Dict[str, Any]:
+                 tool_choice: Optional[Union[str, Dict[str, Any]]] = "auto",
+                 response_format: Optional[Dict[str, Any]] = None, cache: bool = True,
+                 semantic_cache_key: Optional[str] = None) -> Dict[str, Any]:
         """
         Generate text using LLM with optional tool support
         
@@ -93,71 +301,366 @@ class OpenAILLMProvider:
             context (Context, optional): Conversation history and context
             tools (List[Dict[str, Any]], optional): List of tools in OpenAI format for function calling
             tool_choice (Union[str, Dict[str, Any]], optional): Tool choice parameter - "auto", "none", or specific tool config
+            response_format (Dict[str, Any], optional): Structured output format, e.g. {"type": "json_schema", ...}
+            cache (bool, optional): Look the request up in, and store the response in, the response
+                cache; pass False for calls that must reach the LLM, e.g. sampling several candidates
+            semantic_cache_key (str, optional): The user's question within the prompt, e.g. the message
+                the user sent. Opts the call into the semantic cache tier, which may answer it with the
+                response to a near-duplicate question asked with an otherwise identical prompt
             
         Returns:
             Dict[str, Any]: Dictionary containing:
                 - content (str): The generated text response
                 - tool_calls (Optional[List]): Tool call information if tools were used
+                - usage (Optional[Dict[str, int]]): Prompt, completion and total token counts
+                - cached (bool): Only present, and True, when the response came from the cache
                 
         Raises:
             ValueError: If API key is not provided or API call fails
         """
-        if not self.api_key:
-            raise ValueError("API key not provided")
+        with get_tracer().llm_span(model=self.model) as span:
+            api_params = self._prepare_api_params(prompt, system_prompt, context, tools, tool_choice, response_format)
+            cached = self._cached_response(api_params, cache, semantic_cache_key)
+            span.set_attributes(cache_hit=cached is not None)
+            if cached is not None:
+                return cached
+
+            # Call OpenAI API using the official client, with retry and backoff for rate limiting
+            try:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        response = self._send_request(api_params, span)
+                        self._trace_response(span, response)
+                        self._cache_response(api_params, response, cache, semantic_cache_key)
+                        return response
+                    except Exception as e:
+                        backoff_time = self._retry_delay(e, attempt)
+                        if backoff_time is None:
+                            # Re-raise the exception if we've exhausted retries or it's not a rate limit error
+                            raise
+                        span.add("retries", 1)
+                        span.add("backoff_s", backoff_time)
+                        time.sleep(backoff_time)
+            except Exception as e:
+                raise ValueError(f"OpenAI API error: {str(e)}")
+
+    def generate_batch(self, requests: List[Dict[str, Any]], return_exceptions: bool = False) -> List[Dict[str, Any]]:
+        """
+        Run several independent generate calls concurrently
+        
+        Args:
+            requests (List[Dict[str, Any]]): Keyword arguments for each generate call
+            return_exceptions (bool, optional): Return failed calls' exceptions in place of their
+                responses instead of raising the first one, like asyncio.gather
             
-        # Prepare messages
-        messages = []
-        if system_prompt:
-            messages.append({"role": "system", "content": system_prompt})
+        Returns:
+            List[Dict[str, Any]]: One response per request, in the same order as the requests
+        """
+        with ThreadPoolExecutor(max_workers=max(1, min(len(requests), self.max_concurrency))) as executor:
+            # Each call runs in a copy of this context, so its span nests under the caller's
+            futures = [executor.submit(contextvars.copy_context().run, self.generate, **request) for request in requests]
+            results = []
+            for future in futures:
+                error = future.exception()
+                if error is not None and not return_exceptions:
+                    raise error
+                results.append(error if error is not None else future.result())
+            return results
+
+    def stream(self, prompt: str, system_prompt: str = "", context: Context = None,
+               tools: Optional[List[Dict[str, Any]]] = None,
+               tool_choice: Optional[Union[str, Dict[str, Any]]] = "auto",
+               response_format: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Stream a completion as it is generated; takes the same arguments as generate
         
-        # Add context if provided
-        if context:
-            for msg in context.history:
-                messages.append({"role": msg.role, "content": msg.content})
+        Yields:
+            Dict[str, Any]: Either a content delta {"type": "content", "content": str}, or a tool call
+                delta {"type": "tool_call", "index": int, "id": str, "name": str, "arguments": str}
+                where id and name are only set on the first delta of each tool call
                 
-        # Add current prompt
-        messages.append({"role": "user", "content": prompt})
-
-        # Check token count and truncate if needed
-        estimated_tokens = self._count_tokens(messages)
-        if estimated_tokens > self.max_tokens_per_request:
-            messages = self._truncate_context(messages, self.max_tokens_per_request)
+        Raises:
+            ValueError: If API key is not provided or API call fails
+        """
+        api_params = self._prepare_api_params(prompt, system_prompt, context, tools, tool_choice, response_format)
+        api_params["stream"] = True
 
-        # Call OpenAI API using the official client
+        # The span isn't made current: the caller's code runs between the yields
+        tracer = get_tracer()
+        span = tracer.start_span("llm.stream", kind=LLM, model=self.model)
+        start = time.perf_counter()
+        # Only opening the stream is retried, deltas already yielded can't be taken back
         try:
-            # Prepare API call parameters
-            api_params = {
-                "model": self.model,
-                "messages": messages,
-                "temperature": self.config.get("temperature", 0.7),
-                "max_tokens": self.config.get("max_tokens", 1000),
-            }
-            
-            # Add tools and tool_choice if provided
-            if tools:
-                api_params["tools"] = tools
-                api_params["tool_choice"] = tool_choice
-            
-            # Add retry with backoff for rate limiting
-            max_retries = 3
-            for attempt in range(max_retries):
+            reserved = self._estimate_tokens(api_params)
+            for attempt in range(self.max_retries + 1):
                 try:
+                    if self.rate_limiter is not None:
+                        span.add("rate_limit_wait_s", self.rate_limiter.acquire(reserved))
                     response = self.client.chat.completions.create(**api_params)
-                    return {
-                        "content": response.choices[0].message.content,
-                        "tool_calls": response.choices[0].message.tool_calls
-                    }
+                    break
                 except Exception as e:
-                    error_str = str(e)
-                    # Handle rate limit errors specifically
-                    if "rate_limit_exceeded" in error_str and attempt < max_retries - 1:
-                        # Exponential backoff: 1s, 2s, 4s...
-                        backoff_time = 2 ** attempt
-                        time.sleep(backoff_time)
-                        continue
-                    else:
-                        # Re-raise the exception if we've exhausted retries or it's not a rate limit error
+                    self._settle_tokens(reserved, None)
+                    backoff_time = self._retry_delay(e, attempt)
+                    if backoff_time is None:
                         raise
-            
+                    span.add("retries", 1)
+                    span.add("backoff_s", backoff_time)
+                    time.sleep(backoff_time)
+            for chunk in response:
+                for delta in self._parse_stream_chunk(chunk):
+                    if "ttft_s" not in span.attributes:
+                        span.set_attributes(ttft_s=time.perf_counter() - start)
+                    yield delta
+        except Exception as e:
+            span.error = f"{type(e).__name__}: {str(e)}"
+            raise ValueError(f"OpenAI API error: {str(e)}")
+        finally:
+            tracer.end_span(span)
+
+    def stream_text(self, *args, **kwargs) -> Iterator[str]:
+        """Stream only the text of a completion, e.g. for st.write_stream"""
+        for delta in self.stream(*args, **kwargs):
+            if delta["type"] == "content":
+                yield delta["content"]
+
+
+# Background event loop shared by all async providers, so sync callers (agents, Streamlit) can
+# fan requests out without owning a loop, and async clients always live on the same loop
+_event_loop: Optional[asyncio.AbstractEventLoop] = None
+_event_loop_lock = threading.Lock()
+
+
+def get_event_loop() -> asyncio.AbstractEventLoop:
+    """Return the process-wide event loop used for LLM requests, starting it on first use"""
+    global _event_loop
+    with _event_loop_lock:
+        if _event_loop is None:
+            _event_loop = asyncio.new_event_loop()
+            threading.Thread(target=_event_loop.run_forever, name="llm-event-loop", daemon=True).start()
+    return _event_loop
+
+
+def submit_coroutine(coro) -> concurrent.futures.Future:
+    """
+    Schedule a coroutine on the shared LLM event loop, like asyncio.run_coroutine_threadsafe, but
+    run it in a copy of the caller's context so context variables (e.g. the current trace span)
+    carry over. Cancelling the returned future cancels the coroutine.
+    """
+    loop = get_event_loop()
+    context = contextvars.copy_context()
+    future: concurrent.futures.Future = concurrent.futures.Future()
+
+    def start():
+        if future.cancelled():
+            coro.close()
+            return
+        task = context.run(loop.create_task, coro)
+
+        def on_task_done(task: asyncio.Task):
+            if future.cancelled():
+                return
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+
+        task.add_done_callback(on_task_done)
+        future.add_done_callback(lambda f: f.cancelled() and loop.call_soon_threadsafe(task.cancel))
+
+    loop.call_soon_threadsafe(start)
+    return future
+
+
+def run_coroutine(coro) -> Any:
+    """Run a coroutine on the shared LLM event loop and block until it finishes"""
+    return submit_coroutine(coro).result()
+
+
+class AsyncOpenAILLMProvider(OpenAILLMProvider):
+    """
+    OpenAI provider backed by AsyncOpenAI.
+
+    Requests from every caller run on one shared event loop with a single client (and HTTP
+    connection pool) per provider, and at most `max_concurrency` requests are in flight at once.
+    The sync `generate`/`generate_batch` methods keep it a drop-in replacement for OpenAILLMProvider.
+    """
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        super().__init__(config)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    def _create_client(self):
+        return get_openai_client(self.api_key, self.base_url, async_client=True, max_retries=0)
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it is bound to the shared event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    async def _asend_request(self, api_params: Dict[str, Any], span: Span) -> Dict[str, Any]:
+        """Async version of _send_request, also bounded by the provider's concurrency limit"""
+        reserved = self._estimate_tokens(api_params)
+        response = None
+        try:
+            if self.rate_limiter is not None:
+                span.add("rate_limit_wait_s", await self.rate_limiter.aacquire(reserved))
+            wait_start = time.perf_counter()
+            async with self.semaphore:
+                span.add("queue_wait_s", time.perf_counter() - wait_start)
+                response = self._parse_response(await self.client.chat.completions.create(**api_params))
+        finally:
+            self._settle_tokens(reserved, response)
+        return response
+
+    async def agenerate(self, prompt: str, system_prompt: str = "", context: Context = None,
+                        tools: Optional[List[Dict[str, Any]]] = None,
+                        tool_choice: Optional[Union[str, Dict[str, Any]]] = "auto",
+                        response_format: Optional[Dict[str, Any]] = None, cache: bool = True,
+                        semantic_cache_key: Optional[str] = None) -> Dict[str, Any]:
+        """Async version of generate; see OpenAILLMProvider.generate for arguments"""
+        with get_tracer().llm_span(model=self.model) as span:
+            api_params = self._prepare_api_params(prompt, system_prompt, context, tools, tool_choice, response_format)
+            # Cache lookups may touch the disk (or the embeddings API), so keep them off the event loop
+            use_cache = cache and self.response_cache is not None
+            span.set_attributes(cache_hit=False)
+            if use_cache:
+                cached = await asyncio.to_thread(self._cached_response, api_params, cache, semantic_cache_key)
+                if cached is not None:
+                    span.set_attributes(cache_hit=True)
+                    return cached
+
+            try:
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        response = await self._asend_request(api_params, span)
+                        self._trace_response(span, response)
+                        if use_cache:
+                            await asyncio.to_thread(self._cache_response, api_params, response, cache, semantic_cache_key)
+                        return response
+                    except Exception as e:
+                        backoff_time = self._retry_delay(e, attempt)
+                        if backoff_time is None:
+                            raise
+                        span.add("retries", 1)
+                        span.add("backoff_s", backoff_time)
+                        await asyncio.sleep(backoff_time)
+            except Exception as e:
+                raise ValueError(f"OpenAI API error: {str(e)}")
+
+    async def agenerate_batch(self, requests: List[Dict[str, Any]], return_exceptions: bool = False) -> List[Dict[str, Any]]:
+        """Async version of generate_batch; responses are returned in request order"""
+        return await asyncio.gather(*(self.agenerate(**request) for request in requests),
+                                    return_exceptions=return_exceptions)
+
+    async def astream(self, prompt: str, system_prompt: str = "", context: Context = None,
+                      tools: Optional[List[Dict[str, Any]]] = None,
+                      tool_choice: Optional[Union[str, Dict[str, Any]]] = "auto",
+                      response_format: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+        """Async version of stream; see OpenAILLMProvider.stream for the deltas yielded"""
+        api_params = self._prepare_api_params(prompt, system_prompt, context, tools, tool_choice, response_format)
+        api_params["stream"] = True
+
+        # The span isn't made current: the caller's code runs between the yields
+        tracer = get_tracer()
+        span = tracer.start_span("llm.stream", kind=LLM, model=self.model)
+        start = time.perf_counter()
+        try:
+            reserved = self._estimate_tokens(api_params)
+            async with self.semaphore:
+                span.set_attributes(queue_wait_s=time.perf_counter() - start)
+                for attempt in range(self.max_retries + 1):
+                    try:
+                        if self.rate_limiter is not None:
+                            span.add("rate_limit_wait_s", await self.rate_limiter.aacquire(reserved))
+                        response = await self.client.chat.completions.create(**api_params)
+                        break
+                    except Exception as e:
+                        self._settle_tokens(reserved, None)
+                        backoff_time = self._retry_delay(e, attempt)
+                        if backoff_time is None:
+                            raise
+                        span.add("retries", 1)
+                        span.add("backoff_s", backoff_time)
+                        await asyncio.sleep(backoff_time)
+                async for chunk in response:
+                    for delta in self._parse_stream_chunk(chunk):
+                        if "ttft_s" not in span.attributes:
+                            span.set_attributes(ttft_s=time.perf_counter() - start)
+                        yield delta
         except Exception as e:
-            raise ValueError(f"OpenAI API error: {str(e)}") 
+            span.error = f"{type(e).__name__}: {str(e)}"
+            raise ValueError(f"OpenAI API error: {str(e)}")
+        finally:
+            tracer.end_span(span)
+
+    def generate(self, prompt: str, system_prompt: str = "", context: Context = None,
+                 tools: Optional[List[Dict[str, Any]]] = None,
+                 tool_choice: Optional[Union[str, Dict[str, Any]]] = "auto",
+                 response_format: Optional[Dict[str, Any]] = None, cache: bool = True,
+                 semantic_cache_key: Optional[str] = None) -> Dict[str, Any]:
+        return run_coroutine(self.agenerate(prompt, system_prompt, context, tools, tool_choice, response_format, cache,
+                                             semantic_cache_key))
+
+    def stream(self, prompt: str, system_prompt: str = "", context: Context = None,
+               tools: Optional[List[Dict[str, Any]]] = None,
+               tool_choice: Optional[Union[str, Dict[str, Any]]] = "auto",
+               response_format: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+        # Pump the async stream on the shared loop and hand deltas to this thread through a queue
+        deltas: queue.Queue = queue.Queue()
+        end_of_stream = object()
+
+        async def pump():
+            try:
+                async for delta in self.astream(prompt, system_prompt, context, tools, tool_choice, response_format):
+                    deltas.put(delta)
+            except Exception as e:
+                deltas.put(e)
+            finally:
+                deltas.put(end_of_stream)
+
+        future = submit_coroutine(pump())
+        try:
+            while True:
+                delta = deltas.get()
+                if delta is end_of_stream:
+                    break
+                if isinstance(delta, Exception):
+                    raise delta
+                yield delta
+        finally:
+            # Stop generating if the consumer stops reading early
+            future.cancel()
+
+    def generate_batch(self, requests: List[Dict[str, Any]], return_exceptions: bool = False) -> List[Dict[str, Any]]:
+        return run_coroutine(self.agenerate_batch(requests, return_exceptions))
+
+
+_providers: Dict[Any, OpenAILLMProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_llm_provider(config: Optional[Dict[str, Any]] = None,
+                     provider_class: type = AsyncOpenAILLMProvider) -> OpenAILLMProvider:
+    """
+    Return the process-wide provider for a configuration
+    
+    Providers are shared by every agent with the same configuration, keyed by model, API key, base
+    URL and the rest of the config, so their clients, concurrency limits and token caches are too.
+    
+    Args:
+        config (Dict[str, Any], optional): Provider configuration, see OpenAILLMProvider
+        provider_class (type, optional): Provider implementation, defaults to AsyncOpenAILLMProvider
+        
+    Returns:
+        OpenAILLMProvider: The shared provider
+    """
+    config = config or {}
+    key = (provider_class, json.dumps(config, sort_keys=True, default=str))
+    with _providers_lock:
+        provider = _providers.get(key)
+        if provider is None:
+            provider = _providers[key] = provider_class(config)
+        return provider
@@ -0,0 +1,156 @@
+import time
+import asyncio
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from agent_marketplace.config import get_settings
+from agent_marketplace.services.llm import AsyncOpenAILLMProvider, OpenAILLMProvider, get_llm_provider, run_coroutine
+from agent_marketplace.services.replay_llm import ReplayLLMProvider
+from agent_marketplace.services.tracing import LLM, get_tracer
+
+# Kinds of LLM calls agents make; cheap classification-style calls go to the fast model by default
+ROUTES = ["reply", "summarization", "extraction", "validation", "state_check"]
+FAST_ROUTES = ["extraction", "validation", "state_check"]
+
+# Provider implementations by the prefix of "provider:model" strings
+PROVIDER_CLASSES = {
+    "openai": AsyncOpenAILLMProvider,
+    "replay": ReplayLLMProvider,  # Recorded responses, for offline runs and benchmarks
+}
+
+# model_config keys that are passed through to the providers
+PROVIDER_CONFIG_KEYS = ["api_key", "base_url", "temperature", "max_tokens", "max_tokens_per_request",
+                        "max_retries", "max_concurrency", "response_cache", "requests_per_minute", "tokens_per_minute",
+                        "cassette_dir", "replay_mode", "latency", "seed"]
+
+
+def parse_model(model: str) -> Tuple[str, str]:
+    """Split a "provider:model" string, e.g. "openai:gpt-4o-mini"; a bare model name means OpenAI"""
+    provider, _, name = model.rpartition(":")
+    return provider or "openai", name
+
+
+class ModelRouter:
+    """
+    Routes each kind of LLM call to its own model, and records latency and token usage per route.
+
+    Models come from the agent's model_config, falling back to Settings:
+        - "model": model for replies and summarization, e.g. "openai:gpt-4o"
+        - "fast_model": model for extraction, validation and state checks, e.g. "openai:gpt-4o-mini"
+        - "routes": per-route overrides, e.g. {"validation": "openai:gpt-4o"}
+
+    The router has the same generate/generate_batch/stream interface as a provider, plus a `route`
+    argument (or a "route" key in batch requests) that defaults to "reply".
+    """
+    def __init__(self, model_config: Optional[dict] = None):
+        model_config = model_config or {}
+        settings = get_settings()
+        model = model_config.get("model") or settings.llm_model
+        fast_model = model_config.get("fast_model") or settings.llm_fast_model
+        self.routes: Dict[str, str] = {route: fast_model if route in FAST_ROUTES else model for route in ROUTES}
+        self.routes.update(model_config.get("routes", {}))
+
+        provider_config = {key: model_config[key] for key in PROVIDER_CONFIG_KEYS if key in model_config}
+        self.providers: Dict[str, OpenAILLMProvider] = {}
+        for route, route_model in self.routes.items():
+            provider_name, model_name = parse_model(route_model)
+            if provider_name not in PROVIDER_CLASSES:
+                raise ValueError(f"Unsupported LLM provider '{provider_name}' for route '{route}'")
+            self.providers[route] = get_llm_provider({**provider_config, "model": model_name},
+                                                     provider_class=PROVIDER_CLASSES[provider_name])
+
+        self._lock = threading.Lock()
+        self.metrics: Dict[str, Dict[str, float]] = {
+            route: {"calls": 0, "errors": 0, "cache_hits": 0, "latency_s": 0.0, "prompt_tokens": 0, "completion_tokens": 0}
+            for route in self.routes
+        }
+
+    def provider(self, route: str = "reply") -> OpenAILLMProvider:
+        return self.providers[route]
+
+    @property
+    def model(self) -> str:
+        return self.provider("reply").model
+
+    def _record(self, route: str, latency: float, response: Optional[Dict[str, Any]] = None, error: bool = False) -> None:
+        with self._lock:
+            metrics = self.metrics[route]
+            metrics["calls"] += 1
+            metrics["latency_s"] += latency
+            if error:
+                metrics["errors"] += 1
+            if response and response.get("cached"):
+                metrics["cache_hits"] += 1
+            usage = response.get("usage") if response else None
+            if usage:
+                metrics["prompt_tokens"] += usage["prompt_tokens"]
+                metrics["completion_tokens"] += usage["completion_tokens"]
+
+    async def _agenerate(self, route: str, request: Dict[str, Any]) -> Dict[str, Any]:
+        provider = self.provider(route)
+        start = time.perf_counter()
+        # The provider records tokens, retries and cache hits on this span
+        with get_tracer().span(f"llm.{route}", kind=LLM, route=route, model=self.routes[route]):
+            try:
+                if hasattr(provider, "agenerate"):
+                    response = await provider.agenerate(**request)
+                else:
+                    response = await asyncio.to_thread(provider.generate, **request)
+            except Exception:
+                self._record(route, time.perf_counter() - start, error=True)
+                raise
+        self._record(route, time.perf_counter() - start, response)
+        return response
+
+    def generate(self, prompt: str, route: str = "reply", **kwargs) -> Dict[str, Any]:
+        """Generate with the model for a route; see OpenAILLMProvider.generate for the other arguments"""
+        return run_coroutine(self._agenerate(route, {"prompt": prompt, **kwargs}))
+
+    async def agenerate(self, prompt: str, route: str = "reply", **kwargs) -> Dict[str, Any]:
+        """Async version of generate, for coroutines running on the shared LLM event loop"""
+        return await self._agenerate(route, {"prompt": prompt, **kwargs})
+
+    def generate_batch(self, requests: List[Dict[str, Any]], return_exceptions: bool = False) -> List[Dict[str, Any]]:
+        """Run independent requests concurrently, each on the model for its "route" key"""
+        async def gather():
+            return await asyncio.gather(
+                *(self._agenerate(request.get("route", "reply"),
+                                  {key: value for key, value in request.items() if key != "route"})
+                  for request in requests),
+                return_exceptions=return_exceptions
+            )
+        return run_coroutine(gather())
+
+    def stream(self, prompt: str, route: str = "reply", **kwargs) -> Iterator[Dict[str, Any]]:
+        """Stream with the model for a route; see OpenAILLMProvider.stream"""
+        start = time.perf_counter()
+        try:
+            yield from self.provider(route).stream(prompt, **kwargs)
+        except Exception:
+            self._record(route, time.perf_counter() - start, error=True)
+            raise
+        self._record(route, time.perf_counter() - start)
+
+    def stream_text(self, prompt: str, route: str = "reply", **kwargs) -> Iterator[str]:
+        for delta in self.stream(prompt, route, **kwargs):
+            if delta["type"] == "content":
+                yield delta["content"]
+
+    def rate_limits(self) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Return the rate limiter utilization of each route's model, None if it isn't rate limited"""
+        return {
+            route: provider.rate_limiter.stats() if provider.rate_limiter is not None else None
+            for route, provider in self.providers.items()
+        }
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        """Return per-route model, call count, error count, average latency and token totals"""
+        with self._lock:
+            return {
+                route: {
+                    "model": self.routes[route],
+                    **metrics,
+                    "avg_latency_s": metrics["latency_s"] / metrics["calls"] if metrics["calls"] else 0.0,
+                }
+                for route, metrics in self.metrics.items()
+            }
@@ -0,0 +1,54 @@
+import threading
+from typing import Dict, Optional, Tuple, Union
+
+import httpx
+from openai import DEFAULT_MAX_RETRIES, OpenAI, AsyncOpenAI
+
+from agent_marketplace.config import get_settings
+
+_clients: Dict[Tuple[bool, Optional[str], Optional[str], int], Union[OpenAI, AsyncOpenAI]] = {}
+_clients_lock = threading.Lock()
+
+
+def get_http_limits() -> httpx.Limits:
+    """Connection pool limits for the shared OpenAI HTTP clients, from Settings"""
+    settings = get_settings()
+    return httpx.Limits(
+        max_connections=settings.llm_max_connections,
+        max_keepalive_connections=settings.llm_max_keepalive_connections,
+        keepalive_expiry=settings.llm_keepalive_expiry,
+    )
+
+
+def get_openai_client(api_key: Optional[str], base_url: Optional[str] = None,
+                      async_client: bool = False, max_retries: int = DEFAULT_MAX_RETRIES) -> Union[OpenAI, AsyncOpenAI]:
+    """
+    Return the process-wide OpenAI client for an API key and base URL
+    
+    Clients are created once and reused, so their keep-alive HTTP connection pool (and the TLS
+    sessions in it) is shared by every provider and agent instead of being rebuilt per call.
+    
+    Args:
+        api_key (str): OpenAI API key
+        base_url (str, optional): API base URL, defaults to the official endpoint
+        async_client (bool, optional): Return an AsyncOpenAI client instead of OpenAI
+        max_retries (int, optional): Retries done by the client itself; LLM providers pass 0 because
+            they retry through the shared rate limiter
+        
+    Returns:
+        Union[OpenAI, AsyncOpenAI]: The shared client
+    """
+    key = (async_client, api_key, base_url, max_retries)
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            settings = get_settings()
+            timeout = httpx.Timeout(settings.llm_timeout)
+            if async_client:
+                http_client = httpx.AsyncClient(limits=get_http_limits(), timeout=timeout)
+                client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=max_retries)
+            else:
+                http_client = httpx.Client(limits=get_http_limits(), timeout=timeout)
+                client = OpenAI(api_key=api_key, base_url=base_url, http_client=http_client, max_retries=max_retries)
+            _clients[key] = client
+        return client
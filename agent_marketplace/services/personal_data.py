@@ -0,0 +1,181 @@
+import os
+import json
+import threading
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+
+from agent_marketplace.schemas.personal_data import BloodTest, Medication, Purchase, Vitals
+from agent_marketplace.services.cache import hash_key
+from agent_marketplace.services.health_analytics import Finding, analyze_health
+from agent_marketplace.services.health_series import HealthSeries
+from agent_marketplace.services.purchase_index import PurchaseIndex
+
+PERSONAL_DATA_DIR = os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "..", "data", "personal_data"))
+
+HEALTH_DATA_FILE = "sample_health_data.json"
+PURCHASE_HISTORY_FILE = "purchase_history_data.json"
+BASIC_INFO_FILE = "basic_info.json"
+
+
+class _FileEntry:
+    """A file's contents as of one (mtime, size), with its parsed JSON and values derived from it"""
+    _UNPARSED = object()
+
+    def __init__(self, signature: tuple, text: str):
+        self.signature = signature
+        self.text = text
+        self.parsed: Any = self._UNPARSED
+        self.derived: Dict[str, Any] = {}
+
+
+class PersonalDataStore:
+    """
+    Read-through cache of the users' personal data files in data/personal_data/<user>/.
+
+    Each file is read and parsed once; later reads only stat it and reuse the cached contents until
+    its modification time or size changes. Typed accessors (blood tests, vitals, health metric time
+    series and findings, medications, purchases) are derived from the parsed JSON and cached alongside it.
+
+    Parsed objects are shared by every caller, so treat them as read-only. The store is thread-safe
+    and has no Streamlit dependency; in a Streamlit app, keep one per process with st.cache_resource.
+    """
+    def __init__(self, data_dir: str = PERSONAL_DATA_DIR):
+        self.data_dir = data_dir
+        self._files: Dict[str, _FileEntry] = {}
+        # Reentrant, since derived values may be built from other derived values
+        self._lock = threading.RLock()
+        self.counters = {"reads": 0, "hits": 0}
+
+    def users(self) -> List[str]:
+        return sorted(name for name in os.listdir(self.data_dir) if os.path.isdir(os.path.join(self.data_dir, name)))
+
+    def user_dir(self, user: str) -> str:
+        user_dir = os.path.join(self.data_dir, user)
+        if not os.path.isdir(user_dir):
+            raise ValueError(f"Personal data directory {user_dir} does not exist. Is the client name correct?")
+        return user_dir
+
+    def files(self, user: str) -> List[str]:
+        """Names of the user's JSON data files, sorted"""
+        return sorted(file for file in os.listdir(self.user_dir(user)) if file.endswith(".json"))
+
+    def has_file(self, user: str, file: str) -> bool:
+        return os.path.isfile(os.path.join(self.data_dir, user, file))
+
+    def _entry(self, path: str) -> _FileEntry:
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._files.get(path)
+            if entry is not None and entry.signature == signature:
+                self.counters["hits"] += 1
+                return entry
+            with open(path, encoding="utf-8") as f:
+                entry = _FileEntry(signature, f.read())
+            self._files[path] = entry
+            self.counters["reads"] += 1
+            return entry
+
+    def read_text(self, path: str) -> str:
+        """Return the contents of a file"""
+        return self._entry(path).text
+
+    def load_json(self, path: str) -> Any:
+        """Return the parsed JSON of a file"""
+        entry = self._entry(path)
+        with self._lock:
+            if entry.parsed is _FileEntry._UNPARSED:
+                entry.parsed = json.loads(entry.text)
+            return entry.parsed
+
+    def content_hash(self, path: str) -> str:
+        """Hash of a file's contents, e.g. for cache keys"""
+        return self._derive(path, "content_hash", lambda entry: hash_key(entry.text))
+
+    def _derive(self, path: str, name: str, build: Callable[[_FileEntry], Any]) -> Any:
+        entry = self._entry(path)
+        with self._lock:
+            if name not in entry.derived:
+                entry.derived[name] = build(entry)
+            return entry.derived[name]
+
+    def _derive_json(self, user: str, file: str, name: str, build: Callable[[Any], Any], default: Any) -> Any:
+        """A value built from the parsed JSON of one of the user's files, or `default` if it doesn't exist"""
+        if not self.has_file(user, file):
+            return default
+        path = os.path.join(self.data_dir, user, file)
+        data = self.load_json(path)
+        return self._derive(path, name, lambda entry: build(data))
+
+    def load(self, user: str, file: str) -> Any:
+        """Return the parsed JSON of one of the user's data files"""
+        return self.load_json(os.path.join(self.user_dir(user), file))
+
+    def basic_info(self, user: str) -> Optional[str]:
+        """The user's basic info as raw JSON text, or None if there is none"""
+        if not self.has_file(user, BASIC_INFO_FILE):
+            return None
+        return self.read_text(os.path.join(self.data_dir, user, BASIC_INFO_FILE))
+
+    def health_data(self, user: str) -> Optional[Dict[str, Any]]:
+        """The user's complete health record, or None if there is none"""
+        if not self.has_file(user, HEALTH_DATA_FILE):
+            return None
+        return self.load(user, HEALTH_DATA_FILE)
+
+    def blood_tests(self, user: str) -> List[BloodTest]:
+        """The user's blood tests, oldest first"""
+        return self._derive_json(user, HEALTH_DATA_FILE, "blood_tests", lambda data: sorted(
+            (BloodTest.model_validate(test) for test in data.get("bloodTests", [])), key=lambda test: test.date
+        ), [])
+
+    def latest_blood_test(self, user: str) -> Optional[BloodTest]:
+        blood_tests = self.blood_tests(user)
+        return blood_tests[-1] if blood_tests else None
+
+    def vitals(self, user: str) -> List[Vitals]:
+        """The user's series of vital sign readings, oldest first"""
+        return self._derive_json(user, HEALTH_DATA_FILE, "vitals", lambda data: sorted(
+            (Vitals.model_validate(vitals) for vitals in data.get("vitals", [])), key=lambda vitals: vitals.date
+        ), [])
+
+    def latest_vitals(self, user: str) -> Optional[Vitals]:
+        vitals = self.vitals(user)
+        return vitals[-1] if vitals else None
+
+    def medications(self, user: str) -> List[Medication]:
+        return self._derive_json(user, HEALTH_DATA_FILE, "medications", lambda data: [
+            Medication.model_validate(medication) for medication in data.get("medicalHistory", {}).get("medications", [])
+        ], [])
+
+    def health_series(self, user: str) -> HealthSeries:
+        """The user's blood tests, vitals and health metrics as date-indexed columns per metric"""
+        return self._derive_json(user, HEALTH_DATA_FILE, "health_series", HealthSeries.from_health_data, HealthSeries({}))
+
+    def health_findings(self, user: str, rolling_days: int = 7) -> List[Finding]:
+        """Precomputed flags, changes, rolling averages and family history risks of the user's health data"""
+        return self._derive_json(user, HEALTH_DATA_FILE, f"health_findings_{rolling_days}", lambda data: analyze_health(
+            self.health_series(user), data, rolling_days
+        ), [])
+
+    def purchases(self, user: str) -> List[Purchase]:
+        """The user's shopping sessions, in file order"""
+        return self._derive_json(user, PURCHASE_HISTORY_FILE, "purchases", lambda data: [
+            Purchase.model_validate(purchase) for purchase in data.get("Data", [])
+        ], [])
+
+    def purchase_index(self, user: str) -> PurchaseIndex:
+        """Inverted index over the user's purchases, built once per version of the file"""
+        return self._derive_json(user, PURCHASE_HISTORY_FILE, "purchase_index",
+                                 lambda data: PurchaseIndex(self.purchases(user)), PurchaseIndex([]))
+
+    def stats(self) -> Dict[str, int]:
+        """Return how many file reads were served from memory and how many hit the disk"""
+        with self._lock:
+            return {**self.counters, "files": len(self._files)}
+
+
+@lru_cache()
+def get_personal_data_store() -> PersonalDataStore:
+    """Return the process-wide personal data store"""
+    return PersonalDataStore()
@@ -0,0 +1,135 @@
+import re
+import json
+import math
+from collections import defaultdict
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from agent_marketplace.config import get_settings
+from agent_marketplace.schemas.personal_data import Product, Purchase
+
+# Symptom -> product categories worth checking in the purchase history. "*" applies to queries
+# that name no symptom but one of GENERAL_HEALTH_TERMS.
+DEFAULT_SYMPTOM_TAXONOMY: Dict[str, List[str]] = {
+    "cold": ["Tissues", "Health & Personal Care", "Medicine", "First Aid"],
+    "flu": ["Tissues", "Health & Personal Care", "Medicine", "First Aid"],
+    "headache": ["Health & Personal Care", "Medicine", "First Aid"],
+    "allergies": ["Health & Personal Care", "Medicine", "First Aid", "Air Purifiers"],
+    "pain": ["Health & Personal Care", "Medicine", "First Aid"],
+    "*": ["Health & Personal Care", "Medicine", "First Aid"],
+}
+GENERAL_HEALTH_TERMS = ["health", "wellness", "medical", "sick"]
+
+# Weight of a category match relative to one title/description term match (scaled by idf)
+CATEGORY_WEIGHT = 2.0
+
+STOPWORDS = {
+    "the", "and", "for", "with", "you", "your", "are", "was", "this", "that", "these", "those", "from",
+    "have", "has", "had", "what", "which", "how", "can", "could", "should", "would", "will", "about",
+    "any", "all", "more", "most", "some", "not", "but", "our", "out", "into", "its", "it's", "my", "me",
+    "i'm", "feel", "feeling", "want", "need", "help", "get", "make", "use", "each", "per", "pack",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercase words of three or more letters, without stopwords"""
+    return [word for word in re.findall(r"[a-z][a-z0-9'&-]+", text.lower()) if len(word) > 2 and word not in STOPWORDS]
+
+
+class PurchaseIndex:
+    """
+    Inverted index over one user's purchase history.
+
+    Built once per purchase history: products are deduplicated by title, and indexed by their
+    lowercased categories and by the terms of their title and description. A query only touches the
+    posting lists of the categories its symptoms map to and of its own terms, so lookups cost
+    O(matches) rather than a scan over every session and product. Products are ranked by their
+    matching categories, then by the idf-weighted terms they share with the query.
+    """
+    def __init__(self, purchases: List[Purchase]):
+        self.products: List[Product] = []
+        self.by_category: Dict[str, List[int]] = defaultdict(list)
+        self.by_term: Dict[str, Dict[int, int]] = defaultdict(dict)
+        titles: Dict[str, int] = {}
+        for purchase in purchases:
+            for product in purchase.products:
+                if product.title in titles:
+                    continue
+                index = titles[product.title] = len(self.products)
+                self.products.append(product)
+                for category in {category.lower() for category in product.categories}:
+                    self.by_category[category].append(index)
+                for term in tokenize(f"{product.title} {product.description}"):
+                    postings = self.by_term[term]
+                    postings[index] = postings.get(index, 0) + 1
+        self.by_category = dict(self.by_category)
+        self.by_term = dict(self.by_term)
+
+    def idf(self, term: str) -> float:
+        return math.log(1 + len(self.products) / len(self.by_term[term]))
+
+    def search(self, query: str, taxonomy: Optional[Dict[str, List[str]]] = None,
+               top_k: int = 5) -> List[Tuple[Product, float]]:
+        """
+        Rank the purchased products relevant to a health query
+
+        Args:
+            query (str): The user's query
+            taxonomy (Dict[str, List[str]], optional): Symptom -> product categories, defaults to
+                the configured taxonomy (see get_symptom_taxonomy)
+            top_k (int, optional): Maximum number of products returned
+
+        Returns:
+            List[Tuple[Product, float]]: Products in the categories the query's symptoms map to,
+                with their scores, best first; queries naming no symptom or health term match nothing
+        """
+        taxonomy = taxonomy if taxonomy is not None else get_symptom_taxonomy()
+        query_lower = query.lower()
+        categories = {category.lower() for symptom, symptom_categories in taxonomy.items()
+                      if symptom != "*" and symptom in query_lower for category in symptom_categories}
+        # If no specific symptoms are found, look for general health-related terms
+        if not categories and any(term in query_lower for term in GENERAL_HEALTH_TERMS):
+            categories = {category.lower() for category in taxonomy.get("*", [])}
+        if not categories:
+            return []
+
+        scores: Dict[int, float] = defaultdict(float)
+        for category in categories:
+            for index in self.by_category.get(category, []):
+                scores[index] += CATEGORY_WEIGHT
+        # Terms the query shares with a product's title and description rank it within the matches;
+        # on their own they are too noisy (e.g. "cold" in "cold water wash")
+        for term in set(tokenize(query)):
+            if term in self.by_term:
+                idf = self.idf(term)
+                for index, count in self.by_term[term].items():
+                    if index in scores:
+                        scores[index] += idf * (1 + math.log(count))
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:top_k]
+        return [(self.products[index], score) for index, score in ranked]
+
+
+def format_purchase_context(results: List[Tuple[Product, float]], max_chars: Optional[int] = None) -> str:
+    """Render search results as a prompt section of at most max_chars characters, "" if no product fits"""
+    if not results:
+        return ""
+    max_chars = max_chars if max_chars is not None else get_settings().purchase_context_max_chars
+    header = "\nRelevant Previously Purchased Products:\n"
+    context = header
+    for product, _ in results:
+        line = f"- {product.title}\n"
+        if len(context) + len(line) > max_chars:
+            break
+        context += line
+    # Nothing but the header fit
+    return context if context != header else ""
+
+
+@lru_cache()
+def get_symptom_taxonomy() -> Dict[str, List[str]]:
+    """Return the symptom taxonomy from Settings.symptom_taxonomy_file, or the default one"""
+    path = get_settings().symptom_taxonomy_file
+    if not path:
+        return DEFAULT_SYMPTOM_TAXONOMY
+    with open(path) as f:
+        return {symptom.lower(): categories for symptom, categories in json.load(f).items()}
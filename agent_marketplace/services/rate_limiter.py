@@ -0,0 +1,197 @@
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, Optional, Tuple
+
+import openai
+
+# Statuses worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Bucket refilled continuously at `limit` units per minute, holding at most `limit` units.
+
+    Reservations are taken up front and may drive the level below zero; the caller then waits until
+    the debt has been refilled. Callers are thereby admitted in reservation order, spaced at the
+    refill rate, instead of all retrying at once when capacity frees up.
+    """
+    def __init__(self, limit: int):
+        self.capacity = float(limit)
+        self.rate = limit / 60.0  # Units per second
+        self.level = float(limit)
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take `amount` units and return the seconds until they are actually available"""
+        self._refill(now)
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+    def refund(self, amount: float, now: float) -> None:
+        """Return unused units, or take more if `amount` is negative"""
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+
+    def drain(self, now: float) -> None:
+        """Assume the quota is used up, so waiting callers resume at the refill rate"""
+        self._refill(now)
+        self.level = min(self.level, 0.0)
+
+    def utilization(self, now: float) -> float:
+        """Share of the per-minute limit in use; above 1 when callers are waiting for capacity"""
+        self._refill(now)
+        return 1.0 - self.level / self.capacity
+
+
+class RateLimiter:
+    """
+    Requests-per-minute and tokens-per-minute limiter shared by every provider calling one model.
+
+    Before dispatch, a request reserves one request and its estimated tokens (prompt plus
+    max_tokens, the way OpenAI counts them against the limit) and waits until both are available.
+    Once the response reports its actual usage, the difference is settled. A 429 pauses all
+    requests for the Retry-After time and drains the buckets, so concurrent sessions ramp back up
+    at the configured rate instead of retrying in a burst. A limit of 0 disables that bucket.
+    """
+    def __init__(self, requests_per_minute: int = 0, tokens_per_minute: int = 0):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+        self.counters = {"calls": 0, "throttled": 0, "wait_s": 0.0, "rate_limited": 0}
+
+    def reserve(self, tokens: int) -> float:
+        """Reserve capacity for one request and return how long to wait before sending it"""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(0.0, self.paused_until - now)
+            if self.requests is not None:
+                wait = max(wait, self.requests.reserve(1, now))
+            if self.tokens is not None:
+                wait = max(wait, self.tokens.reserve(tokens, now))
+            self.counters["calls"] += 1
+            if wait > 0:
+                self.counters["throttled"] += 1
+                self.counters["wait_s"] += wait
+            return wait
+
+    def acquire(self, tokens: int) -> float:
+        """Blocking reserve; returns the seconds waited"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self, tokens: int) -> float:
+        """Async reserve; returns the seconds waited"""
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+    def settle(self, reserved: int, used: int) -> None:
+        """Correct a reservation once the actual token usage is known (0 if the request failed)"""
+        if self.tokens is None or reserved == used:
+            return
+        with self._lock:
+            self.tokens.refund(reserved - used, time.monotonic())
+
+    def pause(self, seconds: float) -> None:
+        """Hold back every request for `seconds` after the API reported a rate limit"""
+        with self._lock:
+            now = time.monotonic()
+            self.paused_until = max(self.paused_until, now + seconds)
+            for bucket in (self.requests, self.tokens):
+                if bucket is not None:
+                    bucket.drain(now)
+            self.counters["rate_limited"] += 1
+
+    def utilization(self) -> Dict[str, Optional[float]]:
+        """Share of the requests and tokens per minute limits in use, None for unlimited"""
+        with self._lock:
+            now = time.monotonic()
+            return {
+                "requests": self.requests.utilization(now) if self.requests is not None else None,
+                "tokens": self.tokens.utilization(now) if self.tokens is not None else None,
+                "paused_s": max(0.0, self.paused_until - now),
+            }
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the current utilization, and how many calls were admitted, throttled or rate limited"""
+        with self._lock:
+            counters = dict(self.counters)
+        return {**self.utilization(), **counters}
+
+
+_rate_limiters: Dict[Tuple[Optional[str], str], RateLimiter] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(base_url: Optional[str], model: str,
+                     requests_per_minute: int, tokens_per_minute: int) -> RateLimiter:
+    """
+    Return the process-wide rate limiter for a model on an API endpoint
+
+    Limits are per model, so every provider of the model shares one limiter; the limits passed
+    when it is first created apply.
+    """
+    key = (base_url, model)
+    with _rate_limiters_lock:
+        limiter = _rate_limiters.get(key)
+        if limiter is None:
+            limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+            _rate_limiters[key] = limiter
+        return limiter
+
+
+def rate_limit_stats() -> Dict[str, Dict[str, Any]]:
+    """Return the stats of every rate limiter, by model"""
+    with _rate_limiters_lock:
+        limiters = dict(_rate_limiters)
+    return {model if base_url is None else f"{base_url} {model}": limiter.stats()
+            for (base_url, model), limiter in limiters.items()}
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    return isinstance(error, openai.RateLimitError) or "rate_limit_exceeded" in str(error)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Whether a failed request may succeed if sent again"""
+    if is_rate_limit_error(error) or isinstance(error, openai.APIConnectionError):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code in RETRYABLE_STATUS_CODES
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds to wait before retrying, from the Retry-After(-ms) headers of a failed response"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        if headers.get("retry-after-ms") is not None:
+            return float(headers["retry-after-ms"]) / 1000
+        value = headers.get("retry-after")
+        if value is None:
+            return None
+        try:
+            return float(value)
+        except ValueError:
+            # An HTTP date
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """Exponential backoff with full jitter: uniform in [0, min(cap, base * 2**attempt)]"""
+    return random.uniform(0, min(cap, base * 2 ** attempt))
@@ -0,0 +1,165 @@
+import math
+import random
+import asyncio
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from agent_marketplace.services.cache import JSONDiskCache
+from agent_marketplace.services.llm import AsyncOpenAILLMProvider, count_text_tokens
+from agent_marketplace.services.openai_clients import get_openai_client
+from agent_marketplace.services.rate_limiter import RateLimiter
+from agent_marketplace.services.response_cache import ResponseCache
+
+
+class LatencyModel:
+    """
+    Synthetic LLM latency: a base latency drawn from a distribution plus a time per completion token.
+
+    Specs are strings: "none", "fixed:<seconds>", "uniform:<low>:<high>" or
+    "lognormal:<median>:<sigma>", optionally followed by "+<seconds per token>", e.g.
+    "lognormal:0.8:0.5+0.01". Each request's latency is drawn from a generator seeded with the
+    request key, so replays are deterministic no matter in which order requests run.
+    """
+    def __init__(self, spec: str = "none", seed: int = 0):
+        self.spec = spec
+        self.seed = seed
+        base, _, per_token = spec.partition("+")
+        self.per_token = float(per_token) if per_token else 0.0
+        self.distribution, *params = base.split(":")
+        self.params = [float(param) for param in params]
+        if self.distribution not in ("none", "fixed", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution '{self.distribution}'")
+
+    def sample(self, key: str, completion_tokens: int = 0) -> float:
+        rng = random.Random(f"{self.seed}:{key}")
+        if self.distribution == "fixed":
+            base = self.params[0]
+        elif self.distribution == "uniform":
+            base = rng.uniform(self.params[0], self.params[1])
+        elif self.distribution == "lognormal":
+            base = rng.lognormvariate(math.log(self.params[0]), self.params[1])
+        else:
+            base = 0.0
+        return base + self.per_token * completion_tokens
+
+
+class ReplayLLMProvider(AsyncOpenAILLMProvider):
+    """
+    LLM provider that answers from recorded cassettes instead of the OpenAI API.
+
+    Cassettes are a directory of JSON responses keyed by the hash of the request (model, messages,
+    temperature, tools, ...), the same key the response cache uses. Modes:
+        - "replay": answer from the cassettes; a request without a recording is passed to
+          `fallback(api_params)` if set, and fails otherwise
+        - "record": call the OpenAI API for requests without a recording and record the response
+
+    Replayed responses are delayed by the configured LatencyModel, so benchmarks see realistic
+    concurrency without any network. Everything else (token counting, context truncation,
+    concurrency limits, response cache) is the real AsyncOpenAILLMProvider code path.
+
+    Config keys, in addition to OpenAILLMProvider's: "cassette_dir", "replay_mode", "latency"
+    (LatencyModel spec) and "seed". Replays are only rate limited if "requests_per_minute" or
+    "tokens_per_minute" is set, e.g. to benchmark behavior under a quota.
+    """
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        super().__init__(config)
+        if self.replay_mode == "replay" and not self.api_key:
+            # Replaying never calls the API
+            self.api_key = "replay"
+        # Builds a response for requests missing from the cassettes: fallback(api_params) -> {"content": ...}
+        self.fallback: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None
+
+    def _create_client(self):
+        self.replay_mode = self.config.get("replay_mode", self.settings.replay_mode)
+        if self.replay_mode not in ("replay", "record"):
+            raise ValueError(f"Unknown replay mode '{self.replay_mode}'")
+        self.cassette = JSONDiskCache(self.config.get("cassette_dir", self.settings.replay_cassette_dir))
+        self.latency = LatencyModel(self.config.get("latency", self.settings.replay_latency), self.config.get("seed", 0))
+        self.counters = {"replayed": 0, "recorded": 0, "fallback": 0}
+        return SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=self._create_completion)))
+
+    def _create_rate_limiter(self) -> Optional[RateLimiter]:
+        # Replayed requests don't count against any quota, unless a limit is configured explicitly
+        if self.replay_mode == "replay" and not any(key in self.config for key in ("requests_per_minute", "tokens_per_minute")):
+            return None
+        return super()._create_rate_limiter()
+
+    async def _create_completion(self, **api_params) -> Any:
+        """Drop-in for AsyncOpenAI chat.completions.create"""
+        stream = api_params.pop("stream", False)
+        key = ResponseCache.make_key(api_params)
+        entry = self.cassette.get(key)
+        if entry is not None:
+            self.counters["replayed"] += 1
+        elif self.replay_mode == "record":
+            entry = await self._record(key, api_params)
+            self.counters["recorded"] += 1
+        elif self.fallback is not None:
+            entry = self._complete_entry(self.fallback(api_params), api_params)
+            self.counters["fallback"] += 1
+        else:
+            raise ValueError(f"No recorded response for request {key[:12]} in {self.cassette.directory}")
+
+        if self.replay_mode == "replay":
+            # A stream starts after the base latency and spends the per-token time between its chunks
+            await asyncio.sleep(self.latency.sample(key, 0 if stream else entry["usage"]["completion_tokens"]))
+        return self._stream_chunks(entry) if stream else self._completion(entry)
+
+    async def _record(self, key: str, api_params: Dict[str, Any]) -> Dict[str, Any]:
+        client = get_openai_client(self.api_key, self.base_url, async_client=True, max_retries=0)
+        response = self._parse_response(await client.chat.completions.create(**api_params))
+        entry = {
+            "content": response["content"],
+            "tool_calls": [
+                {"id": tool_call.id, "type": "function",
+                 "function": {"name": tool_call.function.name, "arguments": tool_call.function.arguments}}
+                for tool_call in response["tool_calls"] or []
+            ] or None,
+            "usage": response["usage"],
+        }
+        entry = self._complete_entry(entry, api_params)
+        self.cassette.set(key, entry)
+        return entry
+
+    def _complete_entry(self, entry: Dict[str, Any], api_params: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill in the tool calls and token usage of an entry that doesn't have them"""
+        entry = {"content": entry.get("content"), "tool_calls": entry.get("tool_calls"), "usage": entry.get("usage")}
+        if not entry["usage"]:
+            prompt_tokens = self._count_tokens(api_params["messages"])
+            completion_tokens = count_text_tokens(self.encoding_name, entry["content"] or "")
+            entry["usage"] = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                              "total_tokens": prompt_tokens + completion_tokens}
+        return entry
+
+    @staticmethod
+    def _tool_calls(entry: Dict[str, Any]) -> Optional[List[Any]]:
+        if not entry.get("tool_calls"):
+            return None
+        return [
+            SimpleNamespace(id=tool_call["id"], type="function", index=index,
+                            function=SimpleNamespace(**tool_call["function"]))
+            for index, tool_call in enumerate(entry["tool_calls"])
+        ]
+
+    def _completion(self, entry: Dict[str, Any]) -> Any:
+        message = SimpleNamespace(content=entry["content"], tool_calls=self._tool_calls(entry))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=SimpleNamespace(**entry["usage"]))
+
+    async def _stream_chunks(self, entry: Dict[str, Any]):
+        """Replay a response as streamed chunks: one per word, then one per tool call"""
+        words = (entry["content"] or "").split(" ")
+        chunk_latency = 0.0
+        if self.replay_mode == "replay" and entry["content"]:
+            chunk_latency = self.latency.per_token * entry["usage"]["completion_tokens"] / len(words)
+        for index, word in enumerate(words if entry["content"] else []):
+            if chunk_latency:
+                await asyncio.sleep(chunk_latency)
+            delta = SimpleNamespace(content=word if index == 0 else f" {word}", tool_calls=None)
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+        for tool_call in self._tool_calls(entry) or []:
+            delta = SimpleNamespace(content=None, tool_calls=[tool_call])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+    def stats(self) -> Dict[str, int]:
+        """Return how many requests were replayed, recorded and answered by the fallback"""
+        return dict(self.counters)
@@ -0,0 +1,187 @@
+import os
+import math
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from agent_marketplace.config import get_settings
+from agent_marketplace.services.cache import JSONDiskCache, get_disk_cache, hash_key
+from agent_marketplace.services.openai_clients import get_openai_client
+
+# Request parameters that determine a completion; anything else (stream, ...) is not part of the key
+KEY_PARAMS = ["model", "messages", "temperature", "max_tokens", "tools", "tool_choice", "response_format"]
+
+
+def cosine_similarity(a: List[float], b: List[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    norm = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+    return dot / norm if norm else 0.0
+
+
+class ResponseCache:
+    """
+    Cache of LLM responses in front of the provider's generate.
+
+    The exact tier is an in-memory LRU keyed by a hash of the request (model, messages, temperature,
+    max_tokens, tools, tool_choice, response_format), backed by a disk cache so entries survive
+    restarts. The optional semantic tier only serves calls that opt in with a semantic key, the
+    user's question within the prompt: it embeds that question and returns the response of a cached
+    request whose question is similar enough, as long as everything else in the request (model,
+    parameters, messages with the question left out) is identical. Templated agent prompts
+    (state checks, validation, extraction) never opt in, so they can't match each other across
+    conversations.
+
+    Only plain-text responses are cached; responses with tool calls always go to the LLM.
+    """
+    def __init__(self, max_entries: int = 1000, disk_cache: Optional[JSONDiskCache] = None,
+                 embed: Optional[Callable[[str], List[float]]] = None,
+                 similarity_threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.disk_cache = disk_cache
+        self.embed = embed
+        self.similarity_threshold = similarity_threshold
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Semantic index: scope key -> [(embedding, exact key)]
+        self._embeddings: Dict[str, List[Tuple[List[float], str]]] = {}
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {"hits": 0, "disk_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0}
+
+    @staticmethod
+    def make_key(api_params: Dict[str, Any]) -> str:
+        return hash_key(*(api_params.get(param) for param in KEY_PARAMS))
+
+    @staticmethod
+    def _semantic_scope(api_params: Dict[str, Any], semantic_key: str) -> Optional[str]:
+        """A key for everything in a request but the question, or None if the last user message doesn't contain it"""
+        messages = api_params.get("messages") or []
+        if not messages or messages[-1]["role"] != "user" or semantic_key not in (messages[-1].get("content") or ""):
+            return None
+        last = {**messages[-1], "content": messages[-1]["content"].replace(semantic_key, "")}
+        return ResponseCache.make_key({**api_params, "messages": messages[:-1] + [last]})
+
+    def get(self, api_params: Dict[str, Any], semantic_key: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return the cached response for a request, or None on a miss; see the class for semantic_key"""
+        key = self.make_key(api_params)
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return response
+
+        if self.disk_cache is not None:
+            response = self.disk_cache.get(key)
+            if response is not None:
+                self._store(key, response)
+                with self._lock:
+                    self.counters["hits"] += 1
+                    self.counters["disk_hits"] += 1
+                return response
+
+        if self.embed is not None and semantic_key:
+            response = self._semantic_get(api_params, semantic_key)
+            if response is not None:
+                with self._lock:
+                    self.counters["hits"] += 1
+                    self.counters["semantic_hits"] += 1
+                return response
+
+        with self._lock:
+            self.counters["misses"] += 1
+        return None
+
+    def _semantic_get(self, api_params: Dict[str, Any], semantic_key: str) -> Optional[Dict[str, Any]]:
+        scope = self._semantic_scope(api_params, semantic_key)
+        with self._lock:
+            candidates = list(self._embeddings.get(scope, [])) if scope is not None else []
+        if not candidates:
+            return None
+
+        embedding = self.embed(semantic_key)
+        best_key, best_similarity = None, self.similarity_threshold
+        for candidate, key in candidates:
+            similarity = cosine_similarity(embedding, candidate)
+            if similarity >= best_similarity:
+                best_key, best_similarity = key, similarity
+        if best_key is None:
+            return None
+        with self._lock:
+            response = self._entries.get(best_key)
+            if response is not None:
+                self._entries.move_to_end(best_key)
+            return response
+
+    def set(self, api_params: Dict[str, Any], response: Dict[str, Any], semantic_key: Optional[str] = None) -> None:
+        """Cache a response, and index it for the semantic tier if a semantic key is given; responses with tool calls are skipped"""
+        if response.get("tool_calls") or response.get("content") is None:
+            return
+        entry = {"content": response["content"], "tool_calls": None, "usage": response.get("usage")}
+        key = self.make_key(api_params)
+        self._store(key, entry)
+        if self.disk_cache is not None:
+            try:
+                self.disk_cache.set(key, entry)
+            except OSError:
+                # Persistence is best effort, the in-memory entry is still usable
+                pass
+
+        if self.embed is not None and semantic_key:
+            scope = self._semantic_scope(api_params, semantic_key)
+            if scope is not None:
+                embedding = self.embed(semantic_key)
+                with self._lock:
+                    self._embeddings.setdefault(scope, []).append((embedding, key))
+
+    def _store(self, key: str, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self.counters["evictions"] += 1
+                for scope, embeddings in list(self._embeddings.items()):
+                    embeddings[:] = [item for item in embeddings if item[1] != evicted]
+                    if not embeddings:
+                        del self._embeddings[scope]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._embeddings.clear()
+        if self.disk_cache is not None:
+            self.disk_cache.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return hit (total, from disk, semantic), miss and eviction counters and the hit rate"""
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": self.counters["hits"] / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+def openai_embedder(model: str = "text-embedding-3-small") -> Callable[[str], List[float]]:
+    """Return an embedding function backed by the shared OpenAI client"""
+    settings = get_settings()
+    client = get_openai_client(settings.openai_api_key or os.getenv("OPENAI_API_KEY"), settings.openai_base_url)
+
+    @lru_cache(maxsize=4096)
+    def embed(text: str) -> List[float]:
+        return client.embeddings.create(model=model, input=text).data[0].embedding
+
+    return embed
+
+
+@lru_cache()
+def get_response_cache() -> ResponseCache:
+    """Return the process-wide response cache configured from Settings"""
+    settings = get_settings()
+    return ResponseCache(
+        max_entries=settings.response_cache_max_entries,
+        disk_cache=get_disk_cache("llm_responses") if settings.response_cache_persist else None,
+        embed=openai_embedder(settings.response_cache_embedding_model) if settings.response_cache_semantic else None,
+        similarity_threshold=settings.response_cache_similarity_threshold,
+    )
@@ -0,0 +1,134 @@
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from agent_marketplace.services.cache import JSONDiskCache, hash_key
+from agent_marketplace.services.ingestion import batched
+
+
+def content_groups(keys: Sequence[Any], sizes: Sequence[int], target: int, max_size: int, salt: Any = None) -> List[List[int]]:
+    """
+    Split positions into consecutive groups whose boundaries depend on the content, not the position
+
+    A group ends after an item whose hashed key falls on a boundary (one in `target`), or before an
+    item that would take it over max_size. Inserting an item only changes its own group (and at most
+    a neighbour), unlike fixed-size grouping, where every later group shifts.
+
+    Args:
+        keys (Sequence[Any]): Content key of each item
+        sizes (Sequence[int]): Size of each item, e.g. its tokens
+        target (int): Average items per group
+        max_size (int): Largest total size of a group of more than one item
+        salt (Any, optional): Varies the boundaries, e.g. per tree level
+
+    Returns:
+        List[List[int]]: The positions of each group, in order
+    """
+    groups: List[List[int]] = []
+    group: List[int] = []
+    group_size = 0
+    for position, (key, size) in enumerate(zip(keys, sizes)):
+        if group and group_size + size > max_size:
+            groups.append(group)
+            group, group_size = [], 0
+        group.append(position)
+        group_size += size
+        if int(hash_key(salt, key)[:8], 16) % max(1, target) == 0:
+            groups.append(group)
+            group, group_size = [], 0
+    if group:
+        groups.append(group)
+    return groups
+
+
+class HierarchicalSummarizer:
+    """
+    Summarizes a sequence of texts (e.g. chat sessions) bottom-up into a single digest.
+
+    Each text is summarized on its own (the leaves), then summaries are merged `fan_in` at a time,
+    level by level, up to the root. The summaries of one level are generated in one concurrent batch.
+    Every node is cached under a hash of its content: a leaf under its text, a merged node under the
+    keys of its children. Nodes are grouped by content (see content_groups), so adding a text, even
+    in the middle, only changes the nodes on its path to the root; the rest of the tree, and thereby
+    most of the digest of a growing history, is reused.
+    """
+    def __init__(self, summarize_batch: Callable[[List[str]], List[str]], merge_batch: Callable[[List[str]], List[str]],
+                 cache: Optional[JSONDiskCache] = None, fan_in: int = 4, key: Any = None):
+        """
+        Args:
+            summarize_batch (Callable): Summarizes a list of leaf texts, e.g. with one LLM batch
+            merge_batch (Callable): Merges a list of texts, each holding up to `fan_in` joined
+                summaries, into one summary each
+            cache (JSONDiskCache, optional): Where node summaries are kept across sessions
+            fan_in (int, optional): Average children per merged node, at most twice as many
+            key (Any, optional): Whatever else the summaries depend on (prompts, model), part of
+                every node's cache key
+        """
+        self.summarize_batch = summarize_batch
+        self.merge_batch = merge_batch
+        self.cache = cache
+        self.fan_in = max(2, fan_in)
+        self.key = key
+        self.counters = {"computed": 0, "cached": 0}
+
+    def _resolve(self, keys: List[str], load_inputs: Callable[[List[int]], List[str]],
+                 generate: Callable[[List[str]], List[str]]) -> List[str]:
+        """Return the summary of every node, loading the inputs of the uncached ones and generating them in one batch"""
+        summaries: List[Optional[str]] = [self.cache.get(key) if self.cache else None for key in keys]
+        missing = [index for index, summary in enumerate(summaries) if summary is None]
+        self.counters["cached"] += len(keys) - len(missing)
+        self.counters["computed"] += len(missing)
+        if missing:
+            for index, summary in zip(missing, generate(load_inputs(missing))):
+                summaries[index] = summary
+                if self.cache:
+                    self.cache.set(keys[index], summary)
+        return summaries
+
+    def summarize(self, texts: List[str]) -> Optional[str]:
+        """Return the digest of the texts, or None if there are none"""
+        if not texts:
+            return None
+        return self.summarize_leaves(texts, lambda indices: [texts[index] for index in indices])
+
+    def summarize_leaves(self, leaf_keys: List[Any], load_leaves: Callable[[List[int]], List[str]]) -> Optional[str]:
+        """
+        Return the digest of leaves given by content key, or None if there are none
+
+        Only the texts of leaves missing from the cache are requested from load_leaves (with their
+        positions), so the input can be streamed from disk instead of being held in memory.
+        """
+        if not leaf_keys:
+            return None
+        keys = [hash_key(self.key, "leaf", leaf_key) for leaf_key in leaf_keys]
+        summaries = self._resolve(keys, load_leaves, self.summarize_batch)
+        return self._merge_levels(keys, summaries)
+
+    def merge(self, summaries: List[str]) -> Optional[str]:
+        """Merge existing summaries (e.g. from different sources) into one, as the upper levels do"""
+        if not summaries:
+            return None
+        return self._merge_levels([hash_key(self.key, "input", summary) for summary in summaries], summaries)
+
+    def _merge_levels(self, keys: List[str], summaries: List[str]) -> str:
+        level = 0
+        while len(summaries) > 1:
+            level += 1
+            groups = content_groups(keys, [1] * len(keys), self.fan_in, 2 * self.fan_in, salt=level)
+            if len(groups) == len(keys):
+                # Every node fell on a boundary; group by position so the level still shrinks
+                groups = list(batched(range(len(keys)), self.fan_in))
+            key_groups = [[keys[index] for index in group] for group in groups]
+            summary_groups = [[summaries[index] for index in group] for group in groups]
+            # A node without siblings moves up a level as it is
+            keys = [hash_key(self.key, "node", group) if len(group) > 1 else group[0] for group in key_groups]
+            summaries = [group[0] for group in summary_groups]
+            merged = [index for index, group in enumerate(summary_groups) if len(group) > 1]
+            merged_summaries = self._resolve([keys[index] for index in merged],
+                                             lambda indices: ["\n\n".join(summary_groups[merged[index]]) for index in indices],
+                                             self.merge_batch)
+            for index, summary in zip(merged, merged_summaries):
+                summaries[index] = summary
+        return summaries[0]
+
+    def stats(self) -> Dict[str, int]:
+        """Return how many node summaries were generated and how many were reused from the cache"""
+        return dict(self.counters)
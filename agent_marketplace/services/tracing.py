@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import asyncio
+import functools
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+from agent_marketplace.config import get_settings
+
+# Span kinds, from the outside in: session -> turn -> agent method -> LLM call
+SESSION, TURN, AGENT, LLM = "session", "turn", "agent", "llm"
+
+
+class Span:
+    """
+    A timed operation in a trace, with attributes such as token counts, retries or cache hits.
+
+    Spans nest through a context variable, which follows LLM calls onto the shared event loop
+    (see llm.submit_coroutine). Finished spans are reported to their root span, so a session can
+    summarize its own trace without a global store.
+    """
+    def __init__(self, name: str, kind: str, parent: Optional["Span"] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.kind = kind
+        self.parent = parent
+        self.root: Span = parent.root if parent is not None else self
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.start_time_ns = time.time_ns()
+        self.end_time_ns: Optional[int] = None
+        self.error: Optional[str] = None
+        # Finished descendant spans, only collected on root spans
+        self.descendants: List[Span] = []
+        self._lock = threading.Lock()
+
+    def set_attributes(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def add(self, key: str, value: float) -> None:
+        """Add to a numeric attribute, e.g. retries"""
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    @property
+    def duration(self) -> float:
+        end_time_ns = self.end_time_ns if self.end_time_ns is not None else time.time_ns()
+        return (end_time_ns - self.start_time_ns) / 1e9
+
+    def end(self) -> None:
+        self.end_time_ns = time.time_ns()
+        if self.root is not self:
+            with self.root._lock:
+                self.root.descendants.append(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        """Return the span in the OpenTelemetry (OTLP/JSON) span format"""
+        def value(v: Any) -> Dict[str, Any]:
+            if isinstance(v, bool):
+                return {"boolValue": v}
+            if isinstance(v, int):
+                return {"intValue": str(v)}
+            if isinstance(v, float):
+                return {"doubleValue": v}
+            return {"stringValue": str(v)}
+
+        return {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent.span_id if self.parent is not None else "",
+            "name": self.name,
+            "kind": 1,  # SPAN_KIND_INTERNAL
+            "startTimeUnixNano": str(self.start_time_ns),
+            "endTimeUnixNano": str(self.end_time_ns or self.start_time_ns),
+            "attributes": [{"key": key, "value": value(v)} for key, v in {"span.kind": self.kind, **self.attributes}.items()],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+
+
+class JSONLSpanExporter:
+    """Appends finished spans to a file, one OTLP/JSON span per line"""
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_otlp())
+        with self._lock:
+            self._file.write(line + "\n")
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+class Tracer:
+    """Creates spans and hands finished ones to the exporters; a disabled tracer hands out detached spans that are never recorded"""
+    def __init__(self, enabled: bool = True, exporters: Optional[List[Any]] = None):
+        self.enabled = enabled
+        self.exporters = list(exporters or [])
+
+    def start_span(self, name: str, kind: str = AGENT, **attributes: Any) -> Span:
+        """Start a child of the current span without making it current, e.g. for generators; finish it with end_span"""
+        return Span(name, kind, current_span() if self.enabled else None, attributes)
+
+    def end_span(self, span: Span) -> None:
+        span.end()
+        if self.enabled:
+            for exporter in self.exporters:
+                exporter.export(span)
+
+    @contextmanager
+    def span(self, name: str, kind: str = AGENT, **attributes: Any) -> Iterator[Span]:
+        span = self.start_span(name, kind, **attributes)
+        token = _current_span.set(span) if self.enabled else None
+        try:
+            yield span
+        except BaseException as e:
+            span.error = f"{type(e).__name__}: {str(e)}"
+            raise
+        finally:
+            if token is not None:
+                _current_span.reset(token)
+            self.end_span(span)
+
+    @contextmanager
+    def llm_span(self, **attributes: Any) -> Iterator[Span]:
+        """Span of one LLM call; reuses the enclosing span if it already is one (e.g. opened by the router)"""
+        span = current_span()
+        if span is not None and span.kind == LLM:
+            span.set_attributes(**attributes)
+            yield span
+            return
+        with self.span("llm.generate", kind=LLM, **attributes) as span:
+            yield span
+
+
+@lru_cache()
+def get_tracer() -> Tracer:
+    """Return the process-wide tracer, exporting to Settings.trace_file if set"""
+    settings = get_settings()
+    exporters = [JSONLSpanExporter(settings.trace_file)] if settings.trace_file else []
+    return Tracer(enabled=settings.tracing, exporters=exporters)
+
+
+def traced(func: Callable) -> Callable:
+    """Decorator running an agent method in a span named after the class and method"""
+    if asyncio.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(self, *args, **kwargs):
+            with get_tracer().span(f"{type(self).__name__}.{func.__name__}", kind=AGENT, agent=self.name):
+                return await func(self, *args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with get_tracer().span(f"{type(self).__name__}.{func.__name__}", kind=AGENT, agent=self.name):
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+def summarize_trace(root: Span) -> Dict[str, Any]:
+    """
+    Summarize a finished trace: turns, LLM calls with their tokens, retries, queue wait and cache
+    hits, and the calls and total time of every agent method
+
+    Args:
+        root (Span): The root span of the trace, e.g. a session
+
+    Returns:
+        Dict[str, Any]: Trace totals and a per-method breakdown
+    """
+    with root._lock:
+        spans = list(root.descendants)
+    llm_spans = [span for span in spans if span.kind == LLM]
+    methods: Dict[str, Dict[str, float]] = {}
+    for span in spans:
+        if span.kind == AGENT:
+            method = methods.setdefault(span.name, {"calls": 0, "total_s": 0.0})
+            method["calls"] += 1
+            method["total_s"] += span.duration
+
+    def total(key: str) -> float:
+        return sum(span.attributes.get(key, 0) or 0 for span in llm_spans)
+
+    return {
+        "duration_s": root.duration,
+        "turns": sum(1 for span in spans if span.kind == TURN),
+        "llm_calls": len(llm_spans),
+        "llm_time_s": sum(span.duration for span in llm_spans),
+        "prompt_tokens": int(total("prompt_tokens")),
+        "completion_tokens": int(total("completion_tokens")),
+        "cache_hits": sum(1 for span in llm_spans if span.attributes.get("cache_hit")),
+        "retries": int(total("retries")),
+        "backoff_s": total("backoff_s"),
+        "queue_wait_s": total("queue_wait_s"),
+        "rate_limit_wait_s": total("rate_limit_wait_s"),
+        "errors": sum(1 for span in spans if span.error),
+        "methods": dict(sorted(methods.items(), key=lambda item: -item[1]["total_s"])),
+    }
+
+
+def format_trace_summary(summary: Dict[str, Any]) -> str:
+    """Render a trace summary as a plain-text table"""
+    lines = [
+        f"Trace: {summary['duration_s']:.2f}s, {summary['turns']} turns, {summary['llm_calls']} LLM calls "
+        f"({summary['llm_time_s']:.2f}s), {summary['prompt_tokens']} prompt + {summary['completion_tokens']} completion tokens",
+        f"       {summary['cache_hits']} cache hits, {summary['retries']} retries ({summary['backoff_s']:.2f}s backoff), "
+        f"{summary['queue_wait_s']:.2f}s queue wait, {summary['rate_limit_wait_s']:.2f}s rate limit wait, {summary['errors']} errors",
+        f"{'method':<60}{'calls':>7}{'total (s)':>11}",
+    ]
+    for name, method in summary["methods"].items():
+        lines.append(f"{name:<60}{method['calls']:>7}{method['total_s']:>11.2f}")
+    return "\n".join(lines)
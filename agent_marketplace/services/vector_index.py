@@ -0,0 +1,341 @@
+"""
+Local vector index over the users' personal data, built offline and searched in memory.
+
+Build the indexes of every user ahead of time with:
+
+    python -m agent_marketplace.services.vector_index
+"""
+import os
+import re
+import json
+import time
+import zlib
+import argparse
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from agent_marketplace.config import get_settings
+from agent_marketplace.services.cache import hash_key
+from agent_marketplace.services.ingestion import CHAT_HISTORY_FILES, RECORD_PREFIXES, iter_json_records
+from agent_marketplace.services.personal_data import BASIC_INFO_FILE, PersonalDataStore, get_personal_data_store
+from agent_marketplace.services.purchase_index import tokenize
+
+# Bump when chunking or embedding changes, so persisted indexes are rebuilt
+INDEX_VERSION = 1
+
+
+def stem(word: str) -> str:
+    """Strip the plural suffix of a word, so "allergies" matches "allergy" """
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+        return word[:-1]
+    return word
+
+
+class HashingEmbedder:
+    """
+    Embeds texts without a model: the words and word bigrams of a text are hashed into `dim`
+    buckets with a random sign (the hashing trick), weighted by 1 + log(term frequency).
+    """
+    def __init__(self, dim: int = 4096):
+        self.dim = dim
+
+    def features(self, text: str) -> Dict[int, float]:
+        # Split the camelCase keys of JSON records into words
+        words = [stem(word) for word in tokenize(re.sub(r"([a-z])([A-Z])", r"\1 \2", text))]
+        counts: Dict[int, float] = {}
+        for term in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+            hashed = zlib.crc32(term.encode("utf-8"))
+            bucket = hashed % self.dim
+            sign = 1.0 if hashed & 0x80000000 else -1.0
+            counts[bucket] = counts.get(bucket, 0.0) + sign
+        return counts
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """Return the term-frequency vectors of the texts, one row each"""
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for bucket, count in self.features(text).items():
+                vectors[row, bucket] = np.sign(count) * (1.0 + np.log(abs(count))) if count else 0.0
+        return vectors
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+class VectorIndex:
+    """
+    Cosine-similarity index over text chunks.
+
+    Chunk vectors are idf-weighted hashing embeddings, L2-normalized and stacked in one float32
+    matrix, so a brute-force search is a single matrix-vector product. With `build_ivf`, chunks are
+    also clustered with spherical k-means and a search only scores the chunks of the `n_probe`
+    clusters closest to the query (an inverted file index), for indexes too large to scan.
+    """
+    def __init__(self, texts: List[str], sources: List[str], embeddings: np.ndarray, idf: np.ndarray,
+                 embedder: HashingEmbedder):
+        self.texts = texts
+        self.sources = sources
+        self.embeddings = embeddings
+        self.idf = idf
+        self.embedder = embedder
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments: Optional[np.ndarray] = None
+
+    @classmethod
+    def from_texts(cls, texts: List[str], sources: List[str], embedder: Optional[HashingEmbedder] = None) -> "VectorIndex":
+        embedder = embedder or HashingEmbedder()
+        tf = embedder.embed(texts)
+        # Smoothed inverse document frequency of each bucket
+        document_frequency = np.count_nonzero(tf, axis=0)
+        idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+        return cls(texts, sources, normalize(tf * idf), idf, embedder)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        return normalize(self.embedder.embed([query])[0] * self.idf)
+
+    def build_ivf(self, n_lists: int, iterations: int = 10, seed: int = 0) -> None:
+        """Cluster the chunks into n_lists lists for approximate search"""
+        n_lists = min(n_lists, len(self))
+        if n_lists < 2:
+            return
+        rng = np.random.default_rng(seed)
+        centroids = self.embeddings[rng.choice(len(self), n_lists, replace=False)]
+        for _ in range(iterations):
+            assignments = np.argmax(self.embeddings @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, self.embeddings)
+            # Keep the previous centroid of an empty list
+            centroids = np.where(np.linalg.norm(sums, axis=1, keepdims=True) > 0, normalize(sums), centroids)
+        self.centroids = centroids
+        self.assignments = np.argmax(self.embeddings @ centroids.T, axis=1)
+
+    def search(self, query: str, top_k: int = 5, n_probe: int = 4,
+               sources: Optional[List[str]] = None) -> List[Tuple[str, str, float]]:
+        """
+        Find the chunks most similar to a query
+
+        Args:
+            query (str): Text to search for
+            top_k (int, optional): Maximum number of chunks returned
+            n_probe (int, optional): Lists scanned when the index has an IVF
+            sources (List[str], optional): Only search chunks of these files
+
+        Returns:
+            List[Tuple[str, str, float]]: (source, text, score) of the matching chunks, best first
+        """
+        if not len(self):
+            return []
+        query_vector = self.embed_query(query)
+        if not query_vector.any():
+            return []
+        candidates = np.arange(len(self))
+        if self.centroids is not None:
+            lists = np.argsort(-(self.centroids @ query_vector))[:n_probe]
+            candidates = np.flatnonzero(np.isin(self.assignments, lists))
+        if sources is not None:
+            candidates = candidates[np.isin(np.asarray(self.sources)[candidates], sources)]
+        scores = self.embeddings[candidates] @ query_vector
+        top = np.argsort(-scores)[:top_k]
+        return [(self.sources[candidates[i]], self.texts[candidates[i]], float(scores[i])) for i in top if scores[i] > 0]
+
+    def save(self, path: str) -> None:
+        # Half precision is plenty for cosine scores and halves the file
+        arrays = {"embeddings": self.embeddings.astype(np.float16), "idf": self.idf, "dim": np.array(self.embedder.dim),
+                  "chunks": np.array(json.dumps({"texts": self.texts, "sources": self.sources}))}
+        if self.centroids is not None:
+            arrays.update(centroids=self.centroids, assignments=self.assignments)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Written to a temporary file first, so a concurrent reader never sees a partial index
+        with open(f"{path}.tmp", "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(f"{path}.tmp", path)
+
+    @classmethod
+    def load(cls, path: str) -> "VectorIndex":
+        with np.load(path) as arrays:
+            chunks = json.loads(str(arrays["chunks"]))
+            index = cls(chunks["texts"], chunks["sources"], arrays["embeddings"].astype(np.float32), arrays["idf"],
+                        HashingEmbedder(int(arrays["dim"])))
+            if "centroids" in arrays:
+                index.centroids, index.assignments = arrays["centroids"], arrays["assignments"]
+        return index
+
+
+def split_lines(lines: List[str], max_chars: int) -> Iterator[str]:
+    """Pack lines into chunks of at most max_chars characters; longer lines are split"""
+    chunk = ""
+    for line in lines:
+        while len(line) > max_chars:
+            if chunk:
+                yield chunk
+                chunk = ""
+            yield line[:max_chars]
+            line = line[max_chars:]
+        if chunk and len(chunk) + len(line) + 1 > max_chars:
+            yield chunk
+            chunk = ""
+        chunk = f"{chunk}\n{line}" if chunk else line
+    if chunk:
+        yield chunk
+
+
+def json_chunks(value: Any, max_chars: int, path: str = "") -> Iterator[str]:
+    """
+    Chunks of a JSON document, each prefixed with its path
+
+    Array elements (records such as a blood test or a purchase) are kept whole up to max_chars.
+    Objects are dense, so those over a quarter of that are split into their fields.
+    """
+    text = json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+    limit = max_chars if path.rsplit(".", 1)[-1].isdigit() else max_chars // 4
+    if len(text) + len(path) + 2 <= limit or not isinstance(value, (dict, list)) or not value:
+        yield from split_lines([f"{path}: {text}" if path else text], max_chars)
+        return
+    items = value.items() if isinstance(value, dict) else enumerate(value)
+    for key, item in items:
+        yield from json_chunks(item, max_chars, f"{path}.{key}" if path else str(key))
+
+
+def chat_chunks(record: Dict[str, Any], max_chars: int) -> Iterator[str]:
+    """Chunks of a chat session, each headed by the session's time and participant"""
+    turns = record.get("conversation") or record.get("user_ai_interaction") or []
+    header = " ".join(str(record[key]) for key in ("time", "target_name") if record.get(key))
+    lines = [f"{turn.get('role')}: {turn.get('content')}" for turn in turns if isinstance(turn, dict)]
+    for chunk in split_lines(lines, max_chars - len(header) - 3):
+        yield f"[{header}]\n{chunk}" if header else chunk
+
+
+def personal_data_chunks(store: PersonalDataStore, user: str, max_chars: int) -> Iterator[Tuple[str, str]]:
+    """(file, chunk) pairs of all of a user's personal data files but the basic info"""
+    user_dir = store.user_dir(user)
+    for file in store.files(user):
+        if file == BASIC_INFO_FILE:
+            continue
+        path = os.path.join(user_dir, file)
+        if file in CHAT_HISTORY_FILES:
+            chunks = (chunk for record in iter_json_records(path, RECORD_PREFIXES[file]) for chunk in chat_chunks(record, max_chars))
+        else:
+            chunks = json_chunks(store.load_json(path), max_chars)
+        for chunk in chunks:
+            yield file, chunk
+
+
+def build_personal_index(user: str, store: Optional[PersonalDataStore] = None) -> VectorIndex:
+    """Chunk and embed a user's personal data, with an IVF if Settings.personal_index_ivf_lists is set"""
+    settings = get_settings()
+    store = store or get_personal_data_store()
+    sources, texts = [], []
+    for source, text in personal_data_chunks(store, user, settings.personal_index_chunk_chars):
+        sources.append(source)
+        texts.append(text)
+    index = VectorIndex.from_texts(texts, sources, HashingEmbedder(settings.personal_index_dim))
+    if settings.personal_index_ivf_lists:
+        index.build_ivf(settings.personal_index_ivf_lists)
+    return index
+
+
+_indexes: Dict[str, Tuple[str, VectorIndex]] = {}
+_indexes_lock = threading.Lock()
+# One lock per user, so building one user's index does not hold up the other users' sessions
+_user_locks: Dict[str, threading.Lock] = {}
+
+
+def personal_index_key(user: str, store: PersonalDataStore) -> str:
+    """Hash of everything a user's index is built from: data files and index settings"""
+    settings = get_settings()
+    user_dir = store.user_dir(user)
+    return hash_key(
+        INDEX_VERSION,
+        user,
+        {file: store.content_hash(os.path.join(user_dir, file)) for file in store.files(user)},
+        settings.personal_index_dim,
+        settings.personal_index_chunk_chars,
+        settings.personal_index_ivf_lists,
+    )
+
+
+def personal_index_prefix(user: str) -> str:
+    """File name prefix of a user's persisted indexes, so superseded ones can be found and removed"""
+    return f"{hash_key(user)[:16]}-"
+
+
+def save_personal_index(user: str, key: str, index: VectorIndex) -> None:
+    """Persist a user's index under Settings.cache_dir/personal_index and remove the user's older ones"""
+    directory = os.path.join(get_settings().cache_dir, "personal_index")
+    prefix = personal_index_prefix(user)
+    file_name = f"{prefix}{key}.npz"
+    index.save(os.path.join(directory, file_name))
+    for file in os.listdir(directory):
+        if file.startswith(prefix) and file.endswith(".npz") and file != file_name:
+            try:
+                os.remove(os.path.join(directory, file))
+            except OSError:
+                pass
+
+
+def get_personal_index(user: str) -> VectorIndex:
+    """
+    Return a user's index, from memory, from Settings.cache_dir/personal_index, or built now
+
+    Indexes are keyed by the content of the user's files, so an index is rebuilt once the data changes.
+    """
+    store = get_personal_data_store()
+    key = personal_index_key(user, store)
+    with _indexes_lock:
+        cached = _indexes.get(user)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        user_lock = _user_locks.setdefault(user, threading.Lock())
+
+    with user_lock:
+        # Another session of the user may have built it while this one waited
+        cached = _indexes.get(user)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        path = os.path.join(get_settings().cache_dir, "personal_index", f"{personal_index_prefix(user)}{key}.npz")
+        if os.path.exists(path):
+            index = VectorIndex.load(path)
+        else:
+            index = build_personal_index(user, store)
+            save_personal_index(user, key, index)
+        with _indexes_lock:
+            _indexes[user] = (key, index)
+        return index
+
+
+def format_personal_context(results: List[Tuple[str, str, float]], max_chars: Optional[int] = None) -> str:
+    """Render search results as a prompt section of at most max_chars characters"""
+    max_chars = max_chars if max_chars is not None else get_settings().personal_context_max_chars
+    context = ""
+    for source, text, _ in results:
+        entry = f"[{os.path.splitext(source)[0]}] {text}\n\n"
+        if context and len(context) + len(entry) > max_chars:
+            break
+        context += entry[:max_chars]
+    return context.strip()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build the personal data vector indexes')
+    parser.add_argument('--user', type=str, action='append',
+                       help='User to index, can be repeated (default: every user in data/personal_data)')
+    args = parser.parse_args()
+
+    store = get_personal_data_store()
+    for user in args.user or store.users():
+        start = time.perf_counter()
+        index = get_personal_index(user)
+        print(f"{user}: {len(index)} chunks in {time.perf_counter() - start:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
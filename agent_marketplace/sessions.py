@@ -0,0 +1,204 @@
+import time
+import uuid
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple
+
+from agent_marketplace.agents.ai_agent import AI_Agent
+from agent_marketplace.config import get_settings, reply_generator
+from agent_marketplace.schemas.agents import Message
+from agent_marketplace.schemas.events import ChatFinished, ChatStarted, MessageSent, StateChanged, TurnStarted
+from agent_marketplace.services.events import EventBus
+from agent_marketplace.services.tracing import SESSION, TURN, get_tracer, summarize_trace
+
+
+class ChatSession:
+    """
+    One conversation between a personal AI and a service agent.
+
+    By default the session owns fresh per-session copies of both agents (see AI_Agent.new_session),
+    so the agent definitions registered in the marketplace are never mutated and any number of
+    sessions can run side by side. Progress is published as events on the session's event bus;
+    without sinks the session runs headless.
+    """
+    def __init__(self, agent_1: AI_Agent, agent_2: AI_Agent, max_chat_round: int = 40,
+                 session_id: Optional[str] = None, events: Optional[EventBus] = None,
+                 new_session: bool = True):
+        self.session_id = session_id or uuid.uuid4().hex
+        self.agent_1 = agent_1.new_session() if new_session else agent_1
+        self.agent_2 = agent_2.new_session() if new_session else agent_2
+        self.events = (events or EventBus()).bind(self.session_id)
+        self.agent_1.events = self.agent_2.events = self.events
+        self.max_chat_round = max_chat_round
+        self.messages: list[Message] = []
+        self.rounds = 0
+        self.status = "pending"  # pending, running, completed, max_rounds or failed
+        self.error: Optional[Exception] = None
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Totals of the session's trace (see tracing.summarize_trace), set when tracing is enabled
+        self.trace_summary: Optional[dict] = None
+
+    def reply(self, receiver: AI_Agent, message: Message, sender: AI_Agent) -> Message:
+        """Get the receiver's reply, rendered live if a sink renders streams, and publish it"""
+        side = "user" if receiver is self.agent_1 else "assistant"
+        self.events.publish(TurnStarted(turn=len(self.messages), agent=receiver.name, receiver=sender.name))
+        stream_sink = self.events.stream_sink
+        with get_tracer().span("chat.turn", kind=TURN, turn=len(self.messages), agent=receiver.name):
+            if stream_sink is not None:
+                stream_sink.render_stream(reply_generator(receiver, message, sender), side)
+                response = receiver.last_message
+            else:
+                response = receiver.on_message(message, sender)
+        self.events.publish(MessageSent(sender=response.sender, receiver=response.receiver, content=response.content,
+                                        side=side, streamed=stream_sink is not None))
+        self.messages.append(response)
+        return response
+
+    def run(self) -> "ChatSession":
+        """Run the conversation to the end; failures are recorded on the session instead of raised"""
+        self.status = "running"
+        self.started_at = time.time()
+        tracer = get_tracer()
+        with tracer.span("chat.session", kind=SESSION, session_id=self.session_id,
+                         personal_ai=self.agent_1.name, service_agent=self.agent_2.name) as span:
+            try:
+                self.events.publish(ChatStarted(personal_ai=self.agent_1.name, service_agent=self.agent_2.name,
+                                                owner=self.agent_1.owner,
+                                                user_intent=getattr(self.agent_1, "user_intent", "")))
+                self.agent_1.init_chat(guest_agent=self.agent_2)
+                self.agent_2.init_chat(guest_agent=self.agent_1)
+
+                # Agent 1 initiates the conversation
+                sender_message = self.reply(
+                    self.agent_1,
+                    Message(role="user", content="", sender=self.agent_1.name, receiver=self.agent_2.name, timestamp=datetime.now()),
+                    self.agent_2
+                )
+                sender, receiver = self.agent_1, self.agent_2
+
+                while self.rounds < self.max_chat_round:
+                    was_complete = receiver.task_complete
+                    response = self.reply(receiver, sender_message, sender)
+                    if receiver.task_complete != was_complete:
+                        self.events.publish(StateChanged(agent=receiver.name, task_complete=receiver.task_complete))
+                    sender, receiver = receiver, sender
+                    sender_message = response
+
+                    if self.agent_1.task_complete and self.agent_2.task_complete:
+                        break
+                    self.rounds += 1
+
+                self.status = "completed" if self.rounds < self.max_chat_round else "max_rounds"
+            except Exception as e:
+                self.status = "failed"
+                self.error = e
+            finally:
+                self.finished_at = time.time()
+            span.set_attributes(status=self.status, rounds=self.rounds, messages=len(self.messages))
+            if self.error is not None:
+                span.error = f"{type(self.error).__name__}: {str(self.error)}"
+        if tracer.enabled:
+            self.trace_summary = summarize_trace(span)
+        self.events.publish(ChatFinished(status=self.status, rounds=self.rounds, messages=len(self.messages),
+                                         trace_summary=self.trace_summary))
+        return self
+
+    @property
+    def duration(self) -> Optional[float]:
+        if self.started_at is None or self.finished_at is None:
+            return None
+        return self.finished_at - self.started_at
+
+    def message_dicts(self) -> List[dict]:
+        """Return the messages in the format of AgentMarketplace.start_agent_chat(return_messages=True)"""
+        return [
+            {
+                "sender": message.sender,
+                "content": message.content,
+                "timestamp": message.timestamp.isoformat() if hasattr(message.timestamp, 'isoformat') else str(message.timestamp)
+            }
+            for message in self.messages
+        ]
+
+
+class SessionEngine:
+    """
+    Runs many independent chat sessions concurrently on a bounded worker pool.
+
+    Agents are synchronous, so each running session occupies a worker thread while its LLM calls
+    are multiplexed on the shared LLM event loop. At most `max_concurrent_sessions` sessions run at
+    once and at most `max_pending_sessions` more wait for a worker. Beyond that, `submit` blocks
+    (or raises queue.Full when block=False), so producers are slowed down instead of queueing
+    unbounded work.
+    """
+    def __init__(self, max_concurrent_sessions: Optional[int] = None, max_pending_sessions: Optional[int] = None,
+                 max_chat_round: int = 40, events: Optional[EventBus] = None):
+        settings = get_settings()
+        self.max_concurrent_sessions = max_concurrent_sessions or settings.max_concurrent_sessions
+        self.max_pending_sessions = max_pending_sessions if max_pending_sessions is not None else settings.max_pending_sessions
+        self.max_chat_round = max_chat_round
+        # Shared by all sessions, each publishes with its own session id
+        self.events = events or EventBus()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrent_sessions, thread_name_prefix="chat-session")
+        self._slots = threading.BoundedSemaphore(self.max_concurrent_sessions + self.max_pending_sessions)
+        self._lock = threading.Lock()
+        self.counters = {"submitted": 0, "running": 0, "completed": 0, "max_rounds": 0, "failed": 0}
+
+    def submit(self, agent_1: AI_Agent, agent_2: AI_Agent, session_id: Optional[str] = None,
+               block: bool = True, timeout: Optional[float] = None) -> "Future[ChatSession]":
+        """
+        Start a session between two agent definitions
+
+        Args:
+            agent_1 (AI_Agent): The personal AI, which opens the conversation
+            agent_2 (AI_Agent): The service agent
+            session_id (str, optional): Identifier of the session, generated if not given
+            block (bool, optional): Wait for a free slot when the engine is full instead of raising
+            timeout (float, optional): Longest time to wait for a free slot when blocking
+
+        Returns:
+            Future[ChatSession]: Resolves to the finished session
+
+        Raises:
+            queue.Full: If no slot became free
+        """
+        if not self._slots.acquire(block, timeout if block else None):
+            raise queue.Full(f"{self.max_concurrent_sessions + self.max_pending_sessions} sessions already in flight")
+        try:
+            session = ChatSession(agent_1, agent_2, max_chat_round=self.max_chat_round, session_id=session_id,
+                                  events=self.events)
+            future = self._executor.submit(self._run, session)
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self.counters["submitted"] += 1
+        return future
+
+    def _run(self, session: ChatSession) -> ChatSession:
+        with self._lock:
+            self.counters["running"] += 1
+        try:
+            return session.run()
+        finally:
+            with self._lock:
+                self.counters["running"] -= 1
+                self.counters[session.status if session.status in self.counters else "failed"] += 1
+            self._slots.release()
+
+    def run_sessions(self, pairs: Iterable[Tuple[AI_Agent, AI_Agent]]) -> List[ChatSession]:
+        """Run a session for each (personal AI, service agent) pair and return them in order"""
+        futures = [self.submit(agent_1, agent_2) for agent_1, agent_2 in pairs]
+        return [future.result() for future in futures]
+
+    def stats(self) -> dict:
+        """Return how many sessions were submitted, are running, and finished in each state"""
+        with self._lock:
+            return {**self.counters, "pending": self.counters["submitted"] - self.counters["running"]
+                    - self.counters["completed"] - self.counters["max_rounds"] - self.counters["failed"]}
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
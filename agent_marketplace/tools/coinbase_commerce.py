@@ -1,37 +1,43 @@
-import streamlit as st
 from textwrap import dedent
 
 from agent_marketplace.schemas.agents import Message
-from agent_marketplace.config import response_generator
+from agent_marketplace.schemas.events import StatusUpdate
+from agent_marketplace.services.events import EventBus
 
 
-def process_coinbase_payment(func_args: dict, message: Message) -> str:
+def process_coinbase_payment(func_args: dict, message: Message, events: EventBus = None) -> str:
     """
-    A dummy function to process a Coinbase Commerce web3 payment using the provided JSON data
+    A dummy function to process a Coinbase Commerce web3 payment using the provided JSON data.
+    Payment progress is published on the calling agent's event bus.
     """
+    events = events or EventBus()
+
+    def publish(text: str, level: str = "info") -> None:
+        events.publish(StatusUpdate(agent="Coinbase Commerce", section="payment", text=text, level=level))
+
     try:
         payment_json = message.metadata
 
         # Show payment details to the user
         payment_details = payment_json['paymentDetails']
-        st.chat_message("user").write_stream(response_generator(dedent(f"""
+        publish(dedent(f"""
             Payment Details:\n
             **Amount:** {payment_details['pricing']['local']['amount']} {payment_details['pricing']['local']['currency']}\n
             **Description:** {payment_details['metadata']['itemDescription']}\n
             **Client Name:** {payment_details['metadata']['name']}\n
             **Merchant:** {payment_details['organizationName']}\n
-        """)))
-        st.chat_message("user").write_stream(response_generator("⚠️ Please enter **YES** to confirm payment or **NO** to cancel in the :red[**TERMINAL**]."))
+        """))
+        publish("⚠️ Please enter **YES** to confirm payment or **NO** to cancel in the :red[**TERMINAL**].")
         
         # Prompt for user input in the terminal
         user_input = input("⚠️ \033[1;31mPlease enter YES to confirm payment or NO to cancel:\033[0m\n")
 
         # Process user input, if user confirms payment, return [PAYMENT_SUCCEEDED], otherwise return [PAYMENT_FAILED]
         if user_input.lower() == "yes":
-            st.chat_message("user").write_stream(response_generator(":green[**[Payment confirmed]**]"))
+            publish(":green[**[Payment confirmed]**]")
             return "[PAYMENT_SUCCEEDED] The client has confirmed the order and payment is processed successfully"
         else:
-            st.chat_message("user").write_stream(response_generator(":red[**[Payment cancelled]**]"))
+            publish(":red[**[Payment cancelled]**]", level="error")
             return "[PAYMENT_FAILED] The client has cancelled the payment. Please ends the conversation politely."
     
     except Exception as e:
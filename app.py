@@ -1,14 +1,19 @@
 from datetime import datetime
+import itertools
 import time
-from typing import List, Dict
-import os
+from typing import List, Tuple
 import json
 import streamlit as st
 
 from agent_marketplace.agents.personal_ai import PersonalAI
 from agent_marketplace.agents.health_agent import HealthAgent
 from agent_marketplace.schemas.agents import Message
-from agent_marketplace.config import setup_streamlit, response_generator
+from agent_marketplace.schemas.personal_data import Product
+from agent_marketplace.config import get_settings, setup_streamlit, response_generator, reply_generator, PACED_MESSAGE_PAUSE
+from agent_marketplace.services.events import EventBus, StreamlitSink
+from agent_marketplace.services.health_series import Reading
+from agent_marketplace.services.personal_data import PersonalDataStore, get_personal_data_store
+from agent_marketplace.services.purchase_index import PurchaseIndex, format_purchase_context
 
 # Set up the page configuration with a wider layout
 st.set_page_config(
@@ -231,6 +236,8 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+settings = get_settings()
+
 # Initialize session state
 if "messages" not in st.session_state:
     st.session_state.messages = []
@@ -238,23 +245,37 @@ if "messages" not in st.session_state:
 if "health_chat" not in st.session_state:
     st.session_state.health_chat = []
 
+USER_NAME = "Nicholas Richmond"
+
+# One personal data store per process; it re-reads a file only when it changes on disk
+@st.cache_resource
+def personal_data_store() -> PersonalDataStore:
+    return get_personal_data_store()
+
+data_store = personal_data_store()
+
 # Load Nicholas's health data
 def load_health_data():
     try:
-        # Path to Nicholas's health data
-        health_data_path = "data/personal_data/Nicholas Richmond/sample_health_data.json"
-        if os.path.exists(health_data_path):
-            with open(health_data_path, 'r') as file:
-                return json.load(file)
-        else:
-            st.error(f"Health data file not found at {health_data_path}")
-            return None
+        health_data = data_store.health_data(USER_NAME)
+        if health_data is None:
+            st.error(f"Health data file not found for {USER_NAME}")
+        return health_data
     except Exception as e:
         st.error(f"Error loading health data: {str(e)}")
         return None
 
-# Get the health data
+# Get the health data, and its metrics as date-indexed time series
 health_data = load_health_data()
+health_series = data_store.health_series(USER_NAME)
+# Build the purchase index with the rest of the data, so the first query doesn't wait for it
+data_store.purchase_index(USER_NAME)
+
+# Stands in for a metric without readings
+NO_READING = Reading(date=None, value=None, unit=None, normal_range=None, status=None)
+
+def latest_reading(metric: str) -> Reading:
+    return health_series.latest(metric) or NO_READING
 
 # Create a modern header with status indicators
 col1, col2 = st.columns([2, 1])
@@ -294,16 +315,13 @@ if not st.session_state.get("intro_dismissed"):
                 st.session_state.intro_dismissed = True
                 st.rerun()
 
-# Get the health data
-health_data = load_health_data()
-
 if "agents_initialized" not in st.session_state:
     # Initialize the agents only once
     try:
         # Create Personal AI Agent
         personal_ai = PersonalAI(
             name="Nicholas's Personal AI",
-            owner="Nicholas Richmond",
+            owner=USER_NAME,
             description="A personal AI assistant that helps Nicholas with his needs and communicates with specialized agents on his behalf.",
             user_intent="Help Nicholas understand his health data and provide recommendations."
         )
@@ -320,12 +338,16 @@ if "agents_initialized" not in st.session_state:
         if health_data:
             # Extract relevant health data for the agent
             try:
-                # Get the latest blood tests
-                latest_blood_test = health_data.get("bloodTests", [])[0] if health_data.get("bloodTests") else {}
-                latest_glucose = latest_blood_test.get("results", {}).get("glucose", {})
-                
-                # Get the latest vitals
-                latest_vitals = health_data.get("vitals", [])[0] if health_data.get("vitals") else {}
+                def as_dict(value) -> dict:
+                    return value.model_dump(by_alias=True, exclude_none=True) if value is not None else {}
+
+                def latest_dict(metric: str) -> dict:
+                    reading = health_series.latest(metric)
+                    return reading.as_dict() if reading else {}
+
+                # Get the latest blood pressure
+                vitals = data_store.latest_vitals(USER_NAME)
+                blood_pressure = {"date": vitals.date, **as_dict(vitals.blood_pressure)} if vitals and vitals.blood_pressure else {}
                 
                 # Get medical history
                 medical_history = health_data.get("medicalHistory", {})
@@ -335,21 +357,20 @@ if "agents_initialized" not in st.session_state:
                     "goals": [],
                     "dietary_restrictions": [],
                     "current_metrics": {
-                        "glucose": latest_glucose,
+                        "glucose": latest_dict("bloodTests.glucose"),
                         "cholesterol": {
-                            "total": latest_blood_test.get("results", {}).get("cholesterolTotal", {}),
-                            "hdl": latest_blood_test.get("results", {}).get("cholesterolHDL", {}),
-                            "ldl": latest_blood_test.get("results", {}).get("cholesterolLDL", {})
+                            "total": latest_dict("bloodTests.cholesterolTotal"),
+                            "hdl": latest_dict("bloodTests.cholesterolHDL"),
+                            "ldl": latest_dict("bloodTests.cholesterolLDL")
                         },
-                        "blood_pressure": latest_vitals.get("bloodPressure", {}),
-                        "heart_rate": latest_vitals.get("heartRate", {}),
-                        "vitaminD": latest_blood_test.get("results", {}).get("vitaminD", {})
+                        "blood_pressure": blood_pressure,
+                        "heart_rate": latest_dict("vitals.heartRate"),
+                        "vitaminD": latest_dict("bloodTests.vitaminD")
                     },
                     "medical_history": {
                         "conditions": medical_history.get("conditions", []),
-                        "medications": medical_history.get("medications", [])
-                    },
-                    "complete_health_data": health_data  # Store the complete health data
+                        "medications": [as_dict(medication) for medication in data_store.medications(USER_NAME)]
+                    }
                 }
                 
                 st.write("Health data loaded successfully!")
@@ -371,42 +392,9 @@ for message in st.session_state.messages:
 # Modern input area
 user_query = st.chat_input("💬 Ask me about your health data...")
 
-def get_relevant_purchased_products(user_query: str, purchase_history: List[Dict]) -> List[Dict]:
-    """Find relevant previously purchased products based on symptoms or health queries."""
-    relevant_products = []
-    
-    # Define symptom-product category mappings
-    symptom_categories = {
-        "cold": ["Tissues", "Health & Personal Care", "Medicine", "First Aid"],
-        "flu": ["Tissues", "Health & Personal Care", "Medicine", "First Aid"],
-        "headache": ["Health & Personal Care", "Medicine", "First Aid"],
-        "allergies": ["Health & Personal Care", "Medicine", "First Aid", "Air Purifiers"],
-        "pain": ["Health & Personal Care", "Medicine", "First Aid"]
-    }
-    
-    # Identify relevant categories based on symptoms in query
-    relevant_categories = []
-    query_lower = user_query.lower()
-    for symptom, categories in symptom_categories.items():
-        if symptom in query_lower:
-            relevant_categories.extend(categories)
-    
-    # Remove duplicates
-    relevant_categories = list(set(relevant_categories))
-    
-    # If no specific symptoms found, look for general health-related terms
-    if not relevant_categories and any(term in query_lower for term in ["health", "wellness", "medical", "sick"]):
-        relevant_categories = ["Health & Personal Care", "Medicine", "First Aid"]
-    
-    # Search purchase history for relevant products
-    if relevant_categories:
-        for session in purchase_history:
-            for product in session.get("purchase_history", []):
-                product_categories = [cat.lower() for cat in product.get("categories", [])]
-                if any(category.lower() in product_categories for category in relevant_categories):
-                    relevant_products.append(product)
-    
-    return relevant_products
+def get_relevant_purchased_products(user_query: str, purchase_index: PurchaseIndex) -> List[Tuple[Product, float]]:
+    """Find relevant previously purchased products based on symptoms or health queries, best first."""
+    return purchase_index.search(user_query, top_k=get_settings().purchase_context_top_k)
 
 # Process user input
 if user_query and st.session_state.agents_initialized:
@@ -426,29 +414,20 @@ if user_query and st.session_state.agents_initialized:
         personal_ai = st.session_state.personal_ai
         health_agent = st.session_state.health_agent
         
-        # Initialize chat between agents
+        # Initialize chat between agents, rendering the personal data retrieval into the app
+        personal_ai.events = EventBus([StreamlitSink(setup_page=False)])
         personal_ai.init_chat(guest_agent=health_agent)
         health_agent.init_chat(guest_agent=personal_ai)
         
         # Clear previous health chat
         st.session_state.health_chat = []
         
-        # Load purchase history data
-        purchase_history_file = os.path.join(os.path.dirname(__file__), "data", "personal_data", personal_ai.owner, "purchase_history_data.json")
-        purchase_history = []
-        if os.path.exists(purchase_history_file):
-            with open(purchase_history_file, 'r') as f:
-                purchase_data = json.load(f)
-                purchase_history = purchase_data.get("Data", [])
-        
-        # Check purchase history for relevant products
-        relevant_products = get_relevant_purchased_products(user_query, purchase_history)
+        # Check purchase history for relevant products, using the index built when the data was loaded
+        relevant_products = get_relevant_purchased_products(user_query, data_store.purchase_index(personal_ai.owner))
         
-        # Add relevant products to the health data context
+        # Add relevant products to the health data context, bounded in size
         if relevant_products:
-            product_context = "\nRelevant Previously Purchased Products:\n"
-            for product in relevant_products:
-                product_context += f"- {product['title']}\n"
+            product_context = format_purchase_context(relevant_products)
             specific_health_data = product_context + (specific_health_data if 'specific_health_data' in locals() else "")
         
         # Ensure health data is available in each query
@@ -459,27 +438,25 @@ if user_query and st.session_state.agents_initialized:
             # Add relevant health data based on query keywords
             if "glucose" in user_query.lower() or "sugar" in user_query.lower() or "diabetes" in user_query.lower():
                 try:
-                    latest_blood_test = health_data.get("bloodTests", [])[0]
-                    previous_blood_test = health_data.get("bloodTests", [])[1] if len(health_data.get("bloodTests", [])) > 1 else None
-                    
-                    latest_glucose = latest_blood_test.get("results", {}).get("glucose", {})
-                    previous_glucose = previous_blood_test.get("results", {}).get("glucose", {}) if previous_blood_test else None
+                    glucose = health_series.get("bloodTests.glucose")
+                    latest_glucose = glucose[-1] if len(glucose) else NO_READING
+                    previous_glucose = glucose[-2] if len(glucose) > 1 else None
                     
                     specific_health_data += f"""
                     IMPORTANT: Please use Nicholas's actual glucose data in your response:
                     
-                    Latest Glucose Reading (Date: {latest_blood_test.get('date')}):
-                    - Value: {latest_glucose.get('value')} {latest_glucose.get('unit')}
-                    - Normal Range: {latest_glucose.get('normalRange')}
-                    - Status: {latest_glucose.get('status')}
+                    Latest Glucose Reading (Date: {latest_glucose.date}):
+                    - Value: {latest_glucose.value} {latest_glucose.unit}
+                    - Normal Range: {latest_glucose.normal_range}
+                    - Status: {latest_glucose.status}
                     """
                     
                     if previous_glucose:
                         specific_health_data += f"""
-                        Previous Glucose Reading (Date: {previous_blood_test.get('date')}):
-                        - Value: {previous_glucose.get('value')} {previous_glucose.get('unit')}
-                        - Normal Range: {previous_glucose.get('normalRange')}
-                        - Status: {previous_glucose.get('status')}
+                        Previous Glucose Reading (Date: {previous_glucose.date}):
+                        - Value: {previous_glucose.value} {previous_glucose.unit}
+                        - Normal Range: {previous_glucose.normal_range}
+                        - Status: {previous_glucose.status}
                         """
                     
                     # Add family history of diabetes if available
@@ -495,37 +472,35 @@ if user_query and st.session_state.agents_initialized:
             # Add analogous sections for other health metrics (cholesterol, blood pressure, etc.)
             elif "cholesterol" in user_query.lower() or "lipid" in user_query.lower():
                 try:
-                    latest_blood_test = health_data.get("bloodTests", [])[0]
-                    
-                    cholesterol_total = latest_blood_test.get("results", {}).get("cholesterolTotal", {})
-                    cholesterol_hdl = latest_blood_test.get("results", {}).get("cholesterolHDL", {})
-                    cholesterol_ldl = latest_blood_test.get("results", {}).get("cholesterolLDL", {})
-                    triglycerides = latest_blood_test.get("results", {}).get("triglycerides", {})
+                    cholesterol_total = latest_reading("bloodTests.cholesterolTotal")
+                    cholesterol_hdl = latest_reading("bloodTests.cholesterolHDL")
+                    cholesterol_ldl = latest_reading("bloodTests.cholesterolLDL")
+                    triglycerides = latest_reading("bloodTests.triglycerides")
                     
                     specific_health_data += f"""
                     IMPORTANT: Please use Nicholas's actual cholesterol data in your response:
                     
-                    Latest Cholesterol Readings (Date: {latest_blood_test.get('date')}):
-                    - Total Cholesterol: {cholesterol_total.get('value')} {cholesterol_total.get('unit')} (Normal Range: {cholesterol_total.get('normalRange')}, Status: {cholesterol_total.get('status')})
-                    - HDL Cholesterol: {cholesterol_hdl.get('value')} {cholesterol_hdl.get('unit')} (Normal Range: {cholesterol_hdl.get('normalRange')}, Status: {cholesterol_hdl.get('status')})
-                    - LDL Cholesterol: {cholesterol_ldl.get('value')} {cholesterol_ldl.get('unit')} (Normal Range: {cholesterol_ldl.get('normalRange')}, Status: {cholesterol_ldl.get('status')})
-                    - Triglycerides: {triglycerides.get('value')} {triglycerides.get('unit')} (Normal Range: {triglycerides.get('normalRange')}, Status: {triglycerides.get('status')})
+                    Latest Cholesterol Readings (Date: {cholesterol_total.date}):
+                    - Total Cholesterol: {cholesterol_total.value} {cholesterol_total.unit} (Normal Range: {cholesterol_total.normal_range}, Status: {cholesterol_total.status})
+                    - HDL Cholesterol: {cholesterol_hdl.value} {cholesterol_hdl.unit} (Normal Range: {cholesterol_hdl.normal_range}, Status: {cholesterol_hdl.status})
+                    - LDL Cholesterol: {cholesterol_ldl.value} {cholesterol_ldl.unit} (Normal Range: {cholesterol_ldl.normal_range}, Status: {cholesterol_ldl.status})
+                    - Triglycerides: {triglycerides.value} {triglycerides.unit} (Normal Range: {triglycerides.normal_range}, Status: {triglycerides.status})
                     """
                 except Exception as e:
                     st.error(f"Error extracting cholesterol data: {str(e)}")
             
             elif "blood pressure" in user_query.lower() or "hypertension" in user_query.lower():
                 try:
-                    latest_vitals = health_data.get("vitals", [])[0]
-                    blood_pressure = latest_vitals.get("bloodPressure", {})
+                    systolic = latest_reading("vitals.bloodPressure.systolic")
+                    diastolic = latest_reading("vitals.bloodPressure.diastolic")
                     
                     specific_health_data += f"""
                     IMPORTANT: Please use Nicholas's actual blood pressure data in your response:
                     
-                    Latest Blood Pressure Reading (Date: {latest_vitals.get('date')}):
-                    - Systolic: {blood_pressure.get('systolic')} mmHg
-                    - Diastolic: {blood_pressure.get('diastolic')} mmHg
-                    - Status: {blood_pressure.get('status')}
+                    Latest Blood Pressure Reading (Date: {systolic.date}):
+                    - Systolic: {systolic.value} mmHg
+                    - Diastolic: {diastolic.value} mmHg
+                    - Status: {systolic.status}
                     
                     Medical Condition:
                     """
@@ -536,30 +511,29 @@ if user_query and st.session_state.agents_initialized:
                             specific_health_data += f"- {condition.get('name')} (Diagnosed: {condition.get('diagnosedDate')}, Status: {condition.get('status')})"
                             
                     # Add medications
-                    for medication in health_data.get("medicalHistory", {}).get("medications", []):
-                        if "hypertension" in medication.get("purpose", "").lower():
-                            specific_health_data += f"\n- Medication: {medication.get('name')} {medication.get('dosage')} {medication.get('frequency')}"
+                    for medication in data_store.medications(USER_NAME):
+                        if "hypertension" in (medication.purpose or "").lower():
+                            specific_health_data += f"\n- Medication: {medication.name} {medication.dosage} {medication.frequency}"
                 except Exception as e:
                     st.error(f"Error extracting blood pressure data: {str(e)}")
             
             elif "vitamin d" in user_query.lower():
                 try:
-                    latest_blood_test = health_data.get("bloodTests", [])[0]
-                    vitamin_d = latest_blood_test.get("results", {}).get("vitaminD", {})
+                    vitamin_d = latest_reading("bloodTests.vitaminD")
                     
                     specific_health_data += f"""
                     IMPORTANT: Please use Nicholas's actual Vitamin D data in your response:
                     
-                    Latest Vitamin D Reading (Date: {latest_blood_test.get('date')}):
-                    - Value: {vitamin_d.get('value')} {vitamin_d.get('unit')}
-                    - Normal Range: {vitamin_d.get('normalRange')}
-                    - Status: {vitamin_d.get('status')}
+                    Latest Vitamin D Reading (Date: {vitamin_d.date}):
+                    - Value: {vitamin_d.value} {vitamin_d.unit}
+                    - Normal Range: {vitamin_d.normal_range}
+                    - Status: {vitamin_d.status}
                     """
                     
                     # Add vitamin D supplement if available
-                    for medication in health_data.get("medicalHistory", {}).get("medications", []):
-                        if "vitamin d" in medication.get("name", "").lower():
-                            specific_health_data += f"\n- Supplement: {medication.get('name')} {medication.get('dosage')} {medication.get('frequency')} (Started: {medication.get('startDate')})"
+                    for medication in data_store.medications(USER_NAME):
+                        if "vitamin d" in medication.name.lower():
+                            specific_health_data += f"\n- Supplement: {medication.name} {medication.dosage} {medication.frequency} (Started: {medication.start_date})"
                 except Exception as e:
                     st.error(f"Error extracting Vitamin D data: {str(e)}")
             
@@ -614,8 +588,16 @@ if user_query and st.session_state.agents_initialized:
         round_count = 0
         
         while round_count < max_rounds:
-            # Get response from current receiver
-            response = current_receiver.on_message(current_message, sender=current_sender)
+            # Render the response from current receiver into the livestream, as it is generated in stream mode
+            with livestream_container:
+                st.write_stream(itertools.chain(
+                    [f"**{current_receiver.name}**: "],
+                    reply_generator(current_receiver, current_message, sender=current_sender)
+                ))
+                if settings.render_mode == "paced":
+                    # Add a small delay to simulate the conversation happening
+                    time.sleep(PACED_MESSAGE_PAUSE)
+            response = current_receiver.last_message
             
             # Save response to health chat history
             st.session_state.health_chat.append({
@@ -624,12 +606,6 @@ if user_query and st.session_state.agents_initialized:
                 "timestamp": str(response.timestamp)
             })
             
-            # Show the response in the livestream
-            with livestream_container:
-                st.markdown(f"**{response.sender}**: {response.content}")
-                # Add a small delay to simulate the conversation happening
-                time.sleep(0.5)
-            
             # Check if task is complete
             if current_receiver.task_complete or "[CONVERSATION_ENDS]" in response.content:
                 break
@@ -654,13 +630,13 @@ if user_query and st.session_state.agents_initialized:
         Make the response sound like you are Nicholas's helpful personal AI assistant.
         """
         
-        # Generate a response using the personal AI's LLM
-        summary_response = personal_ai.llm.generate(prompt=summary_prompt)
-        final_response = summary_response["content"]
-        
-        # Display the final response in chat
+        # Render the response from the personal AI's LLM into the chat, as it is generated in stream mode
         with st.chat_message("assistant"):
-            st.markdown(final_response)
+            if settings.render_mode == "stream":
+                final_response = st.write_stream(personal_ai.llm.stream_text(prompt=summary_prompt))
+            else:
+                final_response = personal_ai.llm.generate(prompt=summary_prompt)["content"]
+                st.write_stream(response_generator(final_response))
         
         # Save assistant response to chat history
         st.session_state.messages.append({"role": "assistant", "content": final_response})
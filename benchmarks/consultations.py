@@ -0,0 +1,183 @@
+"""
+End-to-end consultation benchmark on the offline replay LLM backend.
+
+This module runs a full Personal AI ↔ Health Agent consultation for each user in
+data/personal_data on the "replay:" LLM provider, so no network is needed. Requests with a
+recording in the cassette directory are answered from it. All other requests get a
+deterministic synthetic response, built from the users' recorded assistant replies. Every
+response is delayed by a synthetic latency distribution.
+
+The report covers turns/sec, LLM calls per turn, tokens per turn and p50/p95 turn latency.
+Because the LLM side is fixed, changes in these numbers are changes in our own overhead.
+"""
+import os
+import json
+import time
+import argparse
+from typing import Dict, List
+
+from agent_marketplace.agents.health_agent import HEALTH_PROFILE_LIST_FIELDS, HealthAgent
+from agent_marketplace.agents.personal_ai import PersonalAI
+from agent_marketplace.schemas.events import ChatEvent, MessageSent, TurnStarted
+from agent_marketplace.services.cache import hash_key
+from agent_marketplace.services.events import EventBus, EventSink
+from agent_marketplace.sessions import SessionEngine
+
+PERSONAL_DATA_DIR = os.path.join(os.path.dirname(__file__), "..", "data", "personal_data")
+
+
+def load_reply_pool() -> List[str]:
+    """Load every recorded assistant reply of every user, used as synthetic LLM responses."""
+    replies = []
+    for user_name in sorted(os.listdir(PERSONAL_DATA_DIR)):
+        data_file = os.path.join(PERSONAL_DATA_DIR, user_name, "user_ai_interaction_data.json")
+        if not os.path.exists(data_file):
+            continue
+        with open(data_file) as f:
+            interaction_data = json.load(f)
+        for session in interaction_data.get("Data", []):
+            for interaction in session.get("user_ai_interaction", []):
+                if interaction.get("role") == "assistant" and interaction.get("content"):
+                    replies.append(interaction["content"])
+    return replies
+
+
+REPLY_POOL = load_reply_pool()
+
+
+def synthetic_response(api_params: dict) -> dict:
+    """Deterministic stand-in for an LLM response, chosen by the kind of prompt."""
+    prompt = api_params["messages"][-1]["content"]
+    if api_params.get("response_format"):
+        return {"content": json.dumps({field: [] for field in HEALTH_PROFILE_LIST_FIELDS})}
+    if "Only reply with one of the states above" in prompt:
+        # Conversations end on the message budget (chat_max_history_messages)
+        return {"content": "[CONTINUE]"}
+    if "please only reply with [YES]" in prompt:
+        return {"content": "[YES]"}
+    return {"content": REPLY_POOL[int(hash_key(prompt)[:8], 16) % len(REPLY_POOL)]}
+
+
+class TurnTimer(EventSink):
+    """Measures each turn, from TurnStarted to the MessageSent of the same session."""
+    def __init__(self):
+        self.started: Dict[str, float] = {}
+        self.latencies: List[float] = []
+
+    def handle(self, event: ChatEvent) -> None:
+        if isinstance(event, TurnStarted):
+            self.started[event.session_id] = time.perf_counter()
+        elif isinstance(event, MessageSent) and event.session_id in self.started:
+            self.latencies.append(time.perf_counter() - self.started.pop(event.session_id))
+
+
+def percentile(values: List[float], q: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))] if values else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Consultation benchmark')
+    parser.add_argument('--user_intent', type=str, default="I want to improve my fitness and establish a healthier diet.",
+                       help='The health-related intent of every user')
+    parser.add_argument('--sessions_per_user', type=int, default=1,
+                       help='Number of consultations to run for each user')
+    parser.add_argument('--max_messages', type=int, default=12,
+                       help='Messages after which each agent ends the consultation')
+    parser.add_argument('--concurrency', type=int, default=8,
+                       help='Consultations run at the same time')
+    parser.add_argument('--latency', type=str, default="lognormal:0.8:0.5+0.005",
+                       help='Synthetic LLM latency, see LatencyModel')
+    parser.add_argument('--cassette_dir', type=str, default=os.path.join(os.path.dirname(__file__), "cassettes"),
+                       help='Directory of recorded LLM responses')
+    parser.add_argument('--response_cache', action='store_true',
+                       help='Enable the LLM response cache (disabled so every run makes the same calls)')
+    parser.add_argument('--json', action='store_true',
+                       help='Print the report as JSON')
+    args = parser.parse_args()
+
+    model_config = {
+        "model": "replay:gpt-4o",
+        "fast_model": "replay:gpt-4o-mini",
+        "cassette_dir": args.cassette_dir,
+        "latency": args.latency,
+        "response_cache": args.response_cache,
+        "preference_cache": False,
+        "summary_cache": False,
+        "chat_max_history_messages": args.max_messages,
+    }
+
+    health_agent = HealthAgent(
+        name="Vitality Health Coach",
+        owner="Health AI Inc.",
+        description="A health and fitness advisor that can create personalized workout plans, offer nutrition advice, and track fitness goals.",
+        user_intent=args.user_intent,
+        model_config=model_config,
+    )
+    user_names = sorted(name for name in os.listdir(PERSONAL_DATA_DIR) if os.path.isdir(os.path.join(PERSONAL_DATA_DIR, name)))
+    personal_ais = [
+        PersonalAI(
+            name=f"{user_name}'s Personal AI",
+            owner=user_name,
+            description="A personal AI agent that can help with tasks and provide information",
+            user_intent=args.user_intent,
+            model_config=model_config,
+        )
+        for user_name in user_names
+    ]
+
+    # Agents share providers, so this reaches every provider in use
+    routers = [health_agent.llm] + [personal_ai.llm for personal_ai in personal_ais]
+    providers = {id(provider): provider for router in routers for provider in router.providers.values()}.values()
+    for provider in providers:
+        provider.fallback = synthetic_response
+
+    timer = TurnTimer()
+    engine = SessionEngine(max_concurrent_sessions=args.concurrency, events=EventBus([timer]))
+    start = time.perf_counter()
+    sessions = engine.run_sessions(
+        (personal_ai, health_agent) for personal_ai in personal_ais for _ in range(args.sessions_per_user)
+    )
+    elapsed = time.perf_counter() - start
+    engine.shutdown()
+
+    failed = [session for session in sessions if session.status == "failed"]
+    for session in failed:
+        print(f"Session for {session.agent_1.owner} failed: {session.error}")
+
+    calls = prompt_tokens = completion_tokens = 0
+    for router in routers:
+        for metrics in router.stats().values():
+            calls += metrics["calls"]
+            prompt_tokens += metrics["prompt_tokens"]
+            completion_tokens += metrics["completion_tokens"]
+    turns = len(timer.latencies)
+    report = {
+        "sessions": len(sessions),
+        "failed_sessions": len(failed),
+        "turns": turns,
+        "elapsed_s": elapsed,
+        "turns_per_s": turns / elapsed if elapsed else 0.0,
+        "llm_calls_per_turn": calls / turns if turns else 0.0,
+        "prompt_tokens_per_turn": prompt_tokens / turns if turns else 0.0,
+        "completion_tokens_per_turn": completion_tokens / turns if turns else 0.0,
+        "turn_latency_p50_s": percentile(timer.latencies, 0.5),
+        "turn_latency_p95_s": percentile(timer.latencies, 0.95),
+        "replay": {key: sum(provider.stats()[key] for provider in providers) for key in ("replayed", "recorded", "fallback")},
+    }
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+        return
+    print(f"{len(sessions)} consultations ({len(failed)} failed), {turns} turns in {elapsed:.2f}s, latency {args.latency}\n")
+    print(f"{'turns/sec':<28}{report['turns_per_s']:>10.2f}")
+    print(f"{'LLM calls/turn':<28}{report['llm_calls_per_turn']:>10.2f}")
+    print(f"{'prompt tokens/turn':<28}{report['prompt_tokens_per_turn']:>10.0f}")
+    print(f"{'completion tokens/turn':<28}{report['completion_tokens_per_turn']:>10.0f}")
+    print(f"{'turn latency p50 (s)':<28}{report['turn_latency_p50_s']:>10.3f}")
+    print(f"{'turn latency p95 (s)':<28}{report['turn_latency_p95_s']:>10.3f}")
+    print(f"{'replayed/recorded/synthetic':<28}{'/'.join(str(value) for value in report['replay'].values()):>10}")
+
+
+if __name__ == "__main__":
+    main()
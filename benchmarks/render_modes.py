@@ -0,0 +1,134 @@
+"""
+End-to-end benchmark of the reply render modes.
+
+This module runs the live consultation of app.py (the Personal AI asks the Health Agent a health
+query, the agents exchange up to --max_rounds messages, then the Personal AI summarizes the
+consultation for the user) in each render mode ("instant", "paced", "stream") on the offline
+replay LLM backend, with the same synthetic responses and latencies as benchmarks/consultations.py.
+
+For every mode it reports the time of the whole consultation, including the pause app.py adds
+between messages in paced mode, and how long each message takes until its first text is shown.
+"""
+import os
+import time
+import argparse
+from datetime import datetime
+
+from agent_marketplace.agents.health_agent import HealthAgent
+from agent_marketplace.agents.personal_ai import PersonalAI
+from agent_marketplace.config import PACED_MESSAGE_PAUSE, reply_generator, response_generator
+from agent_marketplace.schemas.agents import Message
+
+from consultations import synthetic_response
+
+RENDER_MODES = ["instant", "paced", "stream"]
+
+
+def create_agents(user_name: str, model_config: dict) -> tuple:
+    """Create the Personal AI and Health Agent of app.py, answered by the synthetic responses"""
+    personal_ai = PersonalAI(
+        name="Personal AI",
+        owner=user_name,
+        description="A personal AI agent that can help with tasks and provide information",
+        user_intent=f"Help {user_name} understand their health data and provide recommendations.",
+        model_config=model_config,
+    )
+    health_agent = HealthAgent(
+        name="Health Specialist",
+        owner="Health Services",
+        description="A specialized health assistant that can analyze health data and provide personalized recommendations.",
+        user_intent=f"Analyze {user_name}'s health data and provide actionable insights and recommendations.",
+        model_config=model_config,
+    )
+    for agent in (personal_ai, health_agent):
+        for provider in agent.llm.providers.values():
+            provider.fallback = synthetic_response
+    return personal_ai, health_agent
+
+
+def render(chunks) -> tuple:
+    """Drain rendered chunks the way st.write_stream does; return (text, seconds until the first text)"""
+    start = time.perf_counter()
+    first_text = None
+    text = ""
+    for chunk in chunks:
+        if chunk and first_text is None:
+            first_text = time.perf_counter() - start
+        text += chunk
+    return text, first_text if first_text is not None else time.perf_counter() - start
+
+
+def run_consultation(personal_ai: PersonalAI, health_agent: HealthAgent, user_query: str, max_rounds: int,
+                     render_mode: str) -> tuple:
+    """Run app.py's consultation for one query; return (elapsed seconds, seconds to first text of each message)"""
+    start = time.perf_counter()
+    personal_ai.init_chat(guest_agent=health_agent)
+    health_agent.init_chat(guest_agent=personal_ai)
+    current_message = Message(role="user", content=f"I need help with the following health query from my owner: {user_query}",
+                              sender=personal_ai.name, receiver=health_agent.name, timestamp=datetime.now())
+    current_sender, current_receiver = personal_ai, health_agent
+    transcript = [f"{current_message.sender}: {current_message.content}"]
+    first_text = []
+
+    for _ in range(max_rounds):
+        _, seconds = render(reply_generator(current_receiver, current_message, current_sender, render_mode=render_mode))
+        first_text.append(seconds)
+        if render_mode == "paced":
+            time.sleep(PACED_MESSAGE_PAUSE)
+        response = current_receiver.last_message
+        transcript.append(f"{response.sender}: {response.content}")
+        if current_receiver.task_complete or "[CONVERSATION_ENDS]" in response.content:
+            break
+        current_message = response
+        current_sender, current_receiver = current_receiver, current_sender
+
+    # The Personal AI's summary for the user
+    summary_prompt = f"Summarize this consultation to answer the query \"{user_query}\":\n\n" + "\n".join(transcript)
+    if render_mode == "stream":
+        _, seconds = render(personal_ai.llm.stream_text(prompt=summary_prompt))
+    else:
+        _, seconds = render(generated_summary(personal_ai, summary_prompt, render_mode))
+    first_text.append(seconds)
+    return time.perf_counter() - start, first_text
+
+
+def generated_summary(personal_ai: PersonalAI, prompt: str, render_mode: str):
+    """Generate the whole summary, then render it, as app.py does outside of stream mode"""
+    yield from response_generator(personal_ai.llm.generate(prompt=prompt)["content"], render_mode)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render mode benchmark')
+    parser.add_argument('--user_name', type=str, default="Nicholas Richmond",
+                       help='The user whose Personal AI runs the consultation')
+    parser.add_argument('--user_query', type=str, default="How can I bring my glucose and cholesterol down?",
+                       help='The health query of the consultation')
+    parser.add_argument('--max_rounds', type=int, default=5,
+                       help='Messages exchanged between the agents, as in app.py')
+    parser.add_argument('--latency', type=str, default="lognormal:0.8:0.5+0.005",
+                       help='Synthetic LLM latency, see LatencyModel')
+    parser.add_argument('--cassette_dir', type=str, default=os.path.join(os.path.dirname(__file__), "cassettes"),
+                       help='Directory of recorded LLM responses')
+    args = parser.parse_args()
+
+    model_config = {
+        "model": "replay:gpt-4o",
+        "fast_model": "replay:gpt-4o-mini",
+        "cassette_dir": args.cassette_dir,
+        "latency": args.latency,
+        "response_cache": False,
+        "preference_cache": False,
+        "summary_cache": False,
+    }
+    print(f"Consultation of {args.user_name}'s Personal AI, latency {args.latency}\n")
+    print(f"{'render mode':<12}{'consultation (s)':>18}{'messages':>10}{'first text p50 (ms)':>21}{'first text max (ms)':>21}")
+    for render_mode in RENDER_MODES:
+        personal_ai, health_agent = create_agents(args.user_name, model_config)
+        elapsed, first_text = run_consultation(personal_ai, health_agent, args.user_query, args.max_rounds, render_mode)
+        first_text_ms = sorted(seconds * 1000 for seconds in first_text)
+        print(f"{render_mode:<12}{elapsed:>18.2f}{len(first_text):>10}"
+              f"{first_text_ms[len(first_text_ms) // 2]:>21.0f}{first_text_ms[-1]:>21.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Demo for running many health consultations concurrently.
+
+This module runs a headless chat between each user's Personal AI agent and one shared Health AI
+agent definition, for every user in data/personal_data, on the marketplace's session engine.
+"""
+import argparse
+import os
+
+from agent_marketplace.marketplace import AgentMarketplace
+from agent_marketplace.services.events import BackgroundSink, EventBus, JSONLSink
+from agent_marketplace.agents.personal_ai import PersonalAI
+from agent_marketplace.agents.health_agent import HealthAgent
+
+
+def main():
+    # Add argument parser
+    parser = argparse.ArgumentParser(description='Concurrent Health Agent Demo')
+    parser.add_argument('--user_intent', type=str, default="I want to improve my fitness and establish a healthier diet.",
+                       help='The health-related intent/task that every user wants to accomplish')
+    parser.add_argument('--sessions_per_user', type=int, default=1,
+                       help='Number of consultations to run for each user')
+    parser.add_argument('--events_file', type=str, default=None,
+                       help='Write the events of every session to this JSONL file')
+    args = parser.parse_args()
+
+    personal_data_dir = os.path.join(os.path.dirname(__file__), "..", "data", "personal_data")
+    user_names = sorted(name for name in os.listdir(personal_data_dir)
+                        if os.path.isdir(os.path.join(personal_data_dir, name)))
+
+    # 1. Initialize the agent marketplace with one health agent definition shared by all sessions
+    # Events are written from a background thread so the sessions don't wait on the file
+    events = EventBus([BackgroundSink(JSONLSink(args.events_file))] if args.events_file else [])
+    agent_marketplace = AgentMarketplace(events=events)
+    health_agent = HealthAgent(
+        name="Vitality Health Coach",
+        owner="Health AI Inc.",
+        description="A health and fitness advisor that can create personalized workout plans, offer nutrition advice, and track fitness goals.",
+        user_intent=args.user_intent,
+        model_config={
+            "model": "openai:gpt-4o-mini",
+        }
+    )
+    agent_marketplace.add_agent(health_agent)
+
+    # 2. Initialize a personal AI agent for each user
+    for user_name in user_names:
+        agent_marketplace.add_agent(PersonalAI(
+            name=f"{user_name}'s Personal AI",
+            owner=user_name,
+            description="A personal AI agent that can help with tasks and provide information",
+            user_intent=args.user_intent,
+            model_config={
+                "model": "openai:gpt-4o-mini",
+            }
+        ))
+
+    # 3. Run all consultations concurrently
+    pairs = [(f"{user_name}'s Personal AI", health_agent.name)
+             for user_name in user_names for _ in range(args.sessions_per_user)]
+    sessions = agent_marketplace.run_sessions(pairs)
+
+    # 4. Report the outcome of each session
+    for session in sessions:
+        print(f"{session.agent_1.owner:<20} {session.status:<10} {len(session.messages):>3} messages "
+              f"{session.duration:>7.1f}s" + (f"  error: {session.error}" if session.error else ""))
+    print(agent_marketplace.session_engine.stats())
+    events.close()
+
+
+if __name__ == "__main__":
+    main()